@@ -1,70 +1,195 @@
 """Agent loop with tool calling for Studia."""
 
+import asyncio
 import json
-import requests
+import logging
+import threading
+import time
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_TIMEOUT, MAX_AGENT_TURNS
-from core.llm import strip_think_tags
+from config import MAX_AGENT_TURNS, RESEARCH_TOOL_TIMEOUT, TOOL_TIMEOUT
+from core import metrics, ollama
+from core.llm import ThinkFilter, record_think_stats, strip_think_tags
 from services import tools
 
+logger = logging.getLogger(__name__)
+# Per-tool timeouts (seconds); others use TOOL_TIMEOUT
+TOOL_TIMEOUTS = {"research_company": RESEARCH_TOOL_TIMEOUT}
+# Sent when every turn came back empty (no tool calls, no visible content)
+EMPTY_REPLY = "I couldn't come up with a reply. Please try again or rephrase your message."
 
-def _call_ollama(messages: list[dict], stream: bool = False, setup_mode: bool = False) -> requests.Response:
-    """Call Ollama /api/chat with tools. setup_mode: include create_profile tool."""
-    url = f"{OLLAMA_BASE_URL}/api/chat"
-    tool_list = tools.TOOLS_SETUP if setup_mode else tools.TOOLS
-    payload = {
-        "model": OLLAMA_MODEL,
-        "messages": messages,
-        "stream": stream,
-        "tools": tool_list,
-    }
-    return requests.post(url, json=payload, stream=stream, timeout=OLLAMA_TIMEOUT)
 
+def tool_list(setup_mode: bool = False) -> list[dict]:
+    """Tool schemas sent with each turn. setup_mode: include create_profile tool."""
+    return tools.TOOLS_SETUP if setup_mode else tools.TOOLS
 
-def agent_stream(messages: list[dict], session_id: str, setup_mode: bool = False):
-    """Run agent loop with tool calls. Yields (token, done, tool_call_info). setup_mode: use tools that include create_profile."""
+
+def _stream_ollama(messages: list[dict], setup_mode: bool = False, affinity: str | None = None):
+    """Async streaming Ollama /api/chat with tools. setup_mode: include create_profile tool."""
+    return ollama.astream_chat(messages, tools=tool_list(setup_mode), affinity=affinity)
+
+
+def _parse_tool_call(tc: dict) -> tuple[str, dict]:
+    """(name, args) from an Ollama tool call; string arguments are JSON-decoded."""
+    fn = tc.get("function") or {}
+    name = fn.get("name", "")
+    raw_args = fn.get("arguments")
+    if isinstance(raw_args, str):
+        try:
+            args = json.loads(raw_args) if raw_args else {}
+        except json.JSONDecodeError:
+            args = {}
+    else:
+        args = raw_args or {}
+    return name, args
+
+
+class _ToolSession:
+    """One tool call's view of the request's ChatSession; reads pass through.
+
+    Once the call has timed out, expire() turns further set()/ensure() calls into logged no-ops, so a
+    tool still running in its thread cannot change the session after the request has flushed it.
+    """
+
+    def __init__(self, sess, name: str):
+        self._sess = sess
+        self._name = name
+        self._lock = threading.Lock()
+        self.expired = False
+
+    def __getattr__(self, attr):
+        return getattr(self._sess, attr)
+
+    def expire(self) -> None:
+        with self._lock:
+            self.expired = True
+
+    def set(self, **fields) -> None:
+        with self._lock:
+            if self.expired:
+                metrics.incr(f"tools.{self._name}.late_writes")
+                logger.warning("Dropped session update from timed-out tool %s: %s", self._name, sorted(fields))
+                return
+            self._sess.set(**fields)
+
+    def ensure(self, profile_id: str, target_role: str | None = None) -> None:
+        self.set(profile_id=profile_id, target_role=target_role or self._sess.target_role)
+
+
+async def _run_tool(name: str, args: dict, sess) -> tuple[str, bool]:
+    """Execute one tool in a worker thread with its timeout. Returns (result, ok).
+
+    A timed-out tool keeps running in its thread (threads cannot be cancelled); its result is dropped
+    and so are any session changes it makes afterwards.
+    """
+    timeout = TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT)
+    view = _ToolSession(sess, name)
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(tools.execute_tool, name, args, view), timeout), True
+    except asyncio.TimeoutError:
+        view.expire()
+        metrics.incr(f"tools.{name}.timeouts")
+        return json.dumps({"error": f"{name} timed out after {timeout:g}s"}), False
+
+
+async def _run_tools(calls: list[tuple[str, dict]], indexes: list[int], results: list, sess):
+    """Run calls[i] for i in indexes concurrently, storing results by index.
+
+    Yields tool-info events: one "started" per call up front, then "finished" as each completes.
+    """
+    for i in indexes:
+        name, args = calls[i]
+        yield (None, False, {"tool": name, "args": args, "status": "started", "index": i})
+
+    async def run(i: int):
+        name, args = calls[i]
+        start = time.monotonic()
+        result, ok = await _run_tool(name, args, sess)
+        elapsed = time.monotonic() - start
+        metrics.observe(f"tools.{name}.latency", elapsed)
+        return i, result, ok, elapsed
+
+    for fut in asyncio.as_completed([run(i) for i in indexes]):
+        i, result, ok, elapsed = await fut
+        results[i] = result
+        name, args = calls[i]
+        yield (None, False, {
+            "tool": name,
+            "args": args,
+            "status": "finished",
+            "index": i,
+            "ok": ok,
+            "duration_ms": int(elapsed * 1000),
+        })
+
+
+async def agent_stream(messages: list[dict], sess, setup_mode: bool = False):
+    """Run agent loop with tool calls against the request's ChatSession. Yields (token, done, tool_call_info). setup_mode: use tools that include create_profile.
+
+    Every turn is streamed: content tokens are forwarded as they arrive, and tool calls are collected
+    from the streamed deltas. A turn that ends without tool calls is the final answer; one with no
+    visible content either is retried, and if no turn produces a reply EMPTY_REPLY is sent. Tools are
+    blocking (DB, web, Ollama) and run in worker threads; independent calls from one turn run
+    concurrently and their results go back to the model in the original order.
+    """
     turn = 0
     current_messages = list(messages)
+    replied = False
 
     while turn < MAX_AGENT_TURNS:
         turn += 1
-        r = _call_ollama(current_messages, stream=False, setup_mode=setup_mode)
-        r.raise_for_status()
-        data = r.json()
-        msg = data.get("message", {})
-
-        tool_calls = msg.get("tool_calls") or []
-        content = strip_think_tags(msg.get("content") or "")
-
-        if tool_calls:
-            current_messages.append({"role": "assistant", "tool_calls": tool_calls})
-            for tc in tool_calls:
-                fn = tc.get("function") or {}
-                name = fn.get("name", "")
-                raw_args = fn.get("arguments")
-                if isinstance(raw_args, str):
-                    try:
-                        args = json.loads(raw_args) if raw_args else {}
-                    except json.JSONDecodeError:
-                        args = {}
-                else:
-                    args = raw_args or {}
-
-                yield (None, False, {"tool": name, "args": args})
-
-                result = tools.execute_tool(name, args, session_id)
-                current_messages.append({
-                    "role": "tool",
-                    "tool_name": name,
-                    "content": result,
-                })
-            continue
-
-        if content:
-            for i in range(0, len(content), 64):
-                chunk = content[i : i + 64]
-                yield (chunk, False, None)
+        tool_calls = []
+        raw_parts = []
+        visible = False
+        think = ThinkFilter()
+        try:
+            async with _stream_ollama(current_messages, setup_mode=setup_mode, affinity=sess.id) as chunks:
+                async for obj in chunks:
+                    msg = obj.get("message") or {}
+                    if msg.get("thinking"):
+                        think.think_tokens += 1
+                    tool_calls.extend(msg.get("tool_calls") or [])
+                    content = msg.get("content") or ""
+                    raw_parts.append(content)
+                    token = think.feed(content)
+                    if token:
+                        visible = visible or bool(token.strip())
+                        yield (token, False, None)
+                    if obj.get("done"):
+                        break
+            tail = think.flush()
+            if tail:
+                visible = visible or bool(tail.strip())
+                yield (tail, False, None)
+        finally:
+            record_think_stats(think)
+        replied = replied or visible
+
+        if not tool_calls:
+            if not visible:
+                metrics.incr("agent.empty_turns")
+                continue
             yield ("", True, None)
             return
 
+        current_messages.append({"role": "assistant", "content": strip_think_tags("".join(raw_parts)), "tool_calls": tool_calls})
+        calls = [_parse_tool_call(tc) for tc in tool_calls]
+        results: list[str | None] = [None] * len(calls)
+        # create_profile changes the session's profile, which the other tools read: run it first
+        first = [i for i, (name, _) in enumerate(calls) if name == "create_profile"]
+        rest = [i for i in range(len(calls)) if i not in first]
+        for i in first:
+            async for event in _run_tools(calls, [i], results, sess):
+                yield event
+        if rest:
+            async for event in _run_tools(calls, rest, results, sess):
+                yield event
+        for (name, _), result in zip(calls, results):
+            current_messages.append({
+                "role": "tool",
+                "tool_name": name,
+                "content": result,
+            })
+
+    if not replied:
+        yield (EMPTY_REPLY, False, None)
     yield ("", True, None)
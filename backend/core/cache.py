@@ -0,0 +1,110 @@
+"""Content-addressed result cache: an in-process LRU in front of the cache_entries table.
+
+Keys are hashes of everything that determines a result (model, prompt template version, inputs), so
+entries never need invalidating; they expire after ttl and the table is kept under max_bytes per
+namespace by evicting the least recently used rows. A memory hit costs a dict lookup, a DB hit one
+indexed UPDATE ... RETURNING.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from config import LLM_CACHE_DAYS, LLM_CACHE_MAX_MB
+from core import metrics
+from db import cache_get, cache_put
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(*parts) -> str:
+    """sha256 over the JSON encoding of parts (dict keys sorted)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Persistent JSON-value cache for one namespace. Cache errors are logged and treated as misses.
+
+    memory_ttl bounds how long the in-process copy is trusted (defaults to ttl); set it lower for keys
+    that are not content-addressed and may be rewritten by another worker.
+    """
+
+    def __init__(
+        self, namespace: str, ttl: float, max_bytes: int, memory_entries: int = 256, memory_ttl: float | None = None
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_ttl = ttl if memory_ttl is None else min(memory_ttl, ttl)
+        self._memory_entries = memory_entries
+        # key -> (read_at, created_at, value), both as epoch seconds
+        self._memory: "OrderedDict[str, tuple[float, float, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, created: float, value) -> None:
+        with self._lock:
+            self._memory[key] = (time.time(), created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_entry(self, key: str) -> tuple[object, float] | None:
+        """(value, age in seconds) for key, or None if missing or older than ttl."""
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and now - hit[0] < self.memory_ttl and now - hit[1] < self.ttl:
+                self._memory.move_to_end(key)
+                metrics.incr(f"cache.{self.namespace}.hits")
+                return hit[2], now - hit[1]
+        try:
+            row = cache_get(self.namespace, key, self.ttl)
+        except Exception as e:
+            logger.warning("Cache read failed (%s): %s", self.namespace, e)
+            row = None
+        if row is None:
+            metrics.incr(f"cache.{self.namespace}.misses")
+            return None
+        value, created_at = row
+        created = created_at.timestamp()
+        self._remember(key, created, value)
+        metrics.incr(f"cache.{self.namespace}.hits")
+        return value, max(0.0, now - created)
+
+    def get(self, key: str):
+        """Cached value for key, or None."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, value, created_at: datetime | None = None) -> bool:
+        """Store value (created_at: when it was produced, default now). Returns False if the DB write failed."""
+        self._remember(key, created_at.timestamp() if created_at else time.time(), value)
+        try:
+            evicted = cache_put(self.namespace, key, value, self.ttl, self.max_bytes, created_at)
+        except Exception as e:
+            logger.warning("Cache write failed (%s): %s", self.namespace, e)
+            return False
+        if evicted:
+            metrics.incr(f"cache.{self.namespace}.evictions", evicted)
+        return True
+
+    def get_or_compute(self, key: str, compute, refresh: bool = False):
+        """Cached value for key, or compute() stored under key. refresh=True skips the lookup."""
+        if not refresh:
+            value = self.get(key)
+            if value is not None:
+                return value
+        else:
+            metrics.incr(f"cache.{self.namespace}.refreshes")
+        value = compute()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+
+LLM_CACHE = ResultCache("llm", ttl=LLM_CACHE_DAYS * 86400, max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024)
@@ -1,4 +1,4 @@
-"""System prompt assembly from profile, research, and session context. Profile loaded from DB by profile_id."""
+"""System prompt assembly: a stable prefix (identity + profile, loaded from DB by profile_id) and volatile session context."""
 
 from db import get_profile, list_profiles, profile_exists as _db_profile_exists
 
@@ -47,6 +47,7 @@ Tools — use silently when appropriate, never announce them:
 - get_progress: when they ask what to study next or about weak/strong topics.
 - lookup_curriculum: when they ask what topics exist or what they can learn.
 - update_topic_score: after discussing a topic where you can gauge their understanding (strong/partial/weak).
+- update_topic_scores: same, for several topics at once.
 
 Profile note: their profile was built from uploaded resumes and LinkedIn data during onboarding. You have it and use it every session. If asked, tell them you already have their profile and they can re-upload from the onboarding screen to refresh it.
 
@@ -55,28 +56,32 @@ Identity: The only person you know is described in the profile below. Do not ref
 Vary your responses. Do not use a fixed script for greetings (e.g. "hi") or short messages; respond naturally and keep tone consistent but wording different when appropriate."""
 
 
-def build_system_prompt(
-    profile_id: str,
-    research_context: str | None = None,
-    company: str | None = None,
-    target_role: str | None = None,
-) -> str:
-    """Build full system prompt from profile (by id) and optional research context and target role."""
+def build_system_prompt(profile_id: str) -> str:
+    """Stable system prompt: CORE_IDENTITY then the profile (by id).
+
+    Kept byte-identical across turns so Ollama can reuse the evaluated prefix; per-session details
+    go in build_session_context, which is placed at the end of the prompt.
+    """
     profile = get_profile(profile_id)
     if not profile:
         raise ValueError(f"Profile not found: {profile_id}")
     profile_data = profile.get("data") or {}
     profile_text = _profile_to_text(profile_data)
+    return f"{CORE_IDENTITY}\n\nHere is who you are talking to:\n{profile_text}"
 
-    prompt = f"{CORE_IDENTITY}\n\nHere is who you are talking to:\n{profile_text}"
 
+def build_session_context(
+    target_role: str | None = None,
+    research_context: str | None = None,
+    company: str | None = None,
+) -> str:
+    """Volatile per-session instructions (target role, company research). Empty when none are set."""
+    parts = []
     if target_role:
-        prompt += f"\n\nFocus this session on preparing for the role: {target_role}."
-
+        parts.append(f"Focus this session on preparing for the role: {target_role}.")
     if research_context and company:
-        prompt += f"\n\nThe user is currently targeting {company}. Here is what is known about their interview process: {research_context} Tailor the conversation to prepare them specifically for this company's style and known question patterns."
-
-    return prompt
+        parts.append(f"The user is currently targeting {company}. Here is what is known about their interview process: {research_context} Tailor the conversation to prepare them specifically for this company's style and known question patterns.")
+    return "\n\n".join(parts)
 
 
 SETUP_IDENTITY = """You are helping the user set up their interview prep profile. Your job is to get them ready so they can start practicing.
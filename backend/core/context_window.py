@@ -0,0 +1,146 @@
+"""Token-budget context assembly for LLM calls.
+
+Fits the system prompt, rolling summary and as many recent turns as possible into CONTEXT_TOKEN_BUDGET
+(minus a reserve for the reply and the tool schemas sent alongside). The budget is also the num_ctx of
+every Ollama call, so prompts are truncated to it, never the window grown. Bulky attachments inlined by /chat are truncated before any turn is
+dropped. Token counts come from a pluggable estimator (set_tokenizer) and are cached per text hash.
+
+Layout is ordered by stability so Ollama can reuse the evaluated prompt prefix across turns:
+[stable system prompt, summary, ...older turns, session context, latest turn]. The session context
+(target role, research) sits just before the latest turn, so changing it never invalidates history.
+"""
+
+import json
+import math
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from config import ATTACHMENT_TOKEN_LIMIT, CONTEXT_TOKEN_BUDGET, RESPONSE_TOKEN_RESERVE
+
+ATTACHMENT_MARKER = "[Attached documents]"
+# Older turns keep only a stub of their attachments
+OLD_ATTACHMENT_TOKEN_LIMIT = 200
+# Per-message framing overhead (role markers, separators) in chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+# Framing chat templates wrap around the tool schemas
+TOOLS_OVERHEAD_TOKENS = 64
+# Rough average for English prose and code with BPE tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Default estimator: ~4 characters per token."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+_tokenizer: Callable[[str], int] = estimate_tokens
+# (hash, length) of a text -> its token count; keyed so cached entries do not keep whole texts alive
+_TOKEN_CACHE_SIZE = 4096
+_token_counts: "OrderedDict[tuple[int, int], int]" = OrderedDict()
+_token_lock = threading.Lock()
+
+
+def set_tokenizer(fn: Callable[[str], int]) -> None:
+    """Replace the token estimator (e.g. a real tokenizer for the configured model)."""
+    global _tokenizer
+    with _token_lock:
+        _tokenizer = fn
+        _token_counts.clear()
+
+
+def count_tokens(text: str) -> int:
+    """Token count for text, cached so each message is only measured once per process."""
+    if not text:
+        return 0
+    key = (hash(text), len(text))
+    with _token_lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            return count
+    count = _tokenizer(text)
+    with _token_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > _TOKEN_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def tools_tokens(tools: list[dict] | None) -> int:
+    """Prompt tokens taken by tool schemas sent with a chat request."""
+    return count_tokens(json.dumps(tools)) + TOOLS_OVERHEAD_TOKENS if tools else 0
+
+
+def prompt_budget(overhead: int = 0) -> int:
+    """Tokens left for prompt text: CONTEXT_TOKEN_BUDGET minus the reply reserve and overhead (e.g. tools_tokens)."""
+    return CONTEXT_TOKEN_BUDGET - RESPONSE_TOKEN_RESERVE - overhead
+
+
+def truncate_to_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    """Cut text to roughly max_tokens, keeping the start (or the end) and noting how much was dropped."""
+    total = count_tokens(text)
+    if total <= max_tokens:
+        return text
+    keep_chars = max(0, int(len(text) * max_tokens / total))
+    note = f"[... truncated {total - max_tokens} tokens]"
+    if keep_end:
+        return note + "\n" + text[len(text) - keep_chars:].lstrip()
+    return text[:keep_chars].rstrip() + "\n" + note
+
+
+def shrink_attachments(content: str, max_tokens: int) -> str:
+    """Truncate the inlined [Attached documents] section of a message to max_tokens; the user's own text is kept."""
+    idx = content.find(ATTACHMENT_MARKER)
+    if idx == -1:
+        return content
+    head = content[: idx + len(ATTACHMENT_MARKER)]
+    return head + truncate_to_tokens(content[idx + len(ATTACHMENT_MARKER):], max_tokens)
+
+
+def fit_messages(
+    system_prompt: str,
+    history: list[dict],
+    summary: str | None = None,
+    budget: int | None = None,
+    session_context: str | None = None,
+    overhead: int = 0,
+) -> list[dict]:
+    """Assemble [system, summary?, ...recent history, session_context?, latest] within budget tokens.
+
+    budget defaults to prompt_budget(overhead); pass tools_tokens(tools) as overhead when the messages
+    go out with tools. The latest message is always included (its attachments cut to
+    ATTACHMENT_TOKEN_LIMIT); older attachments are cut to a stub first, then the oldest turns are
+    dropped until the rest fits.
+    """
+    if budget is None:
+        budget = prompt_budget(overhead)
+    head = [{"role": "system", "content": system_prompt}]
+    if summary:
+        head.append({"role": "system", "content": f"[Previous conversation summary]: {summary}"})
+    tail = [{"role": "system", "content": session_context}] if session_context else []
+    remaining = budget - sum(message_tokens(m) for m in head + tail)
+
+    turns = [{"role": h["role"], "content": h["content"]} for h in history]
+    for i, m in enumerate(turns):
+        if ATTACHMENT_MARKER in m["content"]:
+            limit = ATTACHMENT_TOKEN_LIMIT if i == len(turns) - 1 else OLD_ATTACHMENT_TOKEN_LIMIT
+            m["content"] = shrink_attachments(m["content"], limit)
+
+    selected: list[dict] = []
+    for m in reversed(turns):
+        cost = message_tokens(m)
+        if selected and cost > remaining:
+            break
+        if not selected and cost > remaining:
+            # The current turn alone is over budget: cut it rather than send nothing
+            m = {**m, "content": truncate_to_tokens(m["content"], max(remaining - MESSAGE_OVERHEAD_TOKENS, 1))}
+            cost = message_tokens(m)
+        selected.append(m)
+        remaining -= cost
+    selected.reverse()
+    return head + selected[:-1] + tail + selected[-1:]
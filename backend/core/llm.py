@@ -1,11 +1,11 @@
 """Ollama streaming interface with think-tag stripping."""
 
-import json
 import logging
 import re
-import requests
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL, OLLAMA_TIMEOUT
+from core import metrics, ollama
+from core.context_window import message_tokens, prompt_budget, truncate_to_tokens
+from core.scheduler import BACKGROUND
 
 logger = logging.getLogger(__name__)
 
@@ -21,53 +21,108 @@ def strip_think_tags(text: str) -> str:
     return out.strip()
 
 
-def stream_completion(messages: list[dict]):
-    """Stream LLM tokens from Ollama. Yields (token, done, topic_detected)."""
-    url = f"{OLLAMA_BASE_URL}/api/chat"
-    payload = {"model": OLLAMA_MODEL, "messages": messages, "stream": True}
-
-    raw_buffer = ""
-    emitted_len = 0
-
-    with requests.post(url, json=payload, stream=True, timeout=OLLAMA_TIMEOUT) as r:
-        r.raise_for_status()
-        for line in r.iter_lines(decode_unicode=True):
-            if not line or not line.strip():
-                continue
-            if not line.startswith("data: "):
-                continue
-            data = line[6:]
-            if data == "[DONE]":
-                yield ("", True, None)
-                return
-            try:
-                obj = json.loads(data)
-            except json.JSONDecodeError:
-                continue
-            msg = obj.get("message", {})
-            content = msg.get("content", "") or ""
-            raw_buffer += content
-            # Only run regex when think blocks might be present (avoids O(n²) for models without think)
-            if "<think>" in raw_buffer or obj.get("done"):
-                cleaned = strip_think_tags(raw_buffer)
-            else:
-                cleaned = raw_buffer
-            if len(cleaned) > emitted_len:
-                yield (cleaned[emitted_len:], False, None)
-                emitted_len = len(cleaned)
-            if obj.get("done"):
-                yield ("", True, None)
-                return
-
-
-# Max chars to send for summarization to avoid blowing context
-SUMMARISE_MAX_CHARS = 60_000
+class ThinkFilter:
+    """Incremental <think>...</think> suppressor for streamed output.
 
+    feed() returns the visible part of each chunk with O(len(chunk)) work, holding back only a possible
+    partial tag at the chunk end (tags may be split across chunks). Leading whitespace of the visible
+    output is dropped, matching strip_think_tags. Counts think vs visible chunks (~tokens) for metrics.
+    """
 
-def summarise_history(messages: list[dict]) -> str:
+    OPEN = "<think>"
+    CLOSE = "</think>"
+
+    def __init__(self):
+        self.in_think = False
+        self.think_tokens = 0
+        self.visible_tokens = 0
+        self._pending = ""
+        self._started = False
+
+    @staticmethod
+    def _partial_suffix(buf: str, tag: str, start: int) -> int:
+        """Length of the longest proper prefix of tag that buf[start:] ends with."""
+        for k in range(min(len(tag) - 1, len(buf) - start), 0, -1):
+            if buf.endswith(tag[:k]):
+                return k
+        return 0
+
+    def feed(self, text: str) -> str:
+        buf = self._pending + (text or "")
+        self._pending = ""
+        out = []
+        think_chars = 0
+        i = 0
+        while i < len(buf):
+            tag = self.CLOSE if self.in_think else self.OPEN
+            j = buf.find(tag, i)
+            if j == -1:
+                keep = self._partial_suffix(buf, tag, i)
+                end = len(buf) - keep
+                if self.in_think:
+                    think_chars += end - i
+                else:
+                    out.append(buf[i:end])
+                self._pending = buf[end:]
+                break
+            if self.in_think:
+                think_chars += j - i
+            else:
+                out.append(buf[i:j])
+            i = j + len(tag)
+            self.in_think = not self.in_think
+        visible = self._emit("".join(out))
+        if think_chars or (self.in_think and not visible):
+            self.think_tokens += 1
+        elif visible:
+            self.visible_tokens += 1
+        return visible
+
+    def flush(self) -> str:
+        """Visible remainder at end of stream; an unclosed think block is dropped."""
+        rest, self._pending = self._pending, ""
+        return "" if self.in_think else self._emit(rest)
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+def record_think_stats(f: ThinkFilter) -> None:
+    """Add a finished stream's think/visible token counts to metrics."""
+    metrics.incr("llm.think_tokens", f.think_tokens)
+    metrics.incr("llm.visible_tokens", f.visible_tokens)
+
+
+async def stream_completion(messages: list[dict], affinity: str | None = None):
+    """Stream LLM tokens from Ollama (async). Yields (token, done, topic_detected). affinity: session id for routing."""
+    think = ThinkFilter()
+    try:
+        async with ollama.astream_chat(messages, affinity=affinity) as chunks:
+            async for obj in chunks:
+                msg = obj.get("message") or {}
+                if msg.get("thinking"):
+                    think.think_tokens += 1
+                token = think.feed(msg.get("content") or "")
+                if token:
+                    yield (token, False, None)
+                if obj.get("done"):
+                    break
+        tail = think.flush()
+        if tail:
+            yield (tail, False, None)
+        yield ("", True, None)
+    finally:
+        record_think_stats(think)
+
+
+def summarise_history(messages: list[dict], previous_summary: str = "", affinity: str | None = None) -> str:
     """Non-streaming call to Ollama to summarise old conversation exchanges.
 
-    Used by session.get_messages_for_llm() when history exceeds MAX_HISTORY_EXCHANGES.
+    Used by the background summariser (services.summariser). With previous_summary, only the newly
+    aged-out messages are sent and the model folds them into the existing summary.
     Returns a concise context block (max ~400 words) or empty string on failure.
     """
     parts = []
@@ -82,31 +137,32 @@ def summarise_history(messages: list[dict]) -> str:
         return ""
 
     conversation_text = "\n".join(parts)
-    if len(conversation_text) > SUMMARISE_MAX_CHARS:
-        conversation_text = conversation_text[-SUMMARISE_MAX_CHARS:]
-
-    url = f"{OLLAMA_BASE_URL}/api/chat"
-    payload = {
-        "model": OLLAMA_MODEL,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "Summarise this interview prep conversation into a concise context block "
-                    "(max 400 words). Preserve: key topics discussed, questions asked, concepts "
-                    "explained, and the user's demonstrated level of understanding."
-                ),
-            },
-            {"role": "user", "content": conversation_text},
-        ],
-        "stream": False,
-    }
+
+    if previous_summary:
+        instruction = (
+            "Update the running summary of this interview prep conversation with the new exchanges "
+            "below. Return the full updated summary as a concise context block (max 400 words). "
+            "Preserve: key topics discussed, questions asked, concepts explained, and the user's "
+            "demonstrated level of understanding."
+        )
+        header = f"Current summary:\n{previous_summary}\n\nNew exchanges:\n"
+    else:
+        instruction = (
+            "Summarise this interview prep conversation into a concise context block "
+            "(max 400 words). Preserve: key topics discussed, questions asked, concepts "
+            "explained, and the user's demonstrated level of understanding."
+        )
+        header = ""
+    # The window is fixed (core.context_window): the oldest exchanges are cut if they do not fit
+    budget = prompt_budget(message_tokens({"content": instruction}) + message_tokens({"content": header}))
+    conversation_text = header + truncate_to_tokens(conversation_text, budget, keep_end=True)
+    messages = [
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": conversation_text},
+    ]
 
     try:
-        r = requests.post(url, json=payload, timeout=OLLAMA_TIMEOUT)
-        r.raise_for_status()
-        data = r.json()
-        response = (data.get("message") or {}).get("content", "") or ""
+        response = ollama.chat(messages, affinity=affinity, job=BACKGROUND).get("content", "") or ""
         return strip_think_tags(response)
     except Exception as e:
         logger.debug("Summarise history failed: %s", e)
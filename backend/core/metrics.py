@@ -0,0 +1,60 @@
+"""In-process counters and latency stats. Exposed by GET /metrics."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_timings: dict[str, dict] = {}
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Add value to a monotonically increasing counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Set a point-in-time value (queue depth, in-flight requests)."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Record one duration sample: count, total, max and last are kept."""
+    with _lock:
+        t = _timings.get(name)
+        if t is None:
+            t = _timings[name] = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+        t["count"] += 1
+        t["total"] += seconds
+        t["max"] = max(t["max"], seconds)
+        t["last"] = seconds
+
+
+@contextmanager
+def timed(name: str):
+    """Observe the wall time of the block under name, including when it raises."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start)
+
+
+def snapshot() -> dict:
+    """Copy of all metrics; timings include avg."""
+    with _lock:
+        timings = {
+            k: {
+                "count": v["count"],
+                "avg": round(v["total"] / v["count"], 6) if v["count"] else 0.0,
+                "max": round(v["max"], 6),
+                "last": round(v["last"], 6),
+                "total": round(v["total"], 6),
+            }
+            for k, v in _timings.items()
+        }
+        return {"counters": dict(_counters), "gauges": dict(_gauges), "timings": timings}
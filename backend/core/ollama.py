@@ -0,0 +1,359 @@
+"""Shared Ollama HTTP client: pooled keep-alive connections, per-call-type timeouts, latency metrics.
+
+All Ollama traffic (chat, generate, streaming) goes through here instead of raw requests.post.
+Calls are spread over OLLAMA_BASE_URLS by core.router.Router; pass affinity (the session id) to keep
+a session on one instance. Each call first takes a core.scheduler slot for its job class.
+"""
+
+import json
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    CONTEXT_TOKEN_BUDGET,
+    OLLAMA_BASE_URLS,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_FIRST_BYTE_TIMEOUT,
+    OLLAMA_GENERATE_TIMEOUT,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MODEL,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_TIMEOUT,
+)
+from core import metrics
+from core.cache import LLM_CACHE, make_key
+from core.context_window import count_tokens, message_tokens
+from core.scheduler import INTERACTIVE, SCHEDULER
+from core.router import Router
+
+
+class OllamaTimeout(requests.exceptions.Timeout):
+    """The call exceeded its total deadline."""
+
+
+@dataclass(frozen=True)
+class Timeouts:
+    """connect: TCP connect. first_byte: max wait for the first (or next) byte. total: whole call."""
+
+    connect: float
+    first_byte: float
+    total: float
+
+
+# Per-call-type timeouts. Non-streaming calls only send bytes once generation is done, so their
+# first-byte timeout equals the total.
+TIMEOUTS = {
+    "chat_stream": Timeouts(OLLAMA_CONNECT_TIMEOUT, OLLAMA_FIRST_BYTE_TIMEOUT, OLLAMA_TIMEOUT),
+    "chat": Timeouts(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT, OLLAMA_TIMEOUT),
+    "generate": Timeouts(OLLAMA_CONNECT_TIMEOUT, OLLAMA_GENERATE_TIMEOUT, OLLAMA_GENERATE_TIMEOUT),
+}
+
+ROUTER = Router(OLLAMA_BASE_URLS, probe_interval=OLLAMA_HEALTH_INTERVAL)
+
+_http = requests.Session()
+_http.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=OLLAMA_POOL_SIZE))
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=OLLAMA_POOL_SIZE))
+
+
+@contextmanager
+def _post(path: str, payload: dict, timeouts: Timeouts, affinity: str | None = None):
+    """POST to the first reachable backend (failing over on connect errors). Yields the open response."""
+    last_error: Exception | None = None
+    for backend in ROUTER.candidates(affinity):
+        ROUTER.begin(backend)
+        try:
+            r = _http.post(f"{backend.url}{path}", json=payload, stream=True, timeout=(timeouts.connect, timeouts.first_byte))
+        except requests.exceptions.ConnectionError as e:
+            ROUTER.end(backend)
+            ROUTER.mark_down(backend, e)
+            last_error = e
+            continue
+        except Exception:
+            ROUTER.end(backend)
+            metrics.incr(f"ollama{path}.errors")
+            raise
+        try:
+            if not r.ok:
+                metrics.incr(f"ollama{path}.errors")
+                r.raise_for_status()
+            ROUTER.bind(affinity, backend)
+            yield r
+        finally:
+            r.close()
+            ROUTER.end(backend)
+        return
+    metrics.incr(f"ollama{path}.errors")
+    raise last_error or requests.exceptions.ConnectionError("No Ollama backend available")
+
+
+def parse_stream_line(line: str) -> dict | None:
+    """Parse one streamed line. Accepts Ollama's native NDJSON and SSE `data: ` framing.
+
+    Returns None for blank, comment and undecodable lines; `data: [DONE]` becomes {"done": True}.
+    """
+    line = line.strip()
+    if not line or line.startswith(":"):
+        return None
+    if line.startswith("data:"):
+        line = line[5:].strip()
+        if line == "[DONE]":
+            return {"done": True}
+    try:
+        obj = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def _prompt_tokens(payload: dict) -> int:
+    """Estimated prompt size of a request (messages or prompt, plus tool schemas)."""
+    total = sum(message_tokens(m) for m in payload.get("messages") or [])
+    total += count_tokens(payload.get("prompt") or "")
+    if payload.get("tools"):
+        total += count_tokens(json.dumps(payload["tools"]))
+    return total
+
+
+def _record_usage(path: str, obj: dict, prompt_tokens: int) -> None:
+    """Record the counters from Ollama's final response object.
+
+    prompt_eval_count only covers prompt tokens Ollama had to evaluate; the rest of the prompt
+    (prompt_tokens is our estimate of its size) was reused from the KV cache.
+    """
+    evaluated = obj.get("prompt_eval_count")
+    if evaluated is None:
+        return
+    metrics.incr(f"ollama{path}.prompt_tokens", prompt_tokens)
+    metrics.incr(f"ollama{path}.prompt_eval_tokens", evaluated)
+    metrics.incr(f"ollama{path}.eval_tokens", obj.get("eval_count") or 0)
+    if obj.get("prompt_eval_duration"):
+        metrics.observe(f"ollama{path}.prompt_eval", obj["prompt_eval_duration"] / 1e9)
+    if prompt_tokens:
+        metrics.set_gauge(f"ollama{path}.prompt_reuse", round(max(0.0, 1 - evaluated / prompt_tokens), 3))
+
+
+def post_json(path: str, payload: dict, kind: str, affinity: str | None = None, job: str = INTERACTIVE) -> dict:
+    """Non-streaming POST; returns the decoded JSON body. Raises OllamaTimeout past the total deadline.
+
+    Waits for a scheduler slot for job first (SchedulerBusy if none); the timeouts start once it has one.
+    """
+    timeouts = TIMEOUTS[kind]
+    with SCHEDULER.slot(job):
+        start = time.monotonic()
+        deadline = start + timeouts.total
+        try:
+            with _post(path, {**payload, "stream": False}, timeouts, affinity) as r:
+                chunks = []
+                for chunk in r.iter_content(chunk_size=65536):
+                    if time.monotonic() > deadline:
+                        metrics.incr(f"ollama{path}.timeouts")
+                        raise OllamaTimeout(f"Ollama {path} exceeded its total timeout")
+                    chunks.append(chunk)
+                data = json.loads(b"".join(chunks) or b"{}")
+                _record_usage(path, data, _prompt_tokens(payload))
+                return data
+        finally:
+            metrics.observe(f"ollama{path}.latency", time.monotonic() - start)
+
+
+def _with_options(payload: dict, options: dict | None) -> dict:
+    """payload with options set. num_ctx is always CONTEXT_TOKEN_BUDGET, the window prompts are assembled
+    and truncated for: Ollama reloads the model whenever num_ctx changes, losing its KV cache."""
+    payload["options"] = {"num_ctx": CONTEXT_TOKEN_BUDGET, **(options or {})}
+    return payload
+
+
+def _chat_payload(messages: list[dict], extra: dict) -> dict:
+    """/api/chat body (see _with_options)."""
+    options = extra.pop("options", None)
+    payload = {"model": OLLAMA_MODEL, "messages": messages, "keep_alive": OLLAMA_KEEP_ALIVE, **extra}
+    return _with_options(payload, options)
+
+
+def _cached_post(
+    path: str, payload: dict, kind: str, affinity: str | None, job: str, cache: str | None, refresh: bool
+) -> dict:
+    """post_json behind LLM_CACHE when cache (a prompt template version) is given.
+
+    The key covers path, template version and the whole payload (model, prompt, options), so any
+    change to the model or inputs is a different entry. Empty answers are not cached.
+    """
+    if cache is None:
+        return post_json(path, payload, kind, affinity, job)
+    key = make_key(path, cache, {k: v for k, v in payload.items() if k != "keep_alive"})
+    if not refresh:
+        hit = LLM_CACHE.get(key)
+        if hit is not None:
+            return hit
+    data = post_json(path, payload, kind, affinity, job)
+    result = {k: data[k] for k in ("response", "message") if data.get(k)}
+    if result:
+        LLM_CACHE.put(key, result)
+    return data
+
+
+def chat(
+    messages: list[dict],
+    *,
+    kind: str = "chat",
+    affinity: str | None = None,
+    job: str = INTERACTIVE,
+    cache: str | None = None,
+    refresh: bool = False,
+    **extra,
+) -> dict:
+    """Non-streaming /api/chat. Returns the assistant message dict.
+
+    cache: prompt template version (e.g. "parse_jd:v1") to serve identical calls from LLM_CACHE;
+    refresh=True skips the lookup and replaces the entry.
+    """
+    data = _cached_post("/api/chat", _chat_payload(messages, extra), kind, affinity, job, cache, refresh)
+    return data.get("message") or {}
+
+
+def generate(
+    prompt: str,
+    *,
+    kind: str = "generate",
+    affinity: str | None = None,
+    job: str = INTERACTIVE,
+    cache: str | None = None,
+    refresh: bool = False,
+    **extra,
+) -> str:
+    """Non-streaming /api/generate. Returns the response text. cache/refresh: see chat()."""
+    options = extra.pop("options", None)
+    payload = _with_options({"model": OLLAMA_MODEL, "prompt": prompt, "keep_alive": OLLAMA_KEEP_ALIVE, **extra}, options)
+    data = _cached_post("/api/generate", payload, kind, affinity, job, cache, refresh)
+    return data.get("response", "") or ""
+
+
+def warmup(messages: list[dict], **extra) -> int:
+    """Load OLLAMA_MODEL on every instance by running messages through it for one token.
+
+    Sent to each backend directly (no routing or scheduling) so every instance has the model loaded
+    and the prompt prefix evaluated before the first chat. Returns the number of instances warmed.
+    """
+    payload = _chat_payload(messages, {**extra, "options": {"num_predict": 1}})
+    warmed = 0
+    for backend in ROUTER.backends:
+        start = time.monotonic()
+        try:
+            r = _http.post(
+                f"{backend.url}/api/chat",
+                json={**payload, "stream": False},
+                timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT),
+            )
+            r.raise_for_status()
+        except requests.exceptions.ConnectionError as e:
+            ROUTER.mark_down(backend, e)
+            continue
+        except requests.exceptions.RequestException:
+            metrics.incr("ollama.warmup.errors")
+            continue
+        metrics.observe("ollama.warmup.latency", time.monotonic() - start)
+        warmed += 1
+    return warmed
+
+
+# Async client, created lazily on first use (inside the running event loop) and closed on shutdown
+_async_http: httpx.AsyncClient | None = None
+
+
+def _async_client() -> httpx.AsyncClient:
+    global _async_http
+    if _async_http is None:
+        _async_http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_POOL_SIZE),
+        )
+    return _async_http
+
+
+async def aclose() -> None:
+    """Close the async client's pooled connections."""
+    global _async_http
+    if _async_http is not None:
+        await _async_http.aclose()
+        _async_http = None
+
+
+async def _aiter_objects(r: httpx.Response, deadline: float, path: str, prompt_tokens: int = 0):
+    """Yield parsed chunk objects from a streaming response, enforcing the total deadline."""
+    try:
+        async for line in r.aiter_lines():
+            if time.monotonic() > deadline:
+                metrics.incr(f"ollama{path}.timeouts")
+                raise OllamaTimeout(f"Ollama {path} exceeded its total timeout")
+            obj = parse_stream_line(line)
+            if obj is not None:
+                if obj.get("done"):
+                    _record_usage(path, obj, prompt_tokens)
+                yield obj
+    except httpx.TimeoutException as e:
+        metrics.incr(f"ollama{path}.timeouts")
+        raise OllamaTimeout(str(e)) from e
+
+
+@asynccontextmanager
+async def _apost(path: str, payload: dict, timeouts: Timeouts, affinity: str | None = None):
+    """Async twin of _post: streaming POST with failover on connect errors."""
+    client = _async_client()
+    timeout = httpx.Timeout(timeouts.total, connect=timeouts.connect, read=timeouts.first_byte)
+    last_error: Exception | None = None
+    for backend in ROUTER.candidates(affinity):
+        ROUTER.begin(backend)
+        request = client.build_request("POST", f"{backend.url}{path}", json=payload, timeout=timeout)
+        try:
+            r = await client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            ROUTER.end(backend)
+            ROUTER.mark_down(backend, e)
+            last_error = e
+            continue
+        except httpx.TimeoutException as e:
+            ROUTER.end(backend)
+            metrics.incr(f"ollama{path}.timeouts")
+            raise OllamaTimeout(str(e)) from e
+        except Exception:
+            ROUTER.end(backend)
+            metrics.incr(f"ollama{path}.errors")
+            raise
+        try:
+            if r.is_error:
+                metrics.incr(f"ollama{path}.errors")
+                await r.aread()
+                r.raise_for_status()
+            ROUTER.bind(affinity, backend)
+            yield r
+        finally:
+            await r.aclose()
+            ROUTER.end(backend)
+        return
+    metrics.incr(f"ollama{path}.errors")
+    raise last_error or httpx.ConnectError("No Ollama backend available")
+
+
+@asynccontextmanager
+async def astream(path: str, payload: dict, kind: str = "chat_stream", affinity: str | None = None, job: str = INTERACTIVE):
+    """Async streaming POST. Yields an async iterator of parsed chunk objects."""
+    timeouts = TIMEOUTS[kind]
+    async with SCHEDULER.aslot(job):
+        start = time.monotonic()
+        try:
+            async with _apost(path, {**payload, "stream": True}, timeouts, affinity) as r:
+                metrics.observe(f"ollama{path}.first_byte", time.monotonic() - start)
+                yield _aiter_objects(r, start + timeouts.total, path, _prompt_tokens(payload))
+        finally:
+            metrics.observe(f"ollama{path}.latency", time.monotonic() - start)
+
+
+def astream_chat(messages: list[dict], *, affinity: str | None = None, job: str = INTERACTIVE, **extra):
+    """Async streaming /api/chat context manager (see astream)."""
+    return astream("/api/chat", _chat_payload(messages, extra), "chat_stream", affinity, job)
@@ -0,0 +1,143 @@
+"""Routing across several Ollama instances: health probes, least-outstanding dispatch, session affinity.
+
+core.ollama asks the router for an ordered list of candidate backends per call and fails over to the
+next one on connect errors. A call with an affinity key (the session id) prefers the backend that
+served that key last, so the session keeps hitting the same warm KV cache.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+    """One Ollama instance and its live routing state."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.failures = 0
+        self.last_error = ""
+        self.last_probe = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class Router:
+    """Pick backends by affinity, then least outstanding requests among healthy ones.
+
+    Backends that fail to connect are marked down until a health probe (GET /api/tags) succeeds.
+    If every backend is down they are still tried, so a single flaky instance is not locked out.
+    """
+
+    def __init__(self, urls: list[str], probe_interval: float = 10.0, probe_timeout: float = 2.0, max_affinity: int = 10_000):
+        if not urls:
+            raise ValueError("At least one Ollama URL is required")
+        self.backends = [Backend(u) for u in urls]
+        self._by_url = {b.url: b for b in self.backends}
+        self._lock = threading.Lock()
+        self._affinity: "OrderedDict[str, str]" = OrderedDict()
+        self._max_affinity = max_affinity
+        self._probe_interval = probe_interval
+        self._probe_timeout = probe_timeout
+        self._prober: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def candidates(self, affinity: str | None = None) -> list[Backend]:
+        """Backends in the order they should be tried for this call."""
+        with self._lock:
+            healthy = sorted((b for b in self.backends if b.healthy), key=lambda b: b.outstanding)
+            down = [b for b in self.backends if not b.healthy]
+            preferred = self._by_url.get(self._affinity.get(affinity, "")) if affinity else None
+        if preferred is not None and preferred.healthy:
+            healthy.remove(preferred)
+            healthy.insert(0, preferred)
+        return healthy + down
+
+    def begin(self, backend: Backend) -> None:
+        with self._lock:
+            backend.outstanding += 1
+        metrics.set_gauge(f"ollama.backend.{backend.url}.outstanding", backend.outstanding)
+
+    def end(self, backend: Backend) -> None:
+        with self._lock:
+            backend.outstanding -= 1
+        metrics.set_gauge(f"ollama.backend.{backend.url}.outstanding", backend.outstanding)
+
+    def bind(self, affinity: str | None, backend: Backend) -> None:
+        """Remember which backend served affinity (bounded LRU)."""
+        if not affinity:
+            return
+        with self._lock:
+            self._affinity[affinity] = backend.url
+            self._affinity.move_to_end(affinity)
+            while len(self._affinity) > self._max_affinity:
+                self._affinity.popitem(last=False)
+
+    def mark_down(self, backend: Backend, error: Exception | str) -> None:
+        with self._lock:
+            backend.healthy = False
+            backend.failures += 1
+            backend.last_error = str(error)[:200]
+        metrics.incr("ollama.failovers")
+        logger.warning("Ollama backend %s marked down: %s", backend.url, error)
+        self.start_probing()
+
+    def mark_up(self, backend: Backend) -> None:
+        with self._lock:
+            backend.healthy = True
+
+    def probe(self, backend: Backend) -> bool:
+        """GET /api/tags; updates the backend's health."""
+        backend.last_probe = time.monotonic()
+        try:
+            r = requests.get(f"{backend.url}/api/tags", timeout=self._probe_timeout)
+            ok = r.ok
+        except Exception as e:
+            ok = False
+            backend.last_error = str(e)[:200]
+        if ok:
+            self.mark_up(backend)
+        else:
+            with self._lock:
+                backend.healthy = False
+        return ok
+
+    def probe_all(self) -> None:
+        for b in self.backends:
+            self.probe(b)
+
+    def start_probing(self) -> None:
+        """Start the background health prober (idempotent)."""
+        with self._lock:
+            if self._prober is not None and self._prober.is_alive():
+                return
+            self._stop.clear()
+            self._prober = threading.Thread(target=self._probe_loop, name="ollama-prober", daemon=True)
+            self._prober.start()
+
+    def stop_probing(self) -> None:
+        self._stop.set()
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self._probe_interval):
+            self.probe_all()
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [b.snapshot() for b in self.backends]
@@ -0,0 +1,200 @@
+"""Priority admission control for Ollama calls.
+
+Every Ollama call takes a slot from the scheduler first. Job classes have their own concurrency limit
+and a priority: when a slot frees, waiting interactive chat turns go before extraction (profile, JD)
+and background work (research, history summaries). Queues are bounded; a full queue or a wait past
+the class's max_wait raises SchedulerBusy, which the API turns into 503 + Retry-After.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+
+from config import (
+    LLM_BACKGROUND_LIMIT,
+    LLM_CONCURRENCY,
+    LLM_EXTRACTION_LIMIT,
+    LLM_QUEUE_LIMIT,
+    LLM_QUEUE_TIMEOUT,
+    OLLAMA_BASE_URLS,
+    OLLAMA_TIMEOUT,
+)
+from core import metrics
+
+INTERACTIVE = "interactive"
+EXTRACTION = "extraction"
+BACKGROUND = "background"
+
+
+class SchedulerBusy(Exception):
+    """No slot for this job class: its queue is full or the wait timed out."""
+
+    def __init__(self, job: str, retry_after: int):
+        super().__init__(f"LLM scheduler busy ({job}); retry after {retry_after}s")
+        self.job = job
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class JobClass:
+    """priority: lower runs first. limit: max concurrent jobs. queue_limit: max waiting jobs."""
+
+    name: str
+    priority: int
+    limit: int
+    queue_limit: int
+    max_wait: float
+
+
+class _Waiter:
+    __slots__ = ("job", "grant", "granted")
+
+    def __init__(self, job: str, grant):
+        self.job = job
+        self.grant = grant
+        self.granted = False
+
+
+class Scheduler:
+    """Slots shared by all job classes (capacity), each class also capped by its own limit."""
+
+    def __init__(self, capacity: int, classes: list[JobClass]):
+        self.capacity = capacity
+        self.classes = {c.name: c for c in classes}
+        self._order = sorted(classes, key=lambda c: c.priority)
+        self._lock = threading.Lock()
+        self._running = {c.name: 0 for c in classes}
+        self._queues: dict[str, deque[_Waiter]] = {c.name: deque() for c in classes}
+        # Moving average of how long each class holds a slot, for Retry-After estimates
+        self._hold = {c.name: 1.0 for c in classes}
+
+    def _can_run(self, job: str) -> bool:
+        return sum(self._running.values()) < self.capacity and self._running[job] < self.classes[job].limit
+
+    def _retry_after(self, job: str) -> int:
+        cls = self.classes[job]
+        return max(1, math.ceil(self._hold[job] * (len(self._queues[job]) + 1) / max(cls.limit, 1)))
+
+    def _publish(self, job: str) -> None:
+        metrics.set_gauge(f"scheduler.{job}.queued", len(self._queues[job]))
+        metrics.set_gauge(f"scheduler.{job}.running", self._running[job])
+
+    def _enter(self, job: str, grant) -> _Waiter | None:
+        """Take a slot now (returns None) or enqueue a waiter. Raises SchedulerBusy if the queue is full."""
+        with self._lock:
+            if self._can_run(job) and not self._queues[job]:
+                self._running[job] += 1
+                self._publish(job)
+                return None
+            if len(self._queues[job]) >= self.classes[job].queue_limit:
+                metrics.incr(f"scheduler.{job}.rejected")
+                raise SchedulerBusy(job, self._retry_after(job))
+            waiter = _Waiter(job, grant)
+            self._queues[job].append(waiter)
+            self._publish(job)
+            return waiter
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Withdraw a waiter that stopped waiting. Returns True if it had already been granted a slot."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._queues[waiter.job].remove(waiter)
+            self._publish(waiter.job)
+            return False
+
+    def _release(self, job: str, held: float) -> None:
+        with self._lock:
+            self._running[job] -= 1
+            self._hold[job] = 0.8 * self._hold[job] + 0.2 * held
+            self._publish(job)
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Grant free slots to waiters in priority order (lock held)."""
+        for cls in self._order:
+            queue = self._queues[cls.name]
+            while queue and self._can_run(cls.name):
+                waiter = queue.popleft()
+                waiter.granted = True
+                self._running[cls.name] += 1
+                waiter.grant()
+            self._publish(cls.name)
+
+    def _timed_out(self, job: str) -> SchedulerBusy:
+        metrics.incr(f"scheduler.{job}.timeouts")
+        with self._lock:
+            return SchedulerBusy(job, self._retry_after(job))
+
+    def admit(self, job: str) -> None:
+        """Fail fast before starting work (e.g. an SSE response) if job's queue is already full."""
+        with self._lock:
+            if not self._can_run(job) and len(self._queues[job]) >= self.classes[job].queue_limit:
+                metrics.incr(f"scheduler.{job}.rejected")
+                raise SchedulerBusy(job, self._retry_after(job))
+
+    @contextmanager
+    def slot(self, job: str):
+        """Hold a slot for job in a blocking caller; waits up to the class's max_wait."""
+        start = time.monotonic()
+        event = threading.Event()
+        waiter = self._enter(job, event.set)
+        if waiter is not None and not event.wait(self.classes[job].max_wait) and not self._abandon(waiter):
+            raise self._timed_out(job)
+        granted = time.monotonic()
+        metrics.observe(f"scheduler.{job}.wait", granted - start)
+        try:
+            yield
+        finally:
+            self._release(job, time.monotonic() - granted)
+
+    @asynccontextmanager
+    async def aslot(self, job: str):
+        """Async slot(): waiting does not block the event loop."""
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: fut.done() or fut.set_result(None))
+
+        waiter = self._enter(job, grant)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), self.classes[job].max_wait)
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise self._timed_out(job)
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release(job, 0.0)
+                raise
+        granted = time.monotonic()
+        metrics.observe(f"scheduler.{job}.wait", granted - start)
+        try:
+            yield
+        finally:
+            self._release(job, time.monotonic() - granted)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {"running": self._running[name], "queued": len(self._queues[name]), "limit": cls.limit}
+                for name, cls in self.classes.items()
+            }
+
+
+# Limits are per Ollama instance, so capacity grows with OLLAMA_BASE_URLS
+_instances = len(OLLAMA_BASE_URLS)
+SCHEDULER = Scheduler(
+    capacity=LLM_CONCURRENCY * _instances,
+    classes=[
+        JobClass(INTERACTIVE, 0, LLM_CONCURRENCY * _instances, LLM_QUEUE_LIMIT, LLM_QUEUE_TIMEOUT),
+        JobClass(EXTRACTION, 1, LLM_EXTRACTION_LIMIT * _instances, LLM_QUEUE_LIMIT, LLM_QUEUE_TIMEOUT * 4),
+        JobClass(BACKGROUND, 2, LLM_BACKGROUND_LIMIT * _instances, LLM_QUEUE_LIMIT, OLLAMA_TIMEOUT),
+    ],
+)
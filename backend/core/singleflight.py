@@ -0,0 +1,114 @@
+"""Single-flight coalescing of concurrent identical expensive calls.
+
+Group.do(key, fn) runs fn once per key at a time: threads in this worker that ask for the same key
+while it is in flight wait for the leader and share its result or exception. With across_workers, the
+leader also takes a lease on the key in Postgres (a row with an expiry, taken and released in short
+statements, so no connection is held while fn runs). A leader in another worker polls until the first
+one releases it, then calls recheck() (typically a cache lookup) before computing again.
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from core import metrics
+from db import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+# Lease polling interval while another worker leads: starts short, backs off to the maximum
+LEASE_POLL_MIN = 0.05
+LEASE_POLL_MAX = 1.0
+
+
+class Group:
+    """One namespace of in-flight calls. lock_timeout: max seconds to wait on another worker's leader,
+    and the lease's lifetime (so a crashed leader's lease expires)."""
+
+    def __init__(self, name: str, across_workers: bool = True, lock_timeout: float = 300.0):
+        self.name = name
+        self.across_workers = across_workers
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+
+    def do(self, key: str, fn, recheck=None):
+        """Return fn(), sharing one execution among concurrent callers with the same key.
+
+        recheck: called by a cross-worker leader once it holds the lock; a non-None result is used
+        instead of calling fn (the other worker already produced it).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"singleflight.{self.name}.leaders")
+        try:
+            call.result = self._lead(key, fn, recheck)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _acquire(self, name: str, holder: str) -> bool:
+        """Poll for the lease until taken (True) or lock_timeout passes (False)."""
+        deadline = time.monotonic() + self.lock_timeout
+        delay = LEASE_POLL_MIN
+        while not acquire_lease(name, holder, self.lock_timeout):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, LEASE_POLL_MAX)
+        return True
+
+    def _lead(self, key: str, fn, recheck):
+        if not self.across_workers:
+            return fn()
+        name = f"singleflight:{self.name}:{key}"
+        holder = uuid.uuid4().hex
+        start = time.monotonic()
+        try:
+            held = self._acquire(name, holder)
+        except Exception as e:
+            # The DB only coordinates workers here; compute without it
+            logger.warning("Single-flight lease unavailable for %s: %s", self.name, e)
+            held = None
+        metrics.observe(f"singleflight.{self.name}.lock_wait", time.monotonic() - start)
+        if held is False:
+            metrics.incr(f"singleflight.{self.name}.lock_timeouts")
+        try:
+            if held and recheck is not None:
+                value = recheck()
+                if value is not None:
+                    metrics.incr(f"singleflight.{self.name}.shared_across_workers")
+                    return value
+            return fn()
+        finally:
+            if held:
+                try:
+                    release_lease(name, holder)
+                except Exception as e:
+                    logger.warning("Could not release single-flight lease for %s (it expires): %s", self.name, e)
@@ -20,9 +20,26 @@ set_default_profile_id = _backend.set_default_profile_id
 profile_exists = _backend.profile_exists
 get_progress = _backend.get_progress
 save_progress = _backend.save_progress
+increment_topic_scores = _backend.increment_topic_scores
 get_session = _backend.get_session
 save_session = _backend.save_session
+update_session = _backend.update_session
+update_session_summary = _backend.update_session_summary
+append_messages = _backend.append_messages
+get_messages = _backend.get_messages
+recent_companies = _backend.recent_companies
+cache_get = _backend.cache_get
+cache_put = _backend.cache_put
+cache_delete = _backend.cache_delete
+cache_stats = _backend.cache_stats
+index_snippets = _backend.index_snippets
+search_snippets = _backend.search_snippets
 health_check = _backend.health_check
+unit_of_work = _backend.unit_of_work
+acquire_lease = _backend.acquire_lease
+release_lease = _backend.release_lease
+pool_stats = _backend.pool_stats
+warm_caches = _backend.warm_caches
 
 
 def ensure_curriculum_from_profile(profile_data: dict) -> None:
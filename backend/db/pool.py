@@ -0,0 +1,191 @@
+"""Bounded, thread-safe PostgreSQL connection pool with health checks on checkout."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(RuntimeError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Hand out psycopg2 connections to one caller at a time, up to max_size open connections.
+
+    Checkout blocks (up to timeout seconds) when every connection is in use. Connections that
+    were idle longer than check_idle_after seconds are pinged before being handed out; dead
+    ones are discarded and replaced. on_connect runs once for every new connection.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        check_idle_after: float = 30.0,
+        on_connect=None,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._dsn = dsn
+        self._min_size = max(0, min(min_size, max_size))
+        self._max_size = max_size
+        self._timeout = timeout
+        self._check_idle_after = check_idle_after
+        self._on_connect = on_connect
+        self._cond = threading.Condition()
+        self._idle: list[tuple[object, float]] = []  # (conn, returned_at), most recent last
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        # Counters
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        for _ in range(self._min_size):
+            conn = self._connect()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self._dsn)
+        if self._on_connect is not None:
+            self._on_connect(conn)
+        return conn
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self._check_idle_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection, opening a new one if below max_size."""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._size < self._max_size:
+                        self._size += 1
+                        self._in_use += 1
+                        conn, returned_at = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(f"No database connection available within {self._timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+        # Connect / ping outside the lock so other threads are not blocked on network I/O
+        try:
+            if conn is not None and not self._is_healthy(conn, time.monotonic() - returned_at):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._discarded += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        """Return a connection. Broken or mid-transaction connections are rolled back or discarded."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if conn.closed:
+            discard = True
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+                self._discarded += 1 if discard else 0
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard or self._closed:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager: check out a connection and always return it."""
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def stats(self) -> dict:
+        """Snapshot of pool size and wait counters."""
+        with self._cond:
+            return {
+                "min_size": self._min_size,
+                "max_size": self._max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+                "wait_seconds_avg": round(self._wait_total / self._checkouts, 6) if self._checkouts else 0.0,
+            }
+
+    def closeall(self) -> None:
+        """Close idle connections; in-use connections are closed when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
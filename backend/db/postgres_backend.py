@@ -1,42 +1,124 @@
 """PostgreSQL backend for Studia DB. Used when DATABASE_URL starts with postgresql://."""
 
+import copy
+import hashlib
 import json
+import threading
+import time
 import uuid
 from contextlib import contextmanager
 from datetime import datetime
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+from config import (
+    DATABASE_URL,
+    DB_CACHE_TTL,
+    DB_POOL_CHECK_IDLE_AFTER,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_TIMEOUT,
+)
+from db.pool import ConnectionPool
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is not None:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            if not DATABASE_URL or not DATABASE_URL.startswith("postgresql"):
+                raise RuntimeError("PostgreSQL backend requires DATABASE_URL to start with postgresql://")
+            pool = ConnectionPool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN_SIZE,
+                max_size=DB_POOL_MAX_SIZE,
+                timeout=DB_POOL_TIMEOUT,
+                check_idle_after=DB_POOL_CHECK_IDLE_AFTER,
+            )
+            with pool.connection() as conn:
+                _init_schema(conn)
+            _pool = pool
+    return _pool
 
-from config import DATABASE_URL
 
-_conn = None
-
-
-def _get_conn():
-    global _conn
-    if _conn is not None:
-        return _conn
-    if not DATABASE_URL or not DATABASE_URL.startswith("postgresql"):
-        raise RuntimeError("PostgreSQL backend requires DATABASE_URL to start with postgresql://")
-    _conn = psycopg2.connect(DATABASE_URL)
-    _init_schema(_conn)
-    return _conn
+@contextmanager
+def unit_of_work():
+    """Pin one pooled connection to the current thread; repository calls inside the block reuse it."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    with _get_pool().connection() as conn:
+        _local.conn = conn
+        try:
+            yield conn
+        finally:
+            _local.conn = None
 
 
 @contextmanager
 def _cursor():
-    conn = _get_conn()
-    conn.rollback()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    try:
-        yield cur
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        cur.close()
+    with unit_of_work() as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+
+def pool_stats() -> dict:
+    """Connection pool counters (size, in use, wait time). Empty before first use."""
+    return _pool.stats() if _pool is not None else {}
+
+
+# Hot read cache for rows read on every chat turn but rarely written (curriculum, profiles, default
+# profile id). Writes through this process invalidate entries; other workers see them within DB_CACHE_TTL.
+_hot: dict[str, tuple[float, object]] = {}
+_hot_lock = threading.Lock()
+# Bumped by every invalidation, so a load that raced a write does not cache the row it read before it
+_hot_generation = 0
+
+
+def _hot_get(key: str, load):
+    """Cached load(); callers get a copy. None results are not cached."""
+    now = time.monotonic()
+    with _hot_lock:
+        hit = _hot.get(key)
+        generation = _hot_generation
+    if hit is not None and now - hit[0] < DB_CACHE_TTL:
+        return copy.deepcopy(hit[1])
+    value = load()
+    if value is not None:
+        with _hot_lock:
+            if generation == _hot_generation:
+                _hot[key] = (now, value)
+    return copy.deepcopy(value)
+
+
+def _hot_invalidate(key: str) -> None:
+    global _hot_generation
+    with _hot_lock:
+        _hot.pop(key, None)
+        _hot_generation += 1
+
+
+def warm_caches() -> None:
+    """Open the pool (min_size connections, schema check) and load the curriculum and default profile."""
+    _get_pool()
+    list_curriculum()
+    profile_id = get_default_profile_id()
+    if profile_id:
+        get_profile(profile_id)
 
 
 def _init_schema(conn) -> None:
@@ -58,6 +140,20 @@ def _init_schema(conn) -> None:
                 FOREIGN KEY (profile_id) REFERENCES profiles(id)
             );
         """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS topic_scores (
+                profile_id TEXT NOT NULL,
+                topic_id TEXT NOT NULL,
+                label TEXT NOT NULL DEFAULT '',
+                score DOUBLE PRECISION NOT NULL DEFAULT 0.5,
+                last_delta DOUBLE PRECISION NOT NULL DEFAULT 0,
+                last_visited TIMESTAMPTZ,
+                updated_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (profile_id, topic_id),
+                FOREIGN KEY (profile_id) REFERENCES profiles(id)
+            );
+        """)
+        _migrate_progress_topics(cur)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS sessions (
                 id TEXT PRIMARY KEY,
@@ -71,6 +167,20 @@ def _init_schema(conn) -> None:
                 FOREIGN KEY (profile_id) REFERENCES profiles(id)
             );
         """)
+        cur.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0")
+        cur.execute("ALTER TABLE sessions ADD COLUMN IF NOT EXISTS summary_upto_seq INTEGER NOT NULL DEFAULT 0")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS session_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL DEFAULT '',
+                created_at TIMESTAMPTZ NOT NULL,
+                PRIMARY KEY (session_id, seq),
+                FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
+            );
+        """)
+        _migrate_session_history(cur)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS meta (
                 key TEXT PRIMARY KEY,
@@ -87,10 +197,77 @@ def _init_schema(conn) -> None:
                 updated_at TIMESTAMPTZ NOT NULL
             );
         """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value JSONB NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                accessed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (namespace, key)
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at TIMESTAMPTZ NOT NULL
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS search_snippets (
+                id BIGSERIAL PRIMARY KEY,
+                company TEXT NOT NULL DEFAULT '',
+                source TEXT NOT NULL DEFAULT '',
+                text TEXT NOT NULL,
+                text_hash TEXT NOT NULL UNIQUE,
+                fetched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', company || ' ' || text)) STORED
+            );
+        """)
+        cur.execute("CREATE INDEX IF NOT EXISTS search_snippets_tsv ON search_snippets USING GIN (tsv)")
+        cur.execute("CREATE INDEX IF NOT EXISTS search_snippets_company ON search_snippets (company)")
     conn.commit()
 
 
+def _migrate_progress_topics(cur) -> None:
+    """Move legacy progress.data->'topics' JSONB into topic_scores rows. Idempotent."""
+    cur.execute("""
+        INSERT INTO topic_scores (profile_id, topic_id, label, score, last_visited, updated_at)
+        SELECT p.profile_id, t.key, COALESCE(t.value->>'label', ''),
+               LEAST(1, GREATEST(0, COALESCE((t.value->>'score')::double precision, 0.5))),
+               NULLIF(t.value->>'last_visited', '')::timestamptz, p.updated_at
+        FROM progress p
+        CROSS JOIN LATERAL jsonb_each(p.data->'topics') AS t(key, value)
+        WHERE jsonb_typeof(p.data->'topics') = 'object'
+        ON CONFLICT (profile_id, topic_id) DO NOTHING
+    """)
+    cur.execute("UPDATE progress SET data = data - 'topics' WHERE data ? 'topics'")
+
+
+def _migrate_session_history(cur) -> None:
+    """Move legacy sessions.history JSONB arrays into session_messages (seq = 1-based array position). Idempotent."""
+    cur.execute("""
+        INSERT INTO session_messages (session_id, seq, role, content, created_at)
+        SELECT s.id, m.ord, COALESCE(m.elem->>'role', ''), COALESCE(m.elem->>'content', ''), s.updated_at
+        FROM sessions s
+        CROSS JOIN LATERAL jsonb_array_elements(s.history) WITH ORDINALITY AS m(elem, ord)
+        WHERE jsonb_typeof(s.history) = 'array' AND jsonb_array_length(s.history) > 0
+        ON CONFLICT (session_id, seq) DO NOTHING
+    """)
+    cur.execute("""
+        UPDATE sessions SET message_count = jsonb_array_length(history), history = '[]'
+        WHERE jsonb_typeof(history) = 'array' AND jsonb_array_length(history) > 0
+    """)
+
+
 def list_curriculum() -> list[dict]:
+    return _hot_get("curriculum", _load_curriculum)
+
+
+def _load_curriculum() -> list[dict]:
     with _cursor() as cur:
         cur.execute("SELECT id, label, category, keywords FROM curriculum ORDER BY id")
         rows = cur.fetchall()
@@ -130,9 +307,14 @@ def upsert_topic(topic_id: str, label: str, category: str = "", keywords: list |
                ON CONFLICT(id) DO UPDATE SET label = %s, category = %s, keywords = %s, updated_at = %s""",
             (topic_id, label, category, json.dumps(kw), now, now, label, category, json.dumps(kw), now),
         )
+    _hot_invalidate("curriculum")
 
 
 def get_profile(profile_id: str) -> dict | None:
+    return _hot_get(f"profile:{profile_id}", lambda: _load_profile(profile_id))
+
+
+def _load_profile(profile_id: str) -> dict | None:
     with _cursor() as cur:
         cur.execute(
             "SELECT id, label, data, created_at, updated_at FROM profiles WHERE id = %s",
@@ -176,10 +358,15 @@ def save_profile(profile_id: str | None, label: str, data: dict) -> str:
                ON CONFLICT(id) DO UPDATE SET label = %s, data = %s, updated_at = %s""",
             (profile_id, label or profile_id, json.dumps(data), now, now, label or profile_id, json.dumps(data), now),
         )
+    _hot_invalidate(f"profile:{profile_id}")
     return profile_id
 
 
 def get_default_profile_id() -> str | None:
+    return _hot_get("default_profile_id", _load_default_profile_id)
+
+
+def _load_default_profile_id() -> str | None:
     with _cursor() as cur:
         cur.execute("SELECT value FROM meta WHERE key = %s", ("default_profile_id",))
         row = cur.fetchone()
@@ -192,6 +379,7 @@ def set_default_profile_id(profile_id: str) -> None:
             "INSERT INTO meta (key, value) VALUES (%s, %s) ON CONFLICT(key) DO UPDATE SET value = %s",
             ("default_profile_id", profile_id, profile_id),
         )
+    _hot_invalidate("default_profile_id")
 
 
 def profile_exists() -> bool:
@@ -201,45 +389,101 @@ def profile_exists() -> bool:
 
 
 def get_progress(profile_id: str) -> dict:
+    """Per-topic scores for profile as {"topics": {topic_id: {"score", "label", "last_visited"}}}."""
     with _cursor() as cur:
-        cur.execute("SELECT data FROM progress WHERE profile_id = %s", (profile_id,))
-        row = cur.fetchone()
-    if not row or not row["data"]:
-        return {"topics": {}}
-    data = row["data"]
-    return data if isinstance(data, dict) else json.loads(data)
+        cur.execute(
+            "SELECT topic_id, label, score, last_visited FROM topic_scores WHERE profile_id = %s",
+            (profile_id,),
+        )
+        rows = cur.fetchall()
+    return {
+        "topics": {
+            r["topic_id"]: {
+                "score": r["score"],
+                "label": r["label"],
+                "last_visited": r["last_visited"].isoformat() if hasattr(r["last_visited"], "isoformat") else r["last_visited"],
+            }
+            for r in rows
+        }
+    }
+
+
+def save_progress(profile_id: str, data: dict, *, overwrite: bool = True) -> None:
+    """Write topic rows from {"topics": {...}}. overwrite=False only inserts topics the profile does not have yet."""
+    topics = (data or {}).get("topics") or {}
+    if not topics:
+        return
+    now = datetime.utcnow().isoformat() + "Z"
+    rows = [
+        (profile_id, tid, t.get("label") or "", max(0.0, min(1.0, float(t.get("score", 0.5)))), t.get("last_visited"), now)
+        for tid, t in topics.items()
+    ]
+    conflict = (
+        "DO UPDATE SET label = EXCLUDED.label, score = EXCLUDED.score, last_visited = EXCLUDED.last_visited, updated_at = EXCLUDED.updated_at"
+        if overwrite
+        else "DO NOTHING"
+    )
+    with _cursor() as cur:
+        execute_values(
+            cur,
+            "INSERT INTO topic_scores (profile_id, topic_id, label, score, last_visited, updated_at) VALUES %s "
+            "ON CONFLICT (profile_id, topic_id) " + conflict,
+            rows,
+        )
+
 
+def increment_topic_scores(profile_id: str, deltas: dict[str, float]) -> list[str]:
+    """Atomically add deltas to topic scores, clamped to [0, 1], in one statement. Returns updated topic ids.
 
-def save_progress(profile_id: str, data: dict) -> None:
+    Topics without a row start from 0.5; unknown topics (in neither curriculum nor topic_scores) are skipped.
+    The row lock taken by ON CONFLICT means concurrent increments for the same topic never lose updates.
+    """
+    if not deltas:
+        return []
     now = datetime.utcnow().isoformat() + "Z"
+    topic_ids = list(deltas)
+    values = [float(deltas[t]) for t in topic_ids]
     with _cursor() as cur:
         cur.execute(
-            """INSERT INTO progress (profile_id, data, updated_at) VALUES (%s, %s, %s)
-               ON CONFLICT(profile_id) DO UPDATE SET data = %s, updated_at = %s""",
-            (profile_id, json.dumps(data), now, json.dumps(data), now),
+            """INSERT INTO topic_scores (profile_id, topic_id, label, score, last_delta, last_visited, updated_at)
+               SELECT %s, d.topic_id, COALESCE(c.label, ts.label, d.topic_id),
+                      LEAST(1, GREATEST(0, 0.5 + d.delta)), d.delta, %s, %s
+               FROM unnest(%s::text[], %s::double precision[]) AS d(topic_id, delta)
+               LEFT JOIN curriculum c ON c.id = d.topic_id
+               LEFT JOIN topic_scores ts ON ts.profile_id = %s AND ts.topic_id = d.topic_id
+               WHERE c.id IS NOT NULL OR ts.topic_id IS NOT NULL
+               ON CONFLICT (profile_id, topic_id) DO UPDATE SET
+                 score = LEAST(1, GREATEST(0, topic_scores.score + EXCLUDED.last_delta)),
+                 last_delta = EXCLUDED.last_delta,
+                 last_visited = EXCLUDED.last_visited,
+                 updated_at = EXCLUDED.updated_at
+               RETURNING topic_id""",
+            (profile_id, now, now, topic_ids, values, profile_id),
         )
+        return [r["topic_id"] for r in cur.fetchall()]
 
 
 def get_session(session_id: str) -> dict | None:
+    """Session metadata. Messages live in session_messages; see get_messages."""
     with _cursor() as cur:
         cur.execute(
-            "SELECT id, profile_id, target_role, history, research_context, company, summary, updated_at FROM sessions WHERE id = %s",
+            """SELECT id, profile_id, target_role, research_context, company, summary, summary_upto_seq,
+                      message_count, updated_at
+               FROM sessions WHERE id = %s""",
             (session_id,),
         )
         row = cur.fetchone()
     if not row:
         return None
-    history = row["history"]
-    if not isinstance(history, list):
-        history = json.loads(history) if history else []
     return {
         "id": row["id"],
         "profile_id": row["profile_id"],
         "target_role": row["target_role"],
-        "history": history,
         "research_context": row["research_context"] or "",
         "company": row["company"] or "",
         "summary": row["summary"] or "",
+        "summary_upto_seq": row["summary_upto_seq"] or 0,
+        "message_count": row["message_count"] or 0,
         "updated_at": row["updated_at"].isoformat() + "Z" if hasattr(row["updated_at"], "isoformat") else str(row["updated_at"]),
     }
 
@@ -247,27 +491,229 @@ def get_session(session_id: str) -> dict | None:
 def save_session(
     session_id: str,
     profile_id: str,
-    history: list[dict],
     *,
     target_role: str | None = None,
     research_context: str | None = None,
     company: str | None = None,
     summary: str | None = None,
+    summary_upto_seq: int | None = None,
 ) -> None:
+    """Upsert session metadata. Does not touch messages; summary_upto_seq=None keeps the stored value."""
     now = datetime.utcnow().isoformat() + "Z"
     with _cursor() as cur:
         cur.execute(
-            """INSERT INTO sessions (id, profile_id, target_role, history, research_context, company, summary, updated_at)
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """INSERT INTO sessions (id, profile_id, target_role, research_context, company, summary, summary_upto_seq, updated_at)
+               VALUES (%s, %s, %s, %s, %s, %s, COALESCE(%s, 0), %s)
                ON CONFLICT(id) DO UPDATE SET
-                 profile_id = %s, target_role = %s, history = %s, research_context = %s, company = %s, summary = %s, updated_at = %s""",
+                 profile_id = EXCLUDED.profile_id, target_role = EXCLUDED.target_role,
+                 research_context = EXCLUDED.research_context, company = EXCLUDED.company, summary = EXCLUDED.summary,
+                 summary_upto_seq = COALESCE(%s, sessions.summary_upto_seq), updated_at = EXCLUDED.updated_at""",
             (
-                session_id, profile_id, target_role or "", json.dumps(history), research_context or "", company or "", summary or "", now,
-                profile_id, target_role or "", json.dumps(history), research_context or "", company or "", summary or "", now,
+                session_id, profile_id, target_role or "", research_context or "", company or "", summary or "",
+                summary_upto_seq, now, summary_upto_seq,
             ),
         )
 
 
+_SESSION_FIELDS = ("profile_id", "target_role", "research_context", "company", "summary", "summary_upto_seq")
+
+
+def update_session(session_id: str, fields: dict) -> bool:
+    """Update only the given session columns (see _SESSION_FIELDS). Returns False if the session does not exist."""
+    fields = {k: v for k, v in fields.items() if k in _SESSION_FIELDS}
+    now = datetime.utcnow().isoformat() + "Z"
+    assignments = ", ".join(f"{k} = %s" for k in fields)
+    sql = "UPDATE sessions SET " + (assignments + ", " if assignments else "") + "updated_at = %s WHERE id = %s"
+    with _cursor() as cur:
+        cur.execute(sql, [*fields.values(), now, session_id])
+        return cur.rowcount > 0
+
+
+def update_session_summary(session_id: str, summary: str, upto_seq: int, expected_upto_seq: int) -> bool:
+    """Advance the rolling summary only if nobody else moved summary_upto_seq since it was read."""
+    now = datetime.utcnow().isoformat() + "Z"
+    with _cursor() as cur:
+        cur.execute(
+            """UPDATE sessions SET summary = %s, summary_upto_seq = %s, updated_at = %s
+               WHERE id = %s AND summary_upto_seq = %s""",
+            (summary, upto_seq, now, session_id, expected_upto_seq),
+        )
+        return cur.rowcount > 0
+
+
+def append_messages(session_id: str, messages: list[tuple[str, str]]) -> int:
+    """Append (role, content) messages in one statement. Returns the last seq, or 0 if the session does not exist.
+
+    Seq numbers are allocated from sessions.message_count under its row lock, so concurrent appends
+    to the same session never collide and the cost is independent of history length.
+    """
+    if not messages:
+        return 0
+    now = datetime.utcnow().isoformat() + "Z"
+    roles = [m[0] for m in messages]
+    contents = [m[1] or "" for m in messages]
+    with _cursor() as cur:
+        cur.execute(
+            """WITH s AS (
+                   UPDATE sessions SET message_count = message_count + %s, updated_at = %s
+                   WHERE id = %s RETURNING message_count
+               )
+               INSERT INTO session_messages (session_id, seq, role, content, created_at)
+               SELECT %s, s.message_count - %s + m.ord, m.role, m.content, %s
+               FROM s, unnest(%s::text[], %s::text[]) WITH ORDINALITY AS m(role, content, ord)
+               RETURNING seq""",
+            (len(messages), now, session_id, session_id, len(messages), now, roles, contents),
+        )
+        rows = cur.fetchall()
+    return max((r["seq"] for r in rows), default=0)
+
+
+def get_messages(
+    session_id: str,
+    after_seq: int = 0,
+    upto_seq: int | None = None,
+    last: int | None = None,
+) -> list[dict]:
+    """Range read of messages with after_seq < seq <= upto_seq, in order. last=N keeps only the newest N."""
+    sql = "SELECT seq, role, content FROM session_messages WHERE session_id = %s AND seq > %s"
+    params: list = [session_id, after_seq]
+    if upto_seq is not None:
+        sql += " AND seq <= %s"
+        params.append(upto_seq)
+    if last is not None:
+        sql += " ORDER BY seq DESC LIMIT %s"
+        params.append(last)
+    else:
+        sql += " ORDER BY seq"
+    with _cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    if last is not None:
+        rows = list(reversed(rows))
+    return [{"seq": r["seq"], "role": r["role"], "content": r["content"]} for r in rows]
+
+
+def recent_companies(since_seconds: float) -> list[str]:
+    """Companies targeted by sessions active in the last since_seconds, most recently active first."""
+    with _cursor() as cur:
+        cur.execute(
+            """SELECT company FROM sessions
+               WHERE company IS NOT NULL AND company <> '' AND updated_at > now() - make_interval(secs => %s)
+               GROUP BY company ORDER BY MAX(updated_at) DESC""",
+            (since_seconds,),
+        )
+        return [r["company"] for r in cur.fetchall()]
+
+
+def cache_get(namespace: str, key: str, max_age: float) -> tuple[object, datetime] | None:
+    """(value, created_at) if key is cached and younger than max_age seconds; marks it recently used."""
+    with _cursor() as cur:
+        cur.execute(
+            """UPDATE cache_entries SET accessed_at = now()
+               WHERE namespace = %s AND key = %s AND created_at > now() - make_interval(secs => %s)
+               RETURNING value, created_at""",
+            (namespace, key, max_age),
+        )
+        row = cur.fetchone()
+    return (row["value"], row["created_at"]) if row else None
+
+
+def cache_put(
+    namespace: str, key: str, value, max_age: float, max_bytes: int, created_at: datetime | None = None
+) -> int:
+    """Store value under key, then evict expired entries and least recently used ones beyond max_bytes.
+
+    created_at (default now) is when the value was produced; expiry counts from it. Returns the number
+    of evicted entries.
+    """
+    data = json.dumps(value)
+    with _cursor() as cur:
+        cur.execute(
+            """INSERT INTO cache_entries (namespace, key, value, size_bytes, created_at, accessed_at)
+               VALUES (%s, %s, %s, %s, COALESCE(%s, now()), now())
+               ON CONFLICT (namespace, key) DO UPDATE SET value = EXCLUDED.value,
+                   size_bytes = EXCLUDED.size_bytes, created_at = EXCLUDED.created_at, accessed_at = now()""",
+            (namespace, key, data, len(data), created_at),
+        )
+        cur.execute(
+            """DELETE FROM cache_entries c USING (
+                   SELECT key, created_at,
+                          SUM(size_bytes) OVER (ORDER BY accessed_at DESC, key) AS running
+                   FROM cache_entries WHERE namespace = %s
+               ) r
+               WHERE c.namespace = %s AND c.key = r.key
+                 AND (r.running > %s OR r.created_at <= now() - make_interval(secs => %s))""",
+            (namespace, namespace, max_bytes, max_age),
+        )
+        return cur.rowcount
+
+
+def cache_delete(namespace: str, key: str) -> None:
+    with _cursor() as cur:
+        cur.execute("DELETE FROM cache_entries WHERE namespace = %s AND key = %s", (namespace, key))
+
+
+def cache_stats() -> dict:
+    """{namespace: {"entries": n, "bytes": b}} for all cache namespaces."""
+    with _cursor() as cur:
+        cur.execute("SELECT namespace, COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS bytes FROM cache_entries GROUP BY namespace")
+        rows = cur.fetchall()
+    return {r["namespace"]: {"entries": r["entries"], "bytes": int(r["bytes"])} for r in rows}
+
+
+def index_snippets(rows: list[tuple[str, str, str]]) -> int:
+    """Add (company, source, text) rows to the full-text index; text already indexed is skipped. Returns rows added."""
+    if not rows:
+        return 0
+    values = [(company, source, text, hashlib.sha256(text.encode("utf-8")).hexdigest()) for company, source, text in rows]
+    with _cursor() as cur:
+        execute_values(
+            cur,
+            "INSERT INTO search_snippets (company, source, text, text_hash) VALUES %s ON CONFLICT (text_hash) DO NOTHING",
+            values,
+            page_size=len(values),  # one statement, so rowcount covers every row
+        )
+        return cur.rowcount
+
+
+def search_snippets(company: str, query: str, limit: int) -> list[dict]:
+    """Indexed snippets for company (tagged with it, or mentioning it), best matches for query first.
+
+    query uses web search syntax (e.g. "interview OR rounds"). Returns [{"source", "text", "rank"}].
+    """
+    with _cursor() as cur:
+        cur.execute(
+            """SELECT source, text, ts_rank_cd(tsv, q, 1) AS rank
+               FROM search_snippets, websearch_to_tsquery('english', %s) q
+               WHERE company = %s OR tsv @@ phraseto_tsquery('english', %s)
+               ORDER BY rank DESC, fetched_at DESC
+               LIMIT %s""",
+            (query, company, company, limit),
+        )
+        return [{"source": r["source"], "text": r["text"], "rank": float(r["rank"])} for r in cur.fetchall()]
+
+
+def acquire_lease(name: str, holder: str, ttl: float) -> bool:
+    """Take the named lease for holder for ttl seconds unless another holder has an unexpired one.
+
+    One short statement: no connection or transaction is held while the lease is. Returns True if taken.
+    """
+    with _cursor() as cur:
+        cur.execute(
+            """INSERT INTO leases (name, holder, expires_at) VALUES (%s, %s, now() + make_interval(secs => %s))
+               ON CONFLICT (name) DO UPDATE SET holder = EXCLUDED.holder, expires_at = EXCLUDED.expires_at
+               WHERE leases.expires_at <= now() OR leases.holder = EXCLUDED.holder
+               RETURNING holder""",
+            (name, holder, ttl),
+        )
+        return cur.fetchone() is not None
+
+
+def release_lease(name: str, holder: str) -> None:
+    with _cursor() as cur:
+        cur.execute("DELETE FROM leases WHERE name = %s AND holder = %s", (name, holder))
+
+
 def health_check() -> bool:
     try:
         with _cursor() as cur:
@@ -1,20 +1,26 @@
 """FastAPI app for Studia."""
 
+import asyncio
 import json
 import logging
+import threading
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 import requests
 from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
 from config import AGENT_MODE, BACKEND_ROOT
-from core import agent, context, llm
+from core import agent, context, llm, metrics, ollama
+from core.context_window import tools_tokens
 from db import get_default_profile_id, get_profile, list_profiles, set_default_profile_id
-from services import profile_builder, research, session, tracker
+from core.scheduler import INTERACTIVE, SCHEDULER, SchedulerBusy
+from services import extraction, profile_builder, research, search_index, session, summariser, tracker, uploads, warmup
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
 logger = logging.getLogger(__name__)
@@ -27,8 +33,66 @@ class ChatRequest(BaseModel):
     target_role: str | None = None
 
 
-app = FastAPI(title="Studia")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup/shutdown hooks: warm the DB and model in the background, probe Ollama instances when routing
+    across several, renew research for active companies; close pooled connections and extraction workers
+    on shutdown."""
+    if len(ollama.ROUTER.backends) > 1:
+        ollama.ROUTER.start_probing()
+    threading.Thread(target=warmup.run, name="warmup", daemon=True).start()
+    research.start_refresher()
+    yield
+    research.stop_refresher()
+    warmup.stop()
+    extraction.shutdown()
+    ollama.ROUTER.stop_probing()
+    await ollama.aclose()
+
+
+app = FastAPI(title="Studia", lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+# Allowance for multipart framing and the non-file form fields on top of the files themselves
+MULTIPART_OVERHEAD_BYTES = 256 * 1024
+UPLOAD_TOO_LARGE = "Total upload size exceeded."
+
+
+class UploadLimitMiddleware:
+    """Bound multipart request bodies to max_bytes while they arrive, before Starlette spools the files.
+
+    A larger Content-Length is rejected with 413 before anything is read; a body that grows past the
+    limit anyway is cut off with 413 as soon as it does.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        headers = dict(scope.get("headers") or []) if scope["type"] == "http" else {}
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+        declared = headers.get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            await JSONResponse({"detail": UPLOAD_TOO_LARGE}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised into the form parser; FastAPI passes HTTPException through as the response
+                    raise HTTPException(413, UPLOAD_TOO_LARGE)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=profile_builder.MAX_TOTAL_BYTES + MULTIPART_OVERHEAD_BYTES)
 
 
 @app.middleware("http")
@@ -39,6 +103,16 @@ async def log_requests(request: Request, call_next):
     return response
 
 
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusy):
+    """LLM queue full or wait timed out: fail fast with 503 and Retry-After instead of hanging."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The model is busy. Try again shortly.", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     """Log unhandled exceptions and return generic 500 (no stack trace in response)."""
@@ -50,20 +124,45 @@ def _sse_event(data: dict) -> str:
     return f"data: {json.dumps(data)}\n\n"
 
 
-def _stream_response(messages: list[dict], session_id: str, setup_mode: bool = False):
-    """Unified stream: yields (token, done, tool_info). setup_mode: no profile yet, use setup tools."""
+async def _stream_response(messages: list[dict], sess: session.ChatSession, setup_mode: bool = False):
+    """Unified async stream: yields (token, done, tool_info). setup_mode: no profile yet, use setup tools."""
     if AGENT_MODE:
-        yield from agent.agent_stream(messages, session_id, setup_mode=setup_mode)
+        async for item in agent.agent_stream(messages, sess, setup_mode=setup_mode):
+            yield item
     else:
-        for token, done, _ in llm.stream_completion(messages):
+        async for token, done, _ in llm.stream_completion(messages, affinity=sess.id):
             yield (token, done, None)
 
 
 @app.get("/health")
 def health_endpoint():
-    """Health check for orchestration. Returns 200 and db status."""
-    from db import health_check
-    return {"status": "ok", "db": "ok" if health_check() else "error"}
+    """Health check for orchestration. Returns 200, db status and connection pool counters."""
+    from db import health_check, pool_stats
+    return {"status": "ok", "db": "ok" if health_check() else "error", "db_pool": pool_stats()}
+
+
+@app.get("/ready")
+def ready_endpoint():
+    """Readiness for orchestration: 200 once the DB pool, hot caches and model are warm, else 503."""
+    state = warmup.status()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """In-process counters and latencies (Ollama calls per endpoint, etc.) plus DB pool and cache stats."""
+    from db import cache_stats, pool_stats
+    try:
+        caches = cache_stats()
+    except Exception:
+        caches = {}
+    return {
+        **metrics.snapshot(),
+        "db_pool": pool_stats(),
+        "caches": caches,
+        "ollama_backends": ollama.ROUTER.snapshot(),
+        "llm_scheduler": SCHEDULER.snapshot(),
+    }
 
 
 @app.get("/profile/status")
@@ -87,41 +186,52 @@ async def profile_from_uploads_endpoint(
     resumes: list[UploadFile] = File(default=[]),
     linkedin: UploadFile | None = File(default=None),
     label: str = Form(""),
+    refresh: bool = Form(False),
 ):
-    """Build profile from resume files (PDF, DOCX, TXT) and optional LinkedIn ZIP. Saves to DB."""
+    """Build profile from resume files (PDF, DOCX, TXT) and optional LinkedIn ZIP. Saves to DB.
+
+    refresh=true re-runs extraction even if the same documents were processed before.
+    """
     if not resumes and not linkedin:
         raise HTTPException(400, "Upload at least one resume or a LinkedIn export ZIP.")
 
-    resume_files = []
-    total = 0
+    sources = []
     for f in resumes:
-        data = await f.read()
-        total += len(data)
-        if total > profile_builder.MAX_TOTAL_BYTES:
-            raise HTTPException(400, "Total upload size exceeded.")
         fn = f.filename or "resume"
-        if not fn.lower().endswith((".pdf", ".docx", ".txt")):
+        if not fn.lower().endswith(extraction.RESUME_EXTENSIONS):
             raise HTTPException(400, f"Unsupported resume type: {fn}")
-        resume_files.append((fn, data))
+        sources.append((f.file, fn))
+    has_linkedin = bool(linkedin and linkedin.filename and linkedin.filename.lower().endswith(".zip"))
+    if has_linkedin:
+        sources.append((linkedin.file, linkedin.filename))
 
-    linkedin_bytes = None
-    if linkedin and linkedin.filename and linkedin.filename.lower().endswith(".zip"):
-        linkedin_bytes = await linkedin.read()
-        if len(linkedin_bytes) > profile_builder.MAX_FILE_BYTES:
-            raise HTTPException(400, "LinkedIn ZIP too large.")
+    # Read once in chunks to enforce limits and hash them; extraction reads the uploads' own files
+    try:
+        spooled = await run_in_threadpool(
+            uploads.spool_all, sources, profile_builder.MAX_FILE_BYTES, profile_builder.MAX_TOTAL_BYTES
+        )
+    except uploads.UploadTooLarge as e:
+        raise HTTPException(400, str(e))
+    resume_files = [(u.filename, u) for u in spooled[:len(resumes)]]
+    linkedin_upload = spooled[-1] if has_linkedin else None
 
     try:
-        profile, profile_id = profile_builder.build_profile_from_uploads(
-            resume_files, linkedin_bytes, profile_id=None, label=label or "Profile"
+        profile, profile_id = await run_in_threadpool(
+            profile_builder.build_profile_from_uploads,
+            resume_files, linkedin_upload, profile_id=None, label=label or "Profile", refresh=refresh,
         )
-        if not get_default_profile_id():
-            set_default_profile_id(profile_id)
+        if not await run_in_threadpool(get_default_profile_id):
+            await run_in_threadpool(set_default_profile_id, profile_id)
         return {"ok": True, "profile": profile, "profile_id": profile_id}
     except ValueError as e:
         raise HTTPException(400, str(e))
+    except SchedulerBusy:
+        raise
     except Exception as e:
         logger.exception("Profile creation failed")
         raise HTTPException(500, "Could not create profile.")
+    finally:
+        uploads.close_all(spooled)
 
 
 def _validate_profile_id(profile_id: str) -> None:
@@ -138,82 +248,68 @@ def set_default_profile_endpoint(profile_id: str = Form(...)):
     return {"ok": True}
 
 
-def _chat_stream(message: str, session_id: str, profile_id: str, target_role: str | None, setup_mode: bool):
-    """Inner generator for chat SSE. Caller must have already ensured session and added user message."""
-    session.add_exchange(session_id, "user", message)
-    if setup_mode:
-        sys_prompt = context.build_setup_system_prompt()
-    else:
-        company, research_ctx = session.get_research_context(session_id)
-        sys_prompt = context.build_system_prompt(
-            profile_id=profile_id,
-            research_context=research_ctx,
-            company=company,
-            target_role=target_role,
-        )
-    messages = [
-        {"role": "system", "content": sys_prompt},
-        *[
-            {"role": h["role"], "content": h["content"]}
-            for h in session.get_messages_for_llm(session_id, summarise_fn=llm.summarise_history)
-        ],
-    ]
-    full_response = []
-    try:
-        for token, done, tool_info in _stream_response(messages, session_id, setup_mode=setup_mode):
-            if tool_info:
-                yield _sse_event({"tool_call": tool_info.get("tool"), "args": tool_info.get("args", {})})
-            if token:
-                full_response.append(token)
-                yield _sse_event({"token": token})
-            if done:
-                content = "".join(full_response)
-                if content:
-                    session.add_exchange(session_id, "assistant", content)
-                yield _sse_event({"done": True})
-                session.log_session(session_id)
-                return
-    except requests.exceptions.Timeout:
-        yield _sse_event({"error": "The model took too long to respond. Try a shorter prompt or increase OLLAMA_TIMEOUT in .env."})
-        yield _sse_event({"done": True})
-
-
-@app.post("/chat")
-async def chat_endpoint(request: Request):
-    """Stream LLM response via SSE. Accepts JSON or multipart (with optional files). When no profiles exist (setup mode), profile_id is optional."""
-    content_type = (request.headers.get("content-type") or "").lower()
-    message = ""
-    session_id = "default"
-    profile_id = ""
-    target_role = None
-    files_content: list[tuple[str, bytes]] = []
+async def _chat_stream(message: str, sess: session.ChatSession, setup_mode: bool):
+    """Inner async generator for chat SSE. The session is loaded once by the caller and flushed once here.
 
-    if "multipart/form-data" in content_type:
-        form = await request.form()
-        message = (form.get("message") or "").strip()
-        session_id = (form.get("session_id") or "default").strip() or "default"
-        profile_id = (form.get("profile_id") or "").strip()
-        tr = form.get("target_role")
-        target_role = tr.strip() if (tr and isinstance(tr, str)) else None
-        uploads = form.getlist("files")
-        if not isinstance(uploads, list):
-            uploads = [uploads] if uploads else []
-        for f in uploads:
-            if hasattr(f, "read") and hasattr(f, "filename"):
-                data = await f.read()
-                if data and getattr(f, "filename", None):
-                    files_content.append((f.filename, data))
-    else:
+    Blocking work (prompt assembly, flush) runs in the threadpool; Ollama is streamed
+    with the async client, so an open stream holds no worker thread.
+    """
+    sess.add_message("user", message)
+    try:
+        messages = await run_in_threadpool(_build_llm_messages, sess, setup_mode)
+        full_response = []
         try:
-            body = await request.json()
-        except Exception:
-            raise HTTPException(400, "Invalid JSON body")
-        req = ChatRequest(**body)
-        message = req.message
-        session_id = req.session_id
-        profile_id = req.profile_id or ""
-        target_role = req.target_role
+            async for token, done, tool_info in _stream_response(messages, sess, setup_mode=setup_mode):
+                if tool_info:
+                    yield _sse_event({
+                        "tool_call": tool_info.get("tool"),
+                        "args": tool_info.get("args", {}),
+                        **{k: v for k, v in tool_info.items() if k not in ("tool", "args")},
+                    })
+                if token:
+                    full_response.append(token)
+                    yield _sse_event({"token": token})
+                if done:
+                    content = "".join(full_response)
+                    if content:
+                        sess.add_message("assistant", content)
+                    await run_in_threadpool(sess.flush)
+                    if sess.needs_summary:
+                        summariser.request(sess.id)
+                    yield _sse_event({"done": True})
+                    session.log_session(sess.id)
+                    return
+        except requests.exceptions.Timeout:
+            yield _sse_event({"error": "The model took too long to respond. Try a shorter prompt or increase OLLAMA_TIMEOUT in .env."})
+            yield _sse_event({"done": True})
+        except SchedulerBusy as e:
+            yield _sse_event({"error": "The model is busy. Try again shortly.", "retry_after": e.retry_after})
+            yield _sse_event({"done": True})
+    finally:
+        # Shielded so a client disconnect (task cancellation) still persists the turn
+        await asyncio.shield(run_in_threadpool(sess.flush))
+
+
+def _build_llm_messages(sess: session.ChatSession, setup_mode: bool) -> list[dict]:
+    """System prompt plus managed history for this turn (blocking: DB). The agent's tool schemas count against the budget."""
+    overhead = tools_tokens(agent.tool_list(setup_mode)) if AGENT_MODE else 0
+    if setup_mode:
+        return sess.messages_for_llm(context.build_setup_system_prompt(), overhead=overhead)
+    return sess.messages_for_llm(
+        sess.system_prompt(context.build_system_prompt),
+        sess.session_context(context.build_session_context),
+        overhead=overhead,
+    )
+
 
+def _prepare_chat(
+    message: str,
+    session_id: str,
+    profile_id: str,
+    target_role: str | None,
+    files_content: list[tuple[str, uploads.SpooledUpload]],
+) -> tuple[str, session.ChatSession, bool]:
+    """Blocking part of /chat (file parsing, profile creation, DB). Returns (message, session, setup_mode)."""
     # Append extracted text from attached files to message
     if files_content:
         extracted = profile_builder.extract_text_from_files(files_content)
@@ -234,29 +330,80 @@ async def chat_endpoint(request: Request):
             )
             if not get_default_profile_id():
                 set_default_profile_id(new_id)
-            session.ensure_session(session_id, new_id, target_role)
             profile_id = new_id
             setup_mode = False
             if not message.strip():
                 message = "I've added my resume."
         except ValueError as e:
             raise HTTPException(400, str(e))
+        except SchedulerBusy:
+            raise
         except Exception:
             logger.exception("Profile creation from chat files failed")
             raise HTTPException(500, "Could not create profile from attachments.")
 
     if setup_mode:
         profile_id = ""
-        session.ensure_session(session_id, profile_id, target_role)
     else:
         profile_id = profile_id or get_default_profile_id()
         if not profile_id:
             raise HTTPException(400, "profile_id required when no default profile is set.")
         _validate_profile_id(profile_id)
-        session.ensure_session(session_id, profile_id, target_role)
+    sess = session.load_session(session_id)
+    sess.ensure(profile_id, target_role)
+    return message, sess, setup_mode
+
+
+@app.post("/chat")
+async def chat_endpoint(request: Request):
+    """Stream LLM response via SSE. Accepts JSON or multipart (with optional files). When no profiles exist (setup mode), profile_id is optional."""
+    # Reject before reading uploads or opening the stream when chat turns are already queued to the limit
+    SCHEDULER.admit(INTERACTIVE)
+    content_type = (request.headers.get("content-type") or "").lower()
+    message = ""
+    session_id = "default"
+    profile_id = ""
+    target_role = None
+    files_content: list[tuple[str, uploads.SpooledUpload]] = []
+
+    if "multipart/form-data" in content_type:
+        form = await request.form()
+        message = (form.get("message") or "").strip()
+        session_id = (form.get("session_id") or "default").strip() or "default"
+        profile_id = (form.get("profile_id") or "").strip()
+        tr = form.get("target_role")
+        target_role = tr.strip() if (tr and isinstance(tr, str)) else None
+        attached = form.getlist("files")
+        if not isinstance(attached, list):
+            attached = [attached] if attached else []
+        sources = [(f.file, f.filename) for f in attached if hasattr(f, "file") and getattr(f, "filename", None)]
+        try:
+            spooled = await run_in_threadpool(
+                uploads.spool_all, sources, profile_builder.MAX_FILE_BYTES, profile_builder.MAX_TOTAL_BYTES
+            )
+        except uploads.UploadTooLarge as e:
+            raise HTTPException(400, str(e))
+        files_content = [(u.filename, u) for u in spooled if u.size]
+    else:
+        try:
+            body = await request.json()
+        except Exception:
+            raise HTTPException(400, "Invalid JSON body")
+        req = ChatRequest(**body)
+        message = req.message
+        session_id = req.session_id
+        profile_id = req.profile_id or ""
+        target_role = req.target_role
+
+    try:
+        message, sess, setup_mode = await run_in_threadpool(
+            _prepare_chat, message, session_id, profile_id, target_role, files_content
+        )
+    finally:
+        uploads.close_all([u for _, u in files_content])
 
     return StreamingResponse(
-        _chat_stream(message, session_id, profile_id, target_role, setup_mode),
+        _chat_stream(message, sess, setup_mode),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -273,8 +420,10 @@ def progress_endpoint(profile_id: str | None = None):
 
 
 @app.post("/research")
-def research_endpoint(type: str = Form(...), value: str = Form(...), profile_id: str = Form("")):
-    """Company or JD research. profile_id required for JD for gap analysis."""
+def research_endpoint(
+    type: str = Form(...), value: str = Form(...), profile_id: str = Form(""), refresh: bool = Form(False)
+):
+    """Company or JD research. profile_id required for JD for gap analysis. refresh=true bypasses the JD cache."""
     if type == "company":
         return research.research_company(value)
     if type == "jd":
@@ -282,10 +431,19 @@ def research_endpoint(type: str = Form(...), value: str = Form(...), profile_id:
         if not pid:
             return {"summary": "", "gap_analysis": "Set a profile first.", "topics_to_prioritise": []}
         _validate_profile_id(pid)
-        return research.parse_jd(value, pid)
+        return research.parse_jd(value, pid, refresh=refresh)
     return {"summary": "", "gap_analysis": "", "topics_to_prioritise": []}
 
 
+@app.post("/research/corpus")
+def research_corpus_endpoint(file: UploadFile = File(...)):
+    """Bulk-import interview-experience snippets into the local research index.
+
+    JSON Lines, one {"company", "source", "text"} record per line; company and source are optional.
+    """
+    return search_index.import_corpus(file.file)
+
+
 @app.get("/session/history")
 def session_history_endpoint(session_id: str = "default"):
     """Return conversation history for session."""
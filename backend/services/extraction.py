@@ -0,0 +1,328 @@
+"""Text extraction from uploaded documents (PDF, DOCX, TXT, LinkedIn export ZIP) in worker processes.
+
+pypdf and python-docx are pure Python and CPU-bound, so parsing in the API process holds the GIL and
+stalls every other request in the worker. Each file is parsed in a process of its own, at most
+EXTRACT_WORKERS at a time, all files of an upload in parallel. Each file gets EXTRACT_TIMEOUT seconds
+(a hung parse has its own process killed; other files are unaffected) and PDFs are read up to
+EXTRACT_MAX_PDF_PAGES pages. Failures degrade instead of failing the upload: unreadable PDF pages are
+skipped, a DOCX python-docx cannot open is read from its XML directly, and a file that still yields
+nothing comes back as empty text.
+
+Uploads (services.uploads) are sent to workers over a pipe in chunks straight from the upload's file.
+ZIP members are decompressed as streams under per-member and total limits, so a zip bomb cannot exhaust
+memory.
+
+Extracted text is cached in the "extracted_text" namespace of the DB cache, keyed by the file's sha256,
+so re-uploading the same document (or attaching it to every chat message) skips parsing.
+"""
+
+import csv
+import io
+import logging
+import multiprocessing
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from pathlib import Path
+
+from config import (
+    EXTRACT_CACHE_DAYS,
+    EXTRACT_CACHE_MAX_MB,
+    EXTRACT_MAX_PDF_PAGES,
+    EXTRACT_TIMEOUT,
+    EXTRACT_WORKERS,
+)
+from core import metrics
+from core.cache import ResultCache, make_key
+from services.uploads import CHUNK_BYTES, SpooledUpload, digest
+
+logger = logging.getLogger(__name__)
+
+RESUME_EXTENSIONS = (".pdf", ".docx", ".txt")
+LINKEDIN_EXTENSIONS = (".zip",)
+# Bump when parsing changes so text extracted by the old code is not reused
+EXTRACT_VERSION = "extract:v1"
+# Texts can be large, so only a few are kept in process memory
+TEXT_CACHE = ResultCache(
+    "extracted_text",
+    ttl=EXTRACT_CACHE_DAYS * 86400,
+    max_bytes=EXTRACT_CACHE_MAX_MB * 1024 * 1024,
+    memory_entries=16,
+)
+
+# Decompressed size limits for ZIP members (each, and all together)
+ZIP_MEMBER_MAX_BYTES = 20 * 1024 * 1024
+ZIP_TOTAL_MAX_BYTES = 100 * 1024 * 1024
+
+
+def extract_text_from_pdf(data: bytes, max_pages: int = EXTRACT_MAX_PDF_PAGES) -> str:
+    """Extract text from the first max_pages pages of PDF bytes; pages that fail to parse are skipped."""
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(data), strict=False)
+    total = len(reader.pages)
+    parts = []
+    for i in range(min(total, max_pages)):
+        try:
+            parts.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            continue
+    if total > max_pages:
+        parts.append(f"[... {total - max_pages} more pages not read]")
+    return "\n".join(parts)
+
+
+def extract_text_from_docx(data: bytes) -> str:
+    """Extract text from DOCX bytes, falling back to the raw document XML if python-docx cannot open it."""
+    try:
+        from docx import Document
+        doc = Document(io.BytesIO(data))
+        return "\n".join(p.text for p in doc.paragraphs)
+    except Exception:
+        return _docx_xml_text(data)
+
+
+def _docx_xml_text(data: bytes) -> str:
+    """Paragraph text straight from word/document.xml."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        raw = _read_member(zf, zf.getinfo("word/document.xml"), ZIP_MEMBER_MAX_BYTES)
+    if raw is None:
+        return ""
+    xml = raw.decode("utf-8", errors="replace")
+    xml = xml.replace("</w:p>", "\n")
+    return unescape(re.sub(r"<[^>]+>", "", xml)).strip()
+
+
+def extract_text_from_txt(data: bytes) -> str:
+    """Decode plain text."""
+    return data.decode("utf-8", errors="replace")
+
+
+def _read_member(zf: zipfile.ZipFile, info: zipfile.ZipInfo, limit: int) -> bytes | None:
+    """Decompress one member as a stream; None if it exceeds limit bytes (declared or actual)."""
+    if info.file_size > limit:
+        return None
+    out = bytearray()
+    with zf.open(info) as f:
+        while chunk := f.read(CHUNK_BYTES):
+            out += chunk
+            if len(out) > limit:
+                return None
+    return bytes(out)
+
+
+def extract_text_from_linkedin_zip(data: bytes) -> str:
+    """Extract and concatenate text from LinkedIn export ZIP (CSV/HTML).
+
+    Members larger than ZIP_MEMBER_MAX_BYTES decompressed are skipped; reading stops once
+    ZIP_TOTAL_MAX_BYTES have been decompressed.
+    """
+    parts = []
+    remaining = ZIP_TOTAL_MAX_BYTES
+    with zipfile.ZipFile(io.BytesIO(data), "r") as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if name.startswith("__MACOSX") or "/." in name:
+                continue
+            lower = name.lower()
+            if not (lower.endswith(".csv") or lower.endswith(".html") or lower.endswith(".htm")):
+                continue
+            if remaining <= 0:
+                parts.append("[... remaining files not read: export too large]")
+                break
+            try:
+                limit = min(ZIP_MEMBER_MAX_BYTES, remaining)
+                raw = _read_member(zf, info, limit)
+                if raw is None:
+                    # Charged in full: up to limit bytes may have been decompressed before giving up
+                    parts.append(f"--- {name} ---\n[skipped: too large]")
+                    remaining -= limit
+                    continue
+                remaining -= len(raw)
+                text = raw.decode("utf-8", errors="replace")
+                if lower.endswith(".csv"):
+                    parts.append(f"--- {name} ---\n" + _csv_to_text(text))
+                else:
+                    parts.append(f"--- {name} ---\n" + _html_to_text(text))
+            except Exception:
+                continue
+    return "\n\n".join(parts) if parts else ""
+
+
+def _csv_to_text(raw: str) -> str:
+    """Convert CSV content to readable text."""
+    lines = []
+    try:
+        for row in csv.reader(raw.splitlines()):
+            lines.append(" | ".join(row))
+    except Exception:
+        lines = [raw[:50000]]
+    return "\n".join(lines)
+
+
+def _html_to_text(html: str) -> str:
+    """Strip HTML tags for plain text."""
+    text = re.sub(r"<[^>]+>", " ", html)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text[:50000]
+
+
+def _parse(filename: str, data: bytes, max_pages: int) -> str:
+    """Dispatch by extension."""
+    lower = filename.lower()
+    if lower.endswith(".pdf"):
+        return extract_text_from_pdf(data, max_pages)
+    if lower.endswith(".docx"):
+        return extract_text_from_docx(data)
+    if lower.endswith(".txt"):
+        return extract_text_from_txt(data)
+    if lower.endswith(LINKEDIN_EXTENSIONS):
+        return extract_text_from_linkedin_zip(data)
+    raise ValueError(f"Unsupported document type: {filename}")
+
+
+_context = None
+_context_lock = threading.Lock()
+# At most EXTRACT_WORKERS parses run at once, across all requests
+_slots = threading.BoundedSemaphore(EXTRACT_WORKERS)
+_live: set = set()
+_live_lock = threading.Lock()
+
+
+def _get_context():
+    """forkserver where available: each file's process is forked from a clean server with the parsers
+    preloaded, so starting one is cheap. Never fork: the API process runs DB pool and HTTP client threads."""
+    global _context
+    with _context_lock:
+        if _context is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                _context = multiprocessing.get_context("forkserver")
+                _context.set_forkserver_preload(["pypdf", "docx", __name__])
+            else:
+                _context = multiprocessing.get_context("spawn")
+        return _context
+
+
+def _worker(conn, filename: str, max_pages: int) -> None:
+    """Process entry point: read the file's chunks from conn up to an empty one, then send back
+    (True, text) or (False, error message)."""
+    data = bytearray()
+    while chunk := conn.recv_bytes():
+        data += chunk
+    try:
+        result = (True, _parse(filename, bytes(data), max_pages))
+    except Exception as e:
+        result = (False, f"{type(e).__name__}: {e}")
+    conn.send(result)
+    conn.close()
+
+
+def _parse_in_process(filename: str, data: bytes | SpooledUpload, timeout: float) -> str:
+    """_parse in a process of its own, killed if it has not answered after timeout seconds.
+
+    The content is sent in chunks, so an upload is never held in this process whole. Raises TimeoutError
+    on timeout and RuntimeError if the parse failed or the process died.
+    """
+    ctx = _get_context()
+    conn, child_conn = ctx.Pipe()
+    process = ctx.Process(target=_worker, args=(child_conn, filename, EXTRACT_MAX_PDF_PAGES), daemon=True)
+    with _live_lock:
+        _live.add(process)
+    try:
+        process.start()
+        child_conn.close()
+        start = time.monotonic()
+        try:
+            for chunk in _chunks(data):
+                conn.send_bytes(chunk)
+            conn.send_bytes(b"")
+            if not conn.poll(max(0.0, timeout - (time.monotonic() - start))):
+                raise TimeoutError(f"Text extraction timed out for {filename}")
+            ok, value = conn.recv()
+        except (EOFError, BrokenPipeError):
+            raise RuntimeError("extraction process died") from None
+    finally:
+        conn.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+        with _live_lock:
+            _live.discard(process)
+    if not ok:
+        raise RuntimeError(value)
+    return value
+
+
+def shutdown() -> None:
+    """Kill extractions still running (app shutdown)."""
+    with _live_lock:
+        processes = list(_live)
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+
+
+def is_supported(filename: str) -> bool:
+    return (filename or "").lower().endswith(RESUME_EXTENSIONS + LINKEDIN_EXTENSIONS)
+
+
+def _chunks(data: bytes | SpooledUpload):
+    if isinstance(data, SpooledUpload):
+        yield from data.chunks()
+    else:
+        for i in range(0, len(data), CHUNK_BYTES):
+            yield data[i:i + CHUNK_BYTES]
+
+
+def extract(files: list[tuple[str, bytes | SpooledUpload]]) -> list[str]:
+    """Text of each (filename, data), in order, parsed in parallel; "" for files that fail or time out.
+
+    Files extracted before (same content and type) come from TEXT_CACHE. Raises ValueError for
+    unsupported file types.
+    """
+    for filename, _ in files:
+        if not is_supported(filename):
+            raise ValueError(f"Unsupported document type: {filename}")
+    texts: list[str | None] = [None] * len(files)
+    keys = [_cache_key(filename, data) for filename, data in files]
+    for i, (key, (_, data)) in enumerate(zip(keys, files)):
+        texts[i] = TEXT_CACHE.get(key)
+        if texts[i] is not None:
+            metrics.incr("extract.cache.bytes_saved", len(data))
+    parsed = [i for i, text in enumerate(texts) if text is None]
+    if parsed:
+        start = time.monotonic()
+        with ThreadPoolExecutor(min(len(parsed), EXTRACT_WORKERS)) as threads:
+            for i, text in zip(parsed, threads.map(_extract_one, [files[i] for i in parsed])):
+                texts[i] = text
+        metrics.observe("extract.latency", time.monotonic() - start)
+    # Failures and timeouts come back empty and are not cached, so they are retried on the next upload
+    for i in parsed:
+        if texts[i]:
+            TEXT_CACHE.put(keys[i], texts[i])
+    return [text or "" for text in texts]
+
+
+def _cache_key(filename: str, data: bytes | SpooledUpload) -> str:
+    """Content hash plus everything else that shapes the text: file type, parser version, PDF page limit."""
+    return make_key(EXTRACT_VERSION, Path(filename).suffix.lower(), EXTRACT_MAX_PDF_PAGES, digest(data))
+
+
+def _extract_one(file: tuple[str, bytes | SpooledUpload]) -> str:
+    """Text of one file once an extraction slot is free; "" if it fails or times out."""
+    filename, data = file
+    try:
+        with _slots:
+            text = _parse_in_process(filename, data, EXTRACT_TIMEOUT)
+    except TimeoutError:
+        logger.warning("Text extraction timed out for %s", filename)
+        metrics.incr("extract.timeouts")
+        return ""
+    except Exception as e:
+        logger.warning("Could not extract text from %s: %s", filename, e)
+        metrics.incr("extract.failures")
+        return ""
+    metrics.incr("extract.files")
+    return text
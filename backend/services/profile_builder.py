@@ -1,16 +1,18 @@
 """Build profile from resume and LinkedIn uploads; save via DB repository."""
 
-import csv
 import json
 import re
-import tempfile
-import zipfile
-from pathlib import Path
-
-import requests
-
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL
-from db import ensure_curriculum_from_profile, save_profile
+import time
+
+from config import OLLAMA_TIMEOUT
+from core import ollama
+from core.cache import ResultCache, make_key
+from core.context_window import count_tokens, prompt_budget, truncate_to_tokens
+from core.scheduler import EXTRACTION
+from core.singleflight import Group
+from db import ensure_curriculum_from_profile, get_profile, save_profile
+from services import extraction
+from services.uploads import SpooledUpload, digest
 
 PROFILE_KEYS = {
     "name", "current_role", "consulting", "experience_years", "target_roles",
@@ -21,99 +23,29 @@ PROFILE_KEYS = {
 MAX_FILE_BYTES = 15 * 1024 * 1024  # 15 MB per file
 MAX_TOTAL_BYTES = 50 * 1024 * 1024  # 50 MB total
 
+# Bump when the extraction prompt changes so cached profiles from the old prompt are not reused
+PROFILE_PROMPT_VERSION = "profile:v1"
 
-def extract_text_from_pdf(data: bytes) -> str:
-    """Extract text from PDF bytes."""
-    from pypdf import PdfReader
-    import io
-    reader = PdfReader(io.BytesIO(data))
-    return "\n".join(page.extract_text() or "" for page in reader.pages)
-
-
-def extract_text_from_docx(data: bytes) -> str:
-    """Extract text from DOCX bytes."""
-    import io
-    from docx import Document
-    doc = Document(io.BytesIO(data))
-    return "\n".join(p.text for p in doc.paragraphs)
-
-
-def extract_text_from_txt(data: bytes) -> str:
-    """Decode plain text."""
-    return data.decode("utf-8", errors="replace")
-
-
-def extract_text_from_linkedin_zip(data: bytes) -> str:
-    """Extract and concatenate text from LinkedIn export ZIP (CSV/HTML)."""
-    parts = []
-    with tempfile.TemporaryDirectory() as tmp:
-        path = Path(tmp) / "linkedin.zip"
-        path.write_bytes(data)
-        with zipfile.ZipFile(path, "r") as zf:
-            for name in zf.namelist():
-                if name.startswith("__MACOSX") or "/." in name:
-                    continue
-                lower = name.lower()
-                if not (lower.endswith(".csv") or lower.endswith(".html") or lower.endswith(".htm")):
-                    continue
-                try:
-                    raw = zf.read(name)
-                    text = raw.decode("utf-8", errors="replace")
-                    if lower.endswith(".csv"):
-                        parts.append(f"--- {name} ---\n" + _csv_to_text(text))
-                    else:
-                        parts.append(f"--- {name} ---\n" + _html_to_text(text))
-                except Exception:
-                    continue
-    return "\n\n".join(parts) if parts else ""
+_PROFILE_FLIGHT = Group("profile", lock_timeout=OLLAMA_TIMEOUT)
+# Upload key -> id of the profile just built from it, so a worker that waited on another worker's
+# identical build returns that profile instead of saving a second one. Only builds that finished after
+# the caller asked are reused, and only kept as long as such a wait.
+_RECENT_BUILDS = ResultCache("profile_builds", ttl=OLLAMA_TIMEOUT * 2, max_bytes=1024 * 1024)
 
 
-def _csv_to_text(raw: str) -> str:
-    """Convert CSV content to readable text."""
-    lines = []
-    try:
-        for row in csv.reader(raw.splitlines()):
-            lines.append(" | ".join(row))
-    except Exception:
-        lines = [raw[:50000]]
-    return "\n".join(lines)
-
-
-def _html_to_text(html: str) -> str:
-    """Strip HTML tags for plain text."""
-    text = re.sub(r"<[^>]+>", " ", html)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text[:50000]
-
-
-def _extract_resume(data: bytes, filename: str) -> str:
-    """Dispatch resume extraction by extension."""
-    lower = filename.lower()
-    if lower.endswith(".pdf"):
-        return extract_text_from_pdf(data)
-    if lower.endswith(".docx"):
-        return extract_text_from_docx(data)
-    if lower.endswith(".txt"):
-        return extract_text_from_txt(data)
-    raise ValueError(f"Unsupported resume type: {filename}")
-
-
-def extract_text_from_files(files: list[tuple[str, bytes]]) -> str:
-    """Extract and concatenate text from PDF, DOCX, TXT files. Skips unsupported types."""
-    parts = []
-    for filename, data in files:
-        lower = (filename or "").lower()
-        if not (lower.endswith(".pdf") or lower.endswith(".docx") or lower.endswith(".txt")):
-            continue
-        try:
-            parts.append(f"--- {filename} ---\n" + _extract_resume(data, filename))
-        except Exception:
-            continue
+def extract_text_from_files(files: list[tuple[str, bytes | SpooledUpload]]) -> str:
+    """Extract and concatenate text from PDF, DOCX, TXT files, parsed in parallel. Skips unsupported types and files with no text."""
+    supported = [(filename, data) for filename, data in files if (filename or "").lower().endswith(extraction.RESUME_EXTENSIONS)]
+    texts = extraction.extract(supported)
+    parts = [f"--- {filename} ---\n{text}" for (filename, _), text in zip(supported, texts) if text.strip()]
     return "\n\n".join(parts) if parts else ""
 
 
-def _call_ollama_for_profile(combined: str) -> dict:
-    """Call Ollama to fill profile schema from combined resume + LinkedIn text."""
+def _call_ollama_for_profile(combined: str, refresh: bool = False) -> dict:
+    """Call Ollama to fill profile schema from combined resume + LinkedIn text.
+
+    Re-uploading the same documents is served from the LLM result cache unless refresh=True.
+    """
     schema_desc = json.dumps({
         "name": "string",
         "current_role": "string",
@@ -139,16 +71,11 @@ Rules:
 - Be specific; use the person's actual roles, companies, and skills.
 
 Input text:
-{combined[:60000]}"""
+"""
+    # The model's window is fixed (core.context_window), so long uploads are cut to what fits
+    prompt += truncate_to_tokens(combined, prompt_budget(count_tokens(prompt)))
 
-    url = f"{OLLAMA_BASE_URL}/api/generate"
-    r = requests.post(
-        url,
-        json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
-        timeout=120,
-    )
-    r.raise_for_status()
-    response_text = r.json().get("response", "").strip()
+    response_text = ollama.generate(prompt, job=EXTRACTION, cache=PROFILE_PROMPT_VERSION, refresh=refresh).strip()
 
     # Allow JSON inside markdown code block
     match = re.search(r"```(?:json)?\s*([\s\S]*?)```", response_text)
@@ -182,24 +109,71 @@ Input text:
 
 
 def build_profile_from_uploads(
-    resume_files: list[tuple[str, bytes]],
-    linkedin_zip_bytes: bytes | None,
+    resume_files: list[tuple[str, bytes | SpooledUpload]],
+    linkedin_zip_bytes: bytes | SpooledUpload | None,
     profile_id: str | None = None,
     label: str = "",
+    refresh: bool = False,
+) -> tuple[dict, str]:
+    """Build profile dict from resume file list and optional LinkedIn ZIP. Saves via DB repo. Returns (profile_dict, profile_id).
+
+    Concurrent identical uploads share one build (and one saved profile) within this worker. Across
+    workers they are serialised, and the later one returns the profile the first one saved while it
+    waited. Uploading the same files again later builds a new profile; refresh=True never reuses one.
+    """
+    requested = time.time()
+    key = make_key(
+        [(filename, digest(data)) for filename, data in resume_files],
+        digest(linkedin_zip_bytes) if linkedin_zip_bytes else "",
+        profile_id or "",
+        label or "",
+        refresh,
+    )
+    return _PROFILE_FLIGHT.do(
+        key,
+        lambda: _build_profile_from_uploads(key, requested, resume_files, linkedin_zip_bytes, profile_id, label, refresh),
+        recheck=None if refresh else lambda: _existing_build(key, requested),
+    )
+
+
+def _existing_build(key: str, since: float) -> tuple[dict, str] | None:
+    """(profile, profile_id) built from the same uploads by a build that finished after since (epoch seconds)."""
+    hit = _RECENT_BUILDS.get_entry(key)
+    if hit is None:
+        return None
+    built_id, age = hit
+    if time.time() - age < since:
+        return None
+    profile = get_profile(built_id)
+    return (profile["data"], built_id) if profile else None
+
+
+def _build_profile_from_uploads(
+    key: str,
+    requested: float,
+    resume_files: list[tuple[str, bytes | SpooledUpload]],
+    linkedin_zip_bytes: bytes | SpooledUpload | None,
+    profile_id: str | None,
+    label: str,
+    refresh: bool,
 ) -> tuple[dict, str]:
-    """Build profile dict from resume file list and optional LinkedIn ZIP. Saves via DB repo. Returns (profile_dict, profile_id)."""
-    resume_texts = []
     for filename, data in resume_files:
         if len(data) > MAX_FILE_BYTES:
             raise ValueError(f"File too large: {filename}")
-        text = _extract_resume(data, filename)
-        resume_texts.append(f"--- Resume ({filename}) ---\n{text}")
+        if not filename.lower().endswith(extraction.RESUME_EXTENSIONS):
+            raise ValueError(f"Unsupported resume type: {filename}")
+    if linkedin_zip_bytes and len(linkedin_zip_bytes) > MAX_FILE_BYTES:
+        raise ValueError("LinkedIn ZIP too large")
 
-    linkedin_text = ""
+    # Resumes and the LinkedIn export are parsed in parallel; unreadable files come back empty
+    documents = list(resume_files)
     if linkedin_zip_bytes:
-        if len(linkedin_zip_bytes) > MAX_FILE_BYTES:
-            raise ValueError("LinkedIn ZIP too large")
-        linkedin_text = extract_text_from_linkedin_zip(linkedin_zip_bytes)
+        documents.append(("linkedin.zip", linkedin_zip_bytes))
+    texts = extraction.extract(documents)
+    resume_texts = [
+        f"--- Resume ({filename}) ---\n{text}" for (filename, _), text in zip(resume_files, texts) if text.strip()
+    ]
+    linkedin_text = texts[-1] if linkedin_zip_bytes else ""
 
     combined = "Resumes:\n\n" + "\n\n".join(resume_texts)
     if linkedin_text:
@@ -208,7 +182,12 @@ def build_profile_from_uploads(
     if not combined.strip() or combined.strip() == "Resumes:":
         raise ValueError("No extractable text from uploads")
 
-    profile = _call_ollama_for_profile(combined)
+    profile = _call_ollama_for_profile(combined, refresh=refresh)
+    # Another worker may have finished the same build while this one waited past the lease timeout
+    existing = None if refresh else _existing_build(key, requested)
+    if existing is not None:
+        return existing
     saved_id = save_profile(profile_id, label or "Profile", profile)
+    _RECENT_BUILDS.put(key, saved_id)
     ensure_curriculum_from_profile(profile)
     return profile, saved_id
@@ -1,100 +1,383 @@
-"""Company/JD research via ddgs and Ollama summarisation."""
+"""Company/JD research via ddgs and Ollama summarisation.
+
+Company research reads the local snippet index first (services.search_index) and searches the web only
+when the index has too few snippets for the company; web results are added to the index.
+
+Company research is served stale-while-revalidate: past RESEARCH_CACHE_DAYS an entry is still returned
+at once while a background worker renews it; only past RESEARCH_CACHE_MAX_STALE_DAYS (or when missing)
+does research run inline. A periodic refresher also renews research for companies of active sessions.
+"""
 
 import json
-from datetime import datetime, timedelta
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 
 from config import (
     BACKEND_ROOT,
-    OLLAMA_BASE_URL,
-    OLLAMA_MODEL,
     RESEARCH_CACHE_DAYS,
+    RESEARCH_CACHE_MAX_MB,
+    RESEARCH_CACHE_MAX_STALE_DAYS,
+    RESEARCH_LOCAL_MIN_SNIPPETS,
     RESEARCH_MAX_SOURCES,
+    RESEARCH_QUERY_TIMEOUT,
+    RESEARCH_REFRESH_ACTIVE_DAYS,
+    RESEARCH_REFRESH_INTERVAL,
+    RESEARCH_SEARCH_TIMEOUT,
+    RESEARCH_SNIPPET_TOKEN_BUDGET,
+    RESEARCH_TOOL_TIMEOUT,
+)
+from core import metrics, ollama
+from core.cache import ResultCache
+from core.scheduler import BACKGROUND, EXTRACTION
+from core.singleflight import Group
+from db import recent_companies
+from services import search_index, snippets
+
+logger = logging.getLogger(__name__)
+
+# Company research lives in the "research" namespace of the DB cache, keyed by normalised company name.
+# Entries can be rewritten by another worker, so the in-process copy is only trusted briefly.
+# The cache keeps entries until hard expiry; soft expiry (SOFT_TTL) is applied on read.
+SOFT_TTL = RESEARCH_CACHE_DAYS * 86400
+RESEARCH_CACHE = ResultCache(
+    "research",
+    ttl=max(RESEARCH_CACHE_MAX_STALE_DAYS, RESEARCH_CACHE_DAYS) * 86400,
+    max_bytes=RESEARCH_CACHE_MAX_MB * 1024 * 1024,
+    memory_ttl=60,
 )
 
-CACHE_PATH = BACKEND_ROOT / "sessions" / "research_cache.json"
-CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+# Pre-DB cache file, imported once into RESEARCH_CACHE and then renamed
+LEGACY_CACHE_PATH = BACKEND_ROOT / "sessions" / "research_cache.json"
+
+# Bump when the parse_jd prompt changes so cached results from the old prompt are not reused
+JD_PROMPT_VERSION = "parse_jd:v2"
+# Job description text beyond this is not sent to the model
+JD_MAX_CHARS = 8000
+
+_RESEARCH_FLIGHT = Group("research", lock_timeout=RESEARCH_TOOL_TIMEOUT)
+
+
+_legacy_imported = False
+_legacy_lock = threading.Lock()
+
+
+def _import_legacy_cache() -> None:
+    """One-time import of sessions/research_cache.json, keeping each entry's fetched_at for expiry.
+
+    The file is renamed to research_cache.json.imported once every entry is stored; on a DB error
+    the import is retried on the next call.
+    """
+    global _legacy_imported
+    if _legacy_imported:
+        return
+    with _legacy_lock:
+        if _legacy_imported:
+            return
+        if not LEGACY_CACHE_PATH.exists():
+            _legacy_imported = True
+            return
+        try:
+            with open(LEGACY_CACHE_PATH, encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read legacy research cache %s: %s", LEGACY_CACHE_PATH, e)
+            _legacy_imported = True
+            return
+        ok = True
+        for company, entry in legacy.items():
+            try:
+                fetched = datetime.fromisoformat(entry["fetched_at"]).astimezone()
+            except (KeyError, TypeError, ValueError):
+                continue
+            ok = RESEARCH_CACHE.put(_company_key(company), entry, created_at=fetched) and ok
+        if not ok:
+            return
+        try:
+            LEGACY_CACHE_PATH.replace(LEGACY_CACHE_PATH.with_name(LEGACY_CACHE_PATH.name + ".imported"))
+        except FileNotFoundError:
+            pass  # another worker imported it first
+        _legacy_imported = True
+        logger.info("Imported %d research cache entries from %s", len(legacy), LEGACY_CACHE_PATH)
+
+
+# (source name, query template) searched for each company
+SOURCES = [
+    ("leetcode", "site:leetcode.com/discuss {company} interview experience"),
+    ("blind", "site:teamblind.com {company} interview"),
+    ("glassdoor", "{company} software engineer interview questions site:glassdoor.com"),
+    ("github", "{company} interview prep questions site:github.com"),
+]
+# A source failing this many times in a row is skipped for SOURCE_COOLDOWN seconds
+SOURCE_FAILURE_LIMIT = 3
+SOURCE_COOLDOWN = 600.0
+
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="research-search")
+
 
+class _SourceStats:
+    """Per-source latency (moving average) and consecutive failures, used to order and skip sources."""
 
-def _load_cache() -> dict:
-    if CACHE_PATH.exists():
-        with open(CACHE_PATH, encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: dict[str, float] = {}
+        self._failures: dict[str, int] = {}
+        self._skip_until: dict[str, float] = {}
 
+    def record(self, source: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            prev = self._latency.get(source, seconds)
+            self._latency[source] = 0.7 * prev + 0.3 * seconds
+            self._failures[source] = 0 if ok else self._failures.get(source, 0) + 1
+            if self._failures[source] >= SOURCE_FAILURE_LIMIT:
+                self._skip_until[source] = time.monotonic() + SOURCE_COOLDOWN
+                self._failures[source] = 0
+                metrics.incr(f"research.source.{source}.cooldowns")
 
-def _save_cache(cache: dict) -> None:
-    with open(CACHE_PATH, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2)
+    def ordered(self, sources: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Sources not in cooldown, fastest and most reliable first (unmeasured ones keep their place)."""
+        now = time.monotonic()
+        with self._lock:
+            live = [s for s in sources if self._skip_until.get(s[0], 0) <= now]
+            return sorted(live, key=lambda s: (self._failures.get(s[0], 0), self._latency.get(s[0], 0.0)))
 
 
-def _search(query: str, max_results: int = 5) -> list[dict]:
-    """Search via ddgs."""
+SOURCE_STATS = _SourceStats()
+
+
+def _search(query: str, max_results: int = 5, timeout: float = RESEARCH_QUERY_TIMEOUT) -> list[str]:
+    """Search via ddgs. Raises on errors so callers can record them."""
+    from ddgs import DDGS
+    results = list(DDGS(timeout=max(int(timeout), 1)).text(query, max_results=max_results))
+    return [r.get("body", "") or r.get("title", "") for r in results]
+
+
+def _search_source(source: str, query: str, max_results: int, deadline: float) -> list[str]:
+    """One source's search with stats. Finishing after deadline (the fan-out gave up on it) counts as a failure."""
+    start = time.monotonic()
     try:
-        from ddgs import DDGS
-        results = list(DDGS().text(query, max_results=max_results))
-        return [r.get("body", "") or r.get("title", "") for r in results]
-    except Exception:
+        results = _search(query, max_results=max_results)
+    except Exception as e:
+        SOURCE_STATS.record(source, time.monotonic() - start, ok=False)
+        metrics.incr(f"research.source.{source}.errors")
+        logger.debug("Search failed for %s: %s", source, e)
         return []
+    end = time.monotonic()
+    elapsed = end - start
+    SOURCE_STATS.record(source, elapsed, ok=end <= deadline)
+    metrics.observe(f"research.source.{source}.latency", elapsed)
+    if not results:
+        metrics.incr(f"research.source.{source}.empty")
+    return results
+
+
+def search_sources(company: str, max_results: int = 3) -> dict[str, list[str]]:
+    """Query all live sources concurrently. Returns {source: snippets} in priority order.
+
+    Sources that miss the overall RESEARCH_SEARCH_TIMEOUT are left out (their threads finish in the
+    background and count as failures); the rest are returned as partial results.
+    """
+    sources = SOURCE_STATS.ordered(SOURCES)[:RESEARCH_MAX_SOURCES]
+    deadline = time.monotonic() + RESEARCH_SEARCH_TIMEOUT
+    futures = {
+        _search_pool.submit(_search_source, name, template.format(company=company), max_results, deadline): name
+        for name, template in sources
+    }
+    with metrics.timed("research.search"):
+        done, not_done = wait(futures, timeout=RESEARCH_SEARCH_TIMEOUT)
+    for fut in not_done:
+        fut.cancel()
+        metrics.incr(f"research.source.{futures[fut]}.timeouts")
+    by_name = {futures[f]: f.result() for f in done}
+    return {name: by_name[name] for name, _ in sources if by_name.get(name)}
+
+
+# Role the summary is written for; its terms also rank snippets
+RESEARCH_ROLE = "backend/AI engineering"
 
 
 def _summarise_with_ollama(text: str, company: str) -> str:
-    """Use Ollama to summarise scraped content."""
-    import requests
-    prompt = f"""Summarise the interview process at {company} for backend/AI engineering roles.
+    """Use Ollama to summarise scraped content (already packed into RESEARCH_SNIPPET_TOKEN_BUDGET)."""
+    prompt = f"""Summarise the interview process at {company} for {RESEARCH_ROLE} roles.
 Cover: number of rounds, types of rounds, technical topics commonly asked,
 difficulty level, any patterns or tips. Be specific and concise.
 Keep it under 300 words.
 
 Raw content:
-{text[:8000]}"""
+{text}"""
+
+    return ollama.generate(prompt, job=BACKGROUND)
+
+
+def _company_key(company: str) -> str:
+    """Normalised company name: case and whitespace do not matter."""
+    return search_index.normalise_company(company)
+
+
+def _lookup(key: str) -> tuple[dict, float] | None:
+    """(result, age in seconds) for company key if not past hard expiry, else None."""
+    _import_legacy_cache()
+    hit = RESEARCH_CACHE.get_entry(key)
+    if hit is None:
+        return None
+    entry, age = hit
+    result = {
+        "summary": entry.get("summary", ""),
+        "gap_analysis": entry.get("gap_analysis", ""),
+        "topics_to_prioritise": entry.get("topics_to_prioritise", []),
+    }
+    return result, age
 
-    url = f"{OLLAMA_BASE_URL}/api/generate"
-    r = requests.post(
-        url,
-        json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
-        timeout=120,
-    )
-    r.raise_for_status()
-    return r.json().get("response", "")
+
+def _fresh_research(key: str) -> dict | None:
+    """Cached result for company key if younger than RESEARCH_CACHE_DAYS, else None."""
+    hit = _lookup(key)
+    return hit[0] if hit is not None and hit[1] < SOFT_TTL else None
 
 
 def research_company(company: str) -> dict:
-    """Research company interview process. Returns cached if fresh."""
-    cache = _load_cache()
-    key = company.lower().strip()
-    entry = cache.get(key, {})
-    fetched = entry.get("fetched_at")
-    if fetched:
+    """Research company interview process. Returns cached if present; stale entries are refreshed in the background.
+
+    Concurrent requests for the same company (in this or another worker) share one search-and-summarise run.
+    """
+    key = _company_key(company)
+    hit = _lookup(key)
+    if hit is not None:
+        result, age = hit
+        if age >= SOFT_TTL:
+            metrics.incr("research.stale_served")
+            refresh_in_background(company)
+        return result
+    return _RESEARCH_FLIGHT.do(key, lambda: _research_company(company, key), recheck=lambda: _fresh_research(key))
+
+
+def refresh_company(company: str) -> bool:
+    """Re-research company unless its entry is fresh (another worker may have renewed it). Returns True if renewed.
+
+    Refreshes always search the web, so the local index keeps growing for companies in use.
+    """
+    key = _company_key(company)
+    if _fresh_research(key) is not None:
+        return False
+    _RESEARCH_FLIGHT.do(
+        key, lambda: _research_company(company, key, local_first=False), recheck=lambda: _fresh_research(key)
+    )
+    metrics.incr("research.refreshes")
+    return True
+
+
+_refresh_queue: "queue.Queue[str]" = queue.Queue()
+_refresh_queued: set[str] = set()
+_refresh_lock = threading.Lock()
+_refresh_worker: threading.Thread | None = None
+
+
+def refresh_in_background(company: str) -> None:
+    """Queue a refresh of company's research. Returns immediately; duplicates are coalesced until it finishes."""
+    global _refresh_worker
+    key = _company_key(company)
+    with _refresh_lock:
+        if key in _refresh_queued:
+            return
+        _refresh_queued.add(key)
+        if _refresh_worker is None or not _refresh_worker.is_alive():
+            _refresh_worker = threading.Thread(target=_run_refreshes, name="research-refresh", daemon=True)
+            _refresh_worker.start()
+    _refresh_queue.put(company)
+    metrics.set_gauge("research.refresh_queue_depth", _refresh_queue.qsize())
+
+
+def _run_refreshes() -> None:
+    while True:
+        company = _refresh_queue.get()
+        metrics.set_gauge("research.refresh_queue_depth", _refresh_queue.qsize())
         try:
-            dt = datetime.fromisoformat(fetched)
-            if datetime.now() - dt < timedelta(days=RESEARCH_CACHE_DAYS):
-                return {
-                    "summary": entry.get("summary", ""),
-                    "gap_analysis": entry.get("gap_analysis", ""),
-                    "topics_to_prioritise": entry.get("topics_to_prioritise", []),
-                }
+            with metrics.timed("research.refresh_latency"):
+                refresh_company(company)
         except Exception:
-            pass
-
-    snippets = []
-    queries = [
-        f"site:leetcode.com/discuss {company} interview experience",
-        f"site:teamblind.com {company} interview",
-        f"{company} software engineer interview questions site:glassdoor.com",
-        f"{company} interview prep questions site:github.com",
-    ]
-    for q in queries[:RESEARCH_MAX_SOURCES]:
-        snippets.extend(_search(q, max_results=3))
-
-    text = "\n\n".join(snippets[:RESEARCH_MAX_SOURCES * 2])
-    summary = _summarise_with_ollama(text, company) if text else "No data found."
-
-    cache[key] = {
-        "fetched_at": datetime.now().isoformat(),
-        "summary": summary,
-        "sources_used": ["leetcode", "blind", "glassdoor", "github"],
-    }
-    _save_cache(cache)
+            metrics.incr("research.refresh_errors")
+            logger.exception("Background research refresh failed for %s", company)
+        finally:
+            with _refresh_lock:
+                _refresh_queued.discard(_company_key(company))
+
+
+def refresh_active_companies() -> int:
+    """Queue refreshes for companies of sessions active in the last RESEARCH_REFRESH_ACTIVE_DAYS whose
+    research is missing or within 20% of soft expiry. Returns the number queued."""
+    queued = 0
+    seen: set[str] = set()
+    for company in recent_companies(RESEARCH_REFRESH_ACTIVE_DAYS * 86400):
+        key = _company_key(company)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        hit = _lookup(key)
+        if hit is None or hit[1] >= SOFT_TTL * 0.8:
+            refresh_in_background(company)
+            queued += 1
+    return queued
+
+
+_refresher_stop = threading.Event()
+
+
+def start_refresher() -> None:
+    """Start the periodic refresher thread (no-op when RESEARCH_REFRESH_INTERVAL is 0)."""
+    if RESEARCH_REFRESH_INTERVAL <= 0:
+        return
+    _refresher_stop.clear()
+    threading.Thread(target=_refresher_loop, name="research-refresher", daemon=True).start()
+
+
+def stop_refresher() -> None:
+    _refresher_stop.set()
+
+
+def _refresher_loop() -> None:
+    while not _refresher_stop.wait(RESEARCH_REFRESH_INTERVAL):
+        try:
+            metrics.incr("research.refresh_scheduled", refresh_active_companies())
+        except Exception:
+            logger.exception("Research refresher failed")
+
+
+def _gather_snippets(company: str, local_first: bool) -> tuple[list[str], list[str]]:
+    """(candidate snippets, sources used) for company: the local index if it has enough, else local plus web results."""
+    # More candidates than fit the summary prompt; snippet selection keeps the best
+    local = search_index.search(company, RESEARCH_MAX_SOURCES * 4)
+    if local_first and len(local) >= RESEARCH_LOCAL_MIN_SNIPPETS:
+        metrics.incr("research.local_hits")
+        return [r["text"] for r in local], sorted({r["source"] for r in local})
+    metrics.incr("research.web_searches")
+    results = search_sources(company, max_results=3)
+    for source, source_snippets in results.items():
+        search_index.add(company, source, source_snippets)
+    web = [snippet for source_snippets in results.values() for snippet in source_snippets]
+    return web + [r["text"] for r in local], list(results)
+
+
+def _research_company(company: str, key: str, local_first: bool = True) -> dict:
+    candidates, sources_used = _gather_snippets(company, local_first)
+    selected = snippets.select(candidates, company, RESEARCH_ROLE, RESEARCH_SNIPPET_TOKEN_BUDGET)
+
+    text = "\n\n".join(selected)
+    summary = _summarise_with_ollama(text, company) if text else ""
+
+    if summary:
+        RESEARCH_CACHE.put(key, {
+            "fetched_at": datetime.now().isoformat(),
+            "summary": summary,
+            "sources_used": sources_used,
+        })
+    else:
+        # Sources down or nothing relevant: not cached, so the next request searches again
+        # (an existing stale entry is kept and still served)
+        metrics.incr("research.empty")
+        summary = "No data found."
 
     return {
         "summary": summary,
@@ -103,16 +386,17 @@ def research_company(company: str) -> dict:
     }
 
 
-def parse_jd(jd_text: str, profile_id: str) -> dict:
-    """Parse job description and return gap analysis. Uses profile from DB."""
-    import requests
+def parse_jd(jd_text: str, profile_id: str, refresh: bool = False) -> dict:
+    """Parse job description and return gap analysis. Uses profile from DB.
 
+    Identical JD + profile inputs are served from the LLM result cache; refresh=True forces a new call.
+    """
     from db import get_profile
 
     profile_obj = get_profile(profile_id)
     profile = (profile_obj or {}).get("data") or {}
 
-    prompt = f"""Extract from this job description:
+    prompt = f"""Extract from the job description below:
 - Required technical skills
 - Nice-to-have skills
 - Seniority signals
@@ -123,16 +407,13 @@ Then cross-reference against this profile:
 
 Provide gap analysis: what should the candidate focus on given this JD?
 Output format: summary (2-3 sentences), topics_to_prioritise (list of topic IDs from: python.internals.gil, dsa.dp.2d_patterns, system_design.rate_limiter, ml.llm.rag_pipeline, etc.)
-Keep response under 200 words."""
+Keep response under 200 words.
 
-    url = f"{OLLAMA_BASE_URL}/api/generate"
-    r = requests.post(
-        url,
-        json={"model": OLLAMA_MODEL, "prompt": prompt, "stream": False},
-        timeout=120,
-    )
-    r.raise_for_status()
-    resp = r.json().get("response", "")
+Job description:
+{jd_text[:JD_MAX_CHARS]}"""
+
+    # The cache key covers the whole prompt, i.e. this JD and this profile
+    resp = ollama.generate(prompt, job=EXTRACTION, cache=JD_PROMPT_VERSION, refresh=refresh)
     return {
         "summary": resp[:500],
         "gap_analysis": resp,
@@ -0,0 +1,100 @@
+"""Local full-text index of interview-experience snippets (Postgres tsvector + GIN index).
+
+Every snippet research fetches from the web is added, and corpora can be imported in bulk, so company
+research can be answered from the index, in milliseconds and without network, once it covers a company.
+"""
+
+import json
+import logging
+from typing import Iterable
+
+from core import metrics
+from db import index_snippets, search_snippets
+
+logger = logging.getLogger(__name__)
+
+# Ranks snippets about the interview process above incidental mentions of the company
+RELEVANCE_QUERY = "interview OR interviews OR rounds OR questions OR onsite OR recruiter OR offer"
+# Shorter snippets (titles, link text) carry no useful content
+MIN_SNIPPET_CHARS = 40
+IMPORT_BATCH = 500
+
+
+def normalise_company(company: str) -> str:
+    """Normalised company name: case and whitespace do not matter."""
+    return " ".join(company.lower().split())
+
+
+def _clean(text: str) -> str:
+    """text without NUL characters (Postgres TEXT rejects them) and surrounding whitespace."""
+    return text.replace("\x00", "").strip()
+
+
+def add(company: str, source: str, snippets: Iterable[str]) -> int:
+    """Index snippets fetched for company from source. Returns the number newly added (0 on DB errors)."""
+    key = normalise_company(_clean(company))
+    texts = (_clean(s) for s in snippets if s)
+    rows = [(key, _clean(source), text) for text in texts if len(text) >= MIN_SNIPPET_CHARS]
+    try:
+        added = index_snippets(rows)
+    except Exception as e:
+        logger.warning("Could not index snippets for %s: %s", company, e)
+        return 0
+    metrics.incr("search_index.added", added)
+    return added
+
+
+def search(company: str, limit: int) -> list[dict]:
+    """Best indexed snippets for company, [{"source", "text", "rank"}]. Empty on DB errors."""
+    try:
+        with metrics.timed("search_index.search"):
+            return search_snippets(normalise_company(company), RELEVANCE_QUERY, limit)
+    except Exception as e:
+        logger.warning("Local search failed for %s: %s", company, e)
+        return []
+
+
+def import_corpus(lines: Iterable[str | bytes]) -> dict:
+    """Bulk-import JSON Lines records {"company", "source", "text"} (company and source optional).
+
+    Returns {"indexed": n, "skipped": m, "failed": k}; malformed, too short and already indexed records
+    are skipped, and records in a batch the DB rejected are counted as failed while the import goes on.
+    """
+    indexed = skipped = failed = 0
+    batch: list[tuple[str, str, str]] = []
+
+    def flush():
+        nonlocal indexed, skipped, failed, batch
+        try:
+            added = index_snippets(batch)
+        except Exception as e:
+            logger.warning("Could not index a batch of %d imported snippets: %s", len(batch), e)
+            metrics.incr("search_index.import_failed", len(batch))
+            failed += len(batch)
+        else:
+            indexed += added
+            skipped += len(batch) - added
+        batch = []
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            text = _clean(str(record["text"]))
+        except (ValueError, TypeError, KeyError):
+            skipped += 1
+            continue
+        if len(text) < MIN_SNIPPET_CHARS:
+            skipped += 1
+            continue
+        company = normalise_company(_clean(str(record.get("company") or "")))
+        batch.append((company, _clean(str(record.get("source") or "")) or "import", text))
+        if len(batch) >= IMPORT_BATCH:
+            flush()
+    if batch:
+        flush()
+    metrics.incr("search_index.imported", indexed)
+    return {"indexed": indexed, "skipped": skipped, "failed": failed}
@@ -1,126 +1,178 @@
-"""Session state and history with context window management. Persisted via DB repository."""
-
-from config import LOG_SESSIONS, MAX_HISTORY_EXCHANGES
-from db import get_session as _db_get, save_session as _db_save
-
-
-def ensure_session(session_id: str, profile_id: str, target_role: str | None = None) -> None:
-    """Create or update session with profile_id and target_role. Call at start of chat."""
-    s = _db_get(session_id)
-    if s is None:
-        _db_save(session_id, profile_id, [], target_role=target_role)
-    else:
-        _db_save(
-            session_id,
-            profile_id,
-            s["history"],
-            target_role=target_role or s.get("target_role"),
-            research_context=s.get("research_context"),
-            company=s.get("company"),
-            summary=s.get("summary"),
+"""Session state and history with context window management. Persisted via DB repository.
+
+A /chat request works on one ChatSession: loaded once, mutated in memory, flushed once at the end.
+The module-level functions read session state and history outside a chat request.
+"""
+
+import threading
+
+from config import CONTEXT_TOKEN_BUDGET, LOG_SESSIONS, MAX_HISTORY_EXCHANGES
+from core.context_window import fit_messages, message_tokens
+from db import (
+    append_messages as _db_append,
+    get_messages as _db_messages,
+    get_session as _db_get,
+    save_session as _db_save,
+    unit_of_work,
+    update_session as _db_update,
+)
+
+# Messages kept verbatim when older ones are folded into the summary
+KEEP_RECENT_MESSAGES = 10
+
+# Session row fields ChatSession tracks and writes back on flush()
+_FIELDS = ("profile_id", "target_role", "research_context", "company", "summary", "summary_upto_seq")
+# Fields that feed build_system_prompt; changing one invalidates the cached prompt
+_PROMPT_FIELDS = ("profile_id",)
+
+
+class ChatSession:
+    """Request-scoped unit of work for one session.
+
+    Loads the session row and its unsummarised messages once, tracks which fields changed and which
+    messages are new, and writes both back in flush(). Tools running in the same request read and
+    update this object instead of reloading the row.
+    """
+
+    def __init__(self, session_id: str, row: dict | None, messages: list[dict]):
+        self.id = session_id
+        self.exists = row is not None
+        row = row or {}
+        # Session fields (_FIELDS): read directly, changed through set()
+        self.profile_id: str = row.get("profile_id") or ""
+        self.target_role: str | None = row.get("target_role") or None
+        self.research_context: str = row.get("research_context") or ""
+        self.company: str = row.get("company") or ""
+        self.summary: str = row.get("summary") or ""
+        self.summary_upto_seq: int = row.get("summary_upto_seq", 0)
+        self.message_count = row.get("message_count", 0)
+        self._messages = list(messages)  # persisted, seq > summary_upto_seq
+        self._pending: list[dict] = []
+        self._dirty: set[str] = set()
+        self._prompt: str | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._dirty or self._pending or not self.exists)
+
+    def set(self, **fields) -> None:
+        """Change session fields in memory; they are written on flush()."""
+        with self._lock:
+            for key, value in fields.items():
+                if key not in _FIELDS:
+                    raise KeyError(key)
+                if getattr(self, key) != value:
+                    setattr(self, key, value)
+                    self._dirty.add(key)
+                    if key in _PROMPT_FIELDS:
+                        self._prompt = None
+
+    def ensure(self, profile_id: str, target_role: str | None = None) -> None:
+        """Bind the session to profile_id; keep the stored target_role unless a new one is given."""
+        self.set(profile_id=profile_id, target_role=target_role or self.target_role)
+
+    def add_message(self, role: str, content: str) -> None:
+        with self._lock:
+            self._pending.append({"role": role, "content": content})
+
+    def history(self) -> list[dict]:
+        """Unsummarised messages, persisted and pending, oldest first."""
+        with self._lock:
+            return [{"role": m["role"], "content": m["content"]} for m in self._messages + self._pending]
+
+    def system_prompt(self, build_fn) -> str:
+        """Return the cached stable system prompt, calling build_fn(profile_id) on miss."""
+        if self._prompt is None:
+            self._prompt = build_fn(self.profile_id)
+        return self._prompt
+
+    def session_context(self, build_fn) -> str:
+        """Volatile per-session instructions: build_fn(target_role, research_context, company)."""
+        return build_fn(target_role=self.target_role, research_context=self.research_context, company=self.company)
+
+    @property
+    def needs_summary(self) -> bool:
+        """True when unsummarised history exceeds MAX_HISTORY_EXCHANGES messages or half the token budget."""
+        history = self.history()
+        if len(history) > MAX_HISTORY_EXCHANGES:
+            return True
+        return sum(message_tokens(m) for m in history) > CONTEXT_TOKEN_BUDGET // 2
+
+    def messages_for_llm(self, system_prompt: str, session_context: str = "", overhead: int = 0) -> list[dict]:
+        """Full message list for the LLM: system prompt, rolling summary, the recent turns that fit
+        the token budget less overhead (tool schemas) and session_context just before the latest turn
+        (see core.context_window).
+
+        Never summarises inline; the background summariser advances summary_upto_seq.
+        """
+        return fit_messages(
+            system_prompt, self.history(), summary=self.summary, session_context=session_context, overhead=overhead
         )
 
+    def flush(self) -> None:
+        """Write changed fields and new messages in one unit of work. No-op when nothing changed."""
+        with self._lock:
+            if not self.dirty:
+                return
+            fields = {k: getattr(self, k) for k in self._dirty}
+            pending, self._pending = self._pending, []
+            self._dirty = set()
+            exists = self.exists
+        try:
+            with unit_of_work():
+                if not exists:
+                    _db_save(self.id, self.profile_id or "", **{k: getattr(self, k) for k in _FIELDS if k != "profile_id"})
+                    self.exists = True
+                elif fields:
+                    _db_update(self.id, fields)
+                last_seq = _db_append(self.id, [(m["role"], m["content"]) for m in pending]) if pending else 0
+        except Exception:
+            with self._lock:
+                self._pending[:0] = pending
+                self._dirty.update(fields)
+            raise
+        if pending:
+            first_seq = last_seq - len(pending) + 1
+            with self._lock:
+                for i, m in enumerate(pending):
+                    self._messages.append({"seq": first_seq + i, **m})
+                self.message_count = last_seq
+
+
+def load_session(session_id: str) -> ChatSession:
+    """Load session metadata and unsummarised messages in one unit of work."""
+    with unit_of_work():
+        row = _db_get(session_id)
+        messages = _db_messages(session_id, after_seq=row["summary_upto_seq"]) if row else []
+    return ChatSession(session_id, row, messages)
+
 
 def get_session(session_id: str) -> dict:
-    """Get session state from DB. Creates in-memory placeholder if not in DB (for backward compat)."""
+    """Get session state from DB. Returns an empty placeholder if not in DB."""
     s = _db_get(session_id)
     if s is not None:
         return {
-            "history": s["history"],
             "summary": s.get("summary"),
             "research_context": s.get("research_context"),
             "company": s.get("company"),
             "profile_id": s.get("profile_id"),
             "target_role": s.get("target_role"),
+            "message_count": s.get("message_count", 0),
         }
     return {
-        "history": [],
         "summary": None,
         "research_context": None,
         "company": None,
         "profile_id": None,
         "target_role": None,
+        "message_count": 0,
     }
 
 
-def add_exchange(session_id: str, role: str, content: str) -> None:
-    """Add user/assistant exchange to history and persist."""
-    s = _db_get(session_id)
-    if s is None:
-        _db_save(session_id, "", [{"role": role, "content": content}])
-        return
-    history = s["history"] + [{"role": role, "content": content}]
-    _db_save(
-        session_id,
-        s["profile_id"],
-        history,
-        target_role=s.get("target_role"),
-        research_context=s.get("research_context"),
-        company=s.get("company"),
-        summary=s.get("summary"),
-    )
-
-
 def get_history(session_id: str) -> list[dict]:
     """Return full exchange history for API."""
-    s = _db_get(session_id)
-    return s["history"] if s else []
-
-
-def get_messages_for_llm(
-    session_id: str,
-    summarise_fn=None,
-) -> list[dict]:
-    """Get message list for LLM, applying context window management."""
-    s = _db_get(session_id)
-    if s is None:
-        return []
-    history = list(s["history"])
-    summary = s.get("summary")
-
-    if len(history) <= MAX_HISTORY_EXCHANGES:
-        out = [{"role": h["role"], "content": h["content"]} for h in history]
-        return out
-
-    if summarise_fn and not summary:
-        old = history[:-10]
-        summary = summarise_fn(old)
-        _db_save(
-            session_id,
-            s["profile_id"],
-            history[-10:],
-            target_role=s.get("target_role"),
-            research_context=s.get("research_context"),
-            company=s.get("company"),
-            summary=summary,
-        )
-        history = history[-10:]
-
-    messages = []
-    if summary:
-        messages.append({
-            "role": "system",
-            "content": f"[Previous conversation summary]: {summary}",
-        })
-    for h in history:
-        messages.append({"role": h["role"], "content": h["content"]})
-    return messages
-
-
-def set_research_context(session_id: str, company: str, context: str) -> None:
-    """Store company research context for this session."""
-    s = _db_get(session_id)
-    if s is None:
-        return
-    _db_save(
-        session_id,
-        s["profile_id"],
-        s["history"],
-        target_role=s.get("target_role"),
-        research_context=context,
-        company=company,
-        summary=s.get("summary"),
-    )
+    return [{"role": m["role"], "content": m["content"]} for m in _db_messages(session_id)]
 
 
 def get_research_context(session_id: str) -> tuple[str | None, str | None]:
@@ -0,0 +1,122 @@
+"""Pre-summarisation snippet selection: drop near-duplicates, rank by relevance, pack into a token budget.
+
+Search results for one company overlap heavily (the same post syndicated, a truncated copy of a longer
+body) and mix in boilerplate. Near-duplicates are found by word-shingle overlap, the rest ranked with
+BM25 against the company name plus interview and role terms, and the best packed until the budget is
+spent, so the summary prompt is smaller and covers more distinct content.
+"""
+
+import math
+import re
+from collections import Counter
+
+from core import metrics
+from core.context_window import count_tokens, truncate_to_tokens
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+SHINGLE_WORDS = 4
+# Two snippets are near-duplicates if their shingle sets have Jaccard similarity at least DUPLICATE_JACCARD,
+# or one is mostly contained in the other (a truncated copy)
+DUPLICATE_JACCARD = 0.6
+DUPLICATE_CONTAINMENT = 0.8
+INTERVIEW_TERMS = (
+    "interview", "interviews", "interviewer", "round", "rounds", "onsite", "phone", "screen", "coding",
+    "leetcode", "system", "design", "behavioral", "behavioural", "questions", "asked", "recruiter",
+    "offer", "hiring", "manager", "difficulty", "medium", "hard", "loop", "take", "home",
+)
+# BM25 parameters; company terms count double
+BM25_K1 = 1.2
+BM25_B = 0.75
+COMPANY_WEIGHT = 2.0
+# Stop packing once less than this many tokens remain
+MIN_PACK_TOKENS = 32
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _shingles(words: list[str]) -> set[tuple[str, ...]]:
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def _near_duplicate(a: set, b: set) -> bool:
+    if not a or not b:
+        return a == b
+    common = len(a & b)
+    return common / len(a | b) >= DUPLICATE_JACCARD or common / min(len(a), len(b)) >= DUPLICATE_CONTAINMENT
+
+
+def dedupe(snippets: list[str]) -> list[str]:
+    """Snippets without near-duplicates, in order; of two near-duplicates the longer is kept in the earlier slot."""
+    kept: list[tuple[str, set]] = []
+    for text in snippets:
+        shingles = _shingles(_words(text))
+        for i, (other, other_shingles) in enumerate(kept):
+            if _near_duplicate(shingles, other_shingles):
+                if len(text) > len(other):
+                    kept[i] = (text, shingles)
+                break
+        else:
+            kept.append((text, shingles))
+    return [text for text, _ in kept]
+
+
+def rank(snippets: list[str], company: str, role: str = "") -> list[tuple[float, str]]:
+    """(BM25 score, snippet) best first; snippets matching no query term (off-topic) are dropped."""
+    docs = [Counter(_words(s)) for s in snippets]
+    if not docs:
+        return []
+    weights = {t: 1.0 for t in INTERVIEW_TERMS}
+    weights.update({t: 1.0 for t in _words(role)})
+    weights.update({t: COMPANY_WEIGHT for t in _words(company)})
+    n = len(docs)
+    lengths = [sum(d.values()) for d in docs]
+    avg_len = sum(lengths) / n or 1.0
+    df = {t: sum(1 for d in docs if t in d) for t in weights}
+    scored = []
+    for text, doc, length in zip(snippets, docs, lengths):
+        score = 0.0
+        for term, weight in weights.items():
+            tf = doc.get(term, 0)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+            score += weight * idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+        if score > 0:
+            scored.append((score, text))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+
+def pack(snippets: list[str], token_budget: int) -> list[str]:
+    """Snippets in order while they fit token_budget (separators included); the first is truncated if it alone is too big."""
+    packed: list[str] = []
+    remaining = token_budget
+    for text in snippets:
+        if remaining < MIN_PACK_TOKENS:
+            break
+        tokens = count_tokens(text) + 1
+        if tokens <= remaining:
+            packed.append(text)
+            remaining -= tokens
+        elif not packed:
+            packed.append(truncate_to_tokens(text, remaining - 1))
+            remaining = 0
+    return packed
+
+
+def select(snippets: list[str], company: str, role: str = "", token_budget: int = 2000) -> list[str]:
+    """Deduplicated, relevance-ranked snippets packed into token_budget, best first."""
+    candidates = [s.strip() for s in snippets if s and s.strip()]
+    unique = dedupe(candidates)
+    ranked = rank(unique, company, role)
+    selected = pack([text for _, text in ranked], token_budget)
+    metrics.incr("research.snippets.candidates", len(candidates))
+    metrics.incr("research.snippets.duplicates", len(candidates) - len(unique))
+    metrics.incr("research.snippets.offtopic", len(unique) - len(ranked))
+    metrics.incr("research.snippets.selected", len(selected))
+    metrics.incr("research.snippets.tokens", sum(count_tokens(s) for s in selected))
+    return selected
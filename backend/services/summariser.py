@@ -0,0 +1,68 @@
+"""Background rolling summarisation of aged-out session history, off the /chat request path.
+
+/chat calls request(session_id) after a turn when too much history is unsummarised. A worker thread
+folds the newly aged-out messages into the previous summary (not the whole conversation again) and
+advances sessions.summary_upto_seq with a conditional update, so concurrent workers cannot clobber
+each other.
+"""
+
+import logging
+import queue
+import threading
+
+from core import llm, metrics
+from db import get_messages, get_session, update_session_summary
+from services.session import KEEP_RECENT_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+_queue: "queue.Queue[str]" = queue.Queue()
+_queued: set[str] = set()
+_lock = threading.Lock()
+_worker: threading.Thread | None = None
+
+
+def request(session_id: str) -> None:
+    """Schedule a summary refresh for session_id. Returns immediately; duplicate requests are coalesced."""
+    global _worker
+    with _lock:
+        if session_id in _queued:
+            return
+        _queued.add(session_id)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="summariser", daemon=True)
+            _worker.start()
+    _queue.put(session_id)
+    metrics.set_gauge("summariser.queue_depth", _queue.qsize())
+
+
+def _run() -> None:
+    while True:
+        session_id = _queue.get()
+        with _lock:
+            _queued.discard(session_id)
+        metrics.set_gauge("summariser.queue_depth", _queue.qsize())
+        try:
+            with metrics.timed("summariser.latency"):
+                summarise_session(session_id)
+        except Exception:
+            metrics.incr("summariser.errors")
+            logger.exception("Background summarisation failed for session %s", session_id)
+
+
+def summarise_session(session_id: str) -> bool:
+    """Fold messages older than the last KEEP_RECENT_MESSAGES into the rolling summary. Returns True if advanced."""
+    s = get_session(session_id)
+    if s is None:
+        return False
+    upto = s["summary_upto_seq"]
+    new_upto = s["message_count"] - KEEP_RECENT_MESSAGES
+    if new_upto <= upto:
+        return False
+    aged_out = get_messages(session_id, after_seq=upto, upto_seq=new_upto)
+    summary = llm.summarise_history(aged_out, previous_summary=s.get("summary") or "", affinity=session_id)
+    if not summary:
+        return False
+    advanced = update_session_summary(session_id, summary, new_upto, expected_upto_seq=upto)
+    metrics.incr("summariser.updates" if advanced else "summariser.conflicts")
+    return advanced
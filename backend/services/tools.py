@@ -89,6 +89,30 @@ TOOLS = [
             },
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "update_topic_scores",
+            "description": "Update several topic scores at once. Use instead of repeated update_topic_score calls when a conversation covered multiple topics.",
+            "parameters": {
+                "type": "object",
+                "required": ["assessments"],
+                "properties": {
+                    "assessments": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "required": ["topic_id", "assessment"],
+                            "properties": {
+                                "topic_id": {"type": "string"},
+                                "assessment": {"type": "string", "enum": ["strong", "partial", "weak"]},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    },
 ]
 
 TOOLS_SETUP = [CREATE_PROFILE_TOOL] + TOOLS
@@ -103,16 +127,15 @@ def _ensure_list(v) -> list:
     return [str(v).strip()] if str(v).strip() else []
 
 
-def _profile_id_for_session(session_id: str) -> str | None:
-    """Resolve profile_id for this session (from session store or default)."""
-    s = session.get_session(session_id)
-    return s.get("profile_id") or get_default_profile_id()
+def _profile_id_for_session(sess: session.ChatSession) -> str | None:
+    """Resolve profile_id for this session (from the loaded session or default)."""
+    return sess.profile_id or get_default_profile_id()
 
 
-def execute_tool(name: str, arguments: dict, session_id: str) -> str:
-    """Execute a tool and return result as string for the assistant."""
+def execute_tool(name: str, arguments: dict, sess: session.ChatSession) -> str:
+    """Execute a tool and return result as string for the assistant. Session changes are flushed by the caller."""
     args = arguments or {}
-    profile_id = _profile_id_for_session(session_id)
+    profile_id = _profile_id_for_session(sess)
 
     try:
         if name == "create_profile":
@@ -134,8 +157,7 @@ def execute_tool(name: str, arguments: dict, session_id: str) -> str:
             ensure_curriculum_from_profile(data)
             if not get_default_profile_id():
                 set_default_profile_id(new_id)
-            s = session.get_session(session_id)
-            session.ensure_session(session_id, new_id, s.get("target_role"))
+            sess.ensure(new_id)
             return json.dumps({"status": "created", "profile_id": new_id, "message": "Profile created. The user can start interview prep."})
 
         if name == "research_company":
@@ -144,7 +166,7 @@ def execute_tool(name: str, arguments: dict, session_id: str) -> str:
                 return "Error: company is required"
             result = research.research_company(company)
             summary = result.get("summary", "")
-            session.set_research_context(session_id, company, summary)
+            sess.set(company=company, research_context=summary)
             return json.dumps(result)
 
         if name == "parse_jd":
@@ -177,6 +199,21 @@ def execute_tool(name: str, arguments: dict, session_id: str) -> str:
             tracker.update_score(topic_id, assessment, profile_id)
             return '{"status": "updated"}'
 
+        if name == "update_topic_scores":
+            items = args.get("assessments") or []
+            if isinstance(items, str):
+                items = json.loads(items)
+            pairs = [
+                (i.get("topic_id"), i.get("assessment"))
+                for i in items
+                if isinstance(i, dict) and i.get("topic_id") and i.get("assessment")
+            ]
+            if not pairs:
+                return "Error: assessments must list topic_id and assessment"
+            if not profile_id:
+                return json.dumps({"error": "No profile yet"})
+            return json.dumps({"status": "updated", "topics": tracker.update_scores(pairs, profile_id)})
+
     except Exception as e:
         return json.dumps({"error": str(e)})
 
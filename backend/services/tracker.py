@@ -1,8 +1,8 @@
 """Weak area tracker with curriculum and progress. Curriculum and progress per profile via DB."""
 
-from datetime import datetime
+from db import get_profile, get_progress, increment_topic_scores, list_curriculum, save_progress
 
-from db import get_profile, get_progress, list_curriculum, save_progress
+ASSESSMENT_DELTAS = {"strong": 0.3, "partial": 0.1, "weak": -0.1}
 
 
 def load_curriculum() -> list[dict]:
@@ -11,18 +11,17 @@ def load_curriculum() -> list[dict]:
 
 
 def load_progress(profile_id: str) -> dict:
-    """Load progress for profile from DB; initialise from curriculum if missing."""
+    """Load progress for profile from DB; seed curriculum topics the profile has no score for yet."""
     progress = get_progress(profile_id)
     topics = progress.get("topics", {})
-    if not topics:
-        curriculum = load_curriculum()
-        for t in curriculum:
-            topics[t["id"]] = {
-                "score": 0.5,
-                "label": t["label"],
-                "last_visited": None,
-            }
-        save_progress(profile_id, {"topics": topics})
+    missing = {
+        t["id"]: {"score": 0.5, "label": t["label"], "last_visited": None}
+        for t in load_curriculum()
+        if t["id"] not in topics
+    }
+    if missing:
+        save_progress(profile_id, {"topics": missing}, overwrite=False)
+        topics.update(missing)
         progress = {"topics": topics}
     return progress
 
@@ -38,21 +37,20 @@ def _match_needs_depth(topic: dict, needs_depth: list[str]) -> bool:
 
 def update_score(topic_id: str, assessment: str, profile_id: str) -> None:
     """Update topic score for profile: strong +0.3, partial +0.1, weak -0.1."""
-    progress = load_progress(profile_id)
-    topics = progress.get("topics", {})
-    if topic_id not in topics:
-        curriculum = load_curriculum()
-        for t in curriculum:
-            if t["id"] == topic_id:
-                topics[topic_id] = {"score": 0.5, "label": t["label"], "last_visited": None}
-                break
-    if topic_id not in topics:
-        return
-    delta = {"strong": 0.3, "partial": 0.1, "weak": -0.1}.get(assessment.lower(), 0)
-    s = topics[topic_id]["score"]
-    topics[topic_id]["score"] = max(0, min(1, s + delta))
-    topics[topic_id]["last_visited"] = datetime.now().isoformat()
-    save_progress(profile_id, progress)
+    update_scores([(topic_id, assessment)], profile_id)
+
+
+def update_scores(assessments: list[tuple[str, str]], profile_id: str) -> list[str]:
+    """Apply several (topic_id, assessment) pairs in one DB round trip. Returns the topic ids updated.
+
+    Repeated topics in one batch have their deltas summed before clamping.
+    """
+    deltas: dict[str, float] = {}
+    for topic_id, assessment in assessments:
+        delta = ASSESSMENT_DELTAS.get((assessment or "").lower(), 0)
+        if topic_id:
+            deltas[topic_id] = deltas.get(topic_id, 0) + delta
+    return increment_topic_scores(profile_id, deltas)
 
 
 def get_progress_summary(profile_id: str) -> dict:
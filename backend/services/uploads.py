@@ -0,0 +1,82 @@
+"""Memory-bounded ingestion of uploaded files.
+
+Request bodies are bounded while they arrive (main.UploadLimitMiddleware), so Starlette never spools
+more than the limit. Starlette already spools each upload (in memory while small, in a temporary file
+beyond that), so uploads are not copied again: spool() reads the upload's own file once in chunks to
+enforce the per-file and total limits and compute the sha256, then keeps reading from it. Extraction
+workers are sent an upload's content in chunks, so the API process never holds a whole file in memory.
+"""
+
+import hashlib
+from typing import BinaryIO, Iterator
+
+CHUNK_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """An upload, or a request's uploads together, exceeded the size limit."""
+
+
+class SpooledUpload:
+    """One uploaded file, read from the (spooled) file object it arrived in. close() closes that file."""
+
+    def __init__(self, filename: str, fileobj: BinaryIO, size: int, sha256: str):
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self._file = fileobj
+
+    def __len__(self) -> int:
+        return self.size
+
+    def chunks(self) -> Iterator[bytes]:
+        """The content from the start, CHUNK_BYTES at a time."""
+        self._file.seek(0)
+        while chunk := self._file.read(CHUNK_BYTES):
+            yield chunk
+
+    def getvalue(self) -> bytes:
+        return b"".join(self.chunks())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def digest(data: bytes | SpooledUpload) -> str:
+    """sha256 hex digest of an upload's content."""
+    return data.sha256 if isinstance(data, SpooledUpload) else hashlib.sha256(data).hexdigest()
+
+
+def spool(fileobj: BinaryIO, filename: str, max_bytes: int) -> SpooledUpload:
+    """Measure and hash fileobj in chunks, raising UploadTooLarge as soon as it passes max_bytes. Blocking."""
+    sha = hashlib.sha256()
+    size = 0
+    fileobj.seek(0)
+    while chunk := fileobj.read(CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"File too large: {filename}")
+        sha.update(chunk)
+    return SpooledUpload(filename, fileobj, size, sha.hexdigest())
+
+
+def spool_all(files: list[tuple[BinaryIO, str]], max_file_bytes: int, max_total_bytes: int) -> list[SpooledUpload]:
+    """spool() each (fileobj, filename) with per-file and total limits."""
+    spooled: list[SpooledUpload] = []
+    total = 0
+    for fileobj, filename in files:
+        remaining = max_total_bytes - total
+        try:
+            upload = spool(fileobj, filename, min(max_file_bytes, remaining))
+        except UploadTooLarge:
+            if remaining < max_file_bytes:
+                raise UploadTooLarge("Total upload size exceeded.")
+            raise
+        spooled.append(upload)
+        total += upload.size
+    return spooled
+
+
+def close_all(uploads: list[SpooledUpload]) -> None:
+    for upload in uploads:
+        upload.close()
@@ -0,0 +1,78 @@
+"""Startup warmup: DB pool and hot caches, then the Ollama model on every instance.
+
+run() is started in a background thread by the app lifespan and retries until both steps succeed;
+GET /ready reports ready only after that, so a load balancer does not send the first chat to a cold
+worker.
+"""
+
+import logging
+import threading
+
+from config import AGENT_MODE, OLLAMA_WARMUP
+from core import context, metrics, ollama
+from db import get_default_profile_id, warm_caches
+from services import tools
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 5.0
+
+_state = {"db": False, "model": False}
+_stop = threading.Event()
+
+
+def status() -> dict:
+    """{"ready": bool, "db": bool, "model": bool}."""
+    return {"ready": all(_state.values()), **_state}
+
+
+def stop() -> None:
+    _stop.set()
+
+
+def _warmup_messages() -> list[dict]:
+    """The system prompt the first chat will most likely use, so its prefix is already evaluated."""
+    profile_id = get_default_profile_id()
+    system = context.build_system_prompt(profile_id) if profile_id else context.build_setup_system_prompt()
+    return [{"role": "system", "content": system}, {"role": "user", "content": "Hi"}]
+
+
+def _warm_db() -> bool:
+    try:
+        with metrics.timed("warmup.db"):
+            warm_caches()
+        return True
+    except Exception as e:
+        logger.warning("DB warmup failed, retrying in %ss: %s", RETRY_SECONDS, e)
+        return False
+
+
+def _warm_model() -> bool:
+    extra = {"tools": tools.TOOLS if get_default_profile_id() else tools.TOOLS_SETUP} if AGENT_MODE else {}
+    try:
+        with metrics.timed("warmup.model"):
+            warmed = ollama.warmup(_warmup_messages(), **extra)
+    except Exception as e:
+        logger.warning("Model warmup failed, retrying in %ss: %s", RETRY_SECONDS, e)
+        return False
+    if not warmed:
+        logger.warning("No Ollama instance could load the model, retrying in %ss", RETRY_SECONDS)
+        return False
+    logger.info("Model warm on %d of %d Ollama instance(s)", warmed, len(ollama.ROUTER.backends))
+    return True
+
+
+def run() -> None:
+    """Warm the DB, then the model (skipped when OLLAMA_WARMUP is off), retrying each until it succeeds."""
+    _stop.clear()
+    while not _state["db"]:
+        _state["db"] = _warm_db()
+        if not _state["db"] and _stop.wait(RETRY_SECONDS):
+            return
+    if not OLLAMA_WARMUP:
+        _state["model"] = True
+        return
+    while not _state["model"]:
+        _state["model"] = _warm_model()
+        if not _state["model"] and _stop.wait(RETRY_SECONDS):
+            return
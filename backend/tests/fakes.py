@@ -0,0 +1,35 @@
+"""In-memory stand-ins for DB repository functions, shared by the tests."""
+
+from datetime import datetime, timedelta, timezone
+
+from core import cache
+
+
+class CacheTable:
+    """In-memory stand-in for the cache_entries repository functions (cache_get/cache_put), honouring max_age.
+
+    rows maps (namespace, key) to (value, created_at), like the DB rows ResultCache reads.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.reads = 0
+
+    def get(self, namespace, key, max_age):
+        self.reads += 1
+        row = self.rows.get((namespace, key))
+        if row is None or datetime.now(timezone.utc) - row[1] > timedelta(seconds=max_age):
+            return None
+        return row
+
+    def put(self, namespace, key, value, max_age, max_bytes, created_at=None):
+        self.rows[(namespace, key)] = (value, created_at or datetime.now(timezone.utc))
+        return 0
+
+
+def cache_table(monkeypatch) -> CacheTable:
+    """Route ResultCache's DB reads and writes to a fresh CacheTable."""
+    table = CacheTable()
+    monkeypatch.setattr(cache, "cache_get", table.get)
+    monkeypatch.setattr(cache, "cache_put", table.put)
+    return table
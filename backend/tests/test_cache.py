@@ -0,0 +1,41 @@
+"""Content-addressed result cache: memory front, DB fallback, TTL, refresh."""
+
+from core.cache import ResultCache, make_key
+from fakes import CacheTable, cache_table
+
+
+def _cache(monkeypatch, **kwargs) -> tuple[ResultCache, CacheTable]:
+    table = cache_table(monkeypatch)
+    return ResultCache("test", ttl=kwargs.pop("ttl", 60), max_bytes=1 << 20, **kwargs), table
+
+
+def test_make_key_is_order_independent_and_input_sensitive():
+    assert make_key("m", "v1", {"a": 1, "b": 2}) == make_key("m", "v1", {"b": 2, "a": 1})
+    assert make_key("m", "v1", {"a": 1}) != make_key("m", "v2", {"a": 1})
+
+
+def test_get_or_compute_hits_memory_then_db(monkeypatch):
+    c, table = _cache(monkeypatch, memory_entries=1)
+    calls = []
+    compute = lambda: calls.append(1) or {"response": "x"}
+    assert c.get_or_compute("k1", compute) == {"response": "x"}
+    assert c.get_or_compute("k1", compute) == {"response": "x"}
+    assert len(calls) == 1
+    reads = table.reads
+    c.put("k2", {"response": "y"})  # pushes k1 out of the one-entry memory front
+    assert c.get("k1") == {"response": "x"}
+    assert table.reads == reads + 1
+
+
+def test_refresh_bypasses_lookup(monkeypatch):
+    c, _ = _cache(monkeypatch)
+    c.put("k", {"response": "old"})
+    assert c.get_or_compute("k", lambda: {"response": "new"}, refresh=True) == {"response": "new"}
+    assert c.get("k") == {"response": "new"}
+
+
+def test_expired_memory_entries_fall_through(monkeypatch):
+    c, table = _cache(monkeypatch, ttl=0)
+    c.put("k", {"response": "x"})
+    table.rows.clear()
+    assert c.get("k") is None
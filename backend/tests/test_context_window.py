@@ -0,0 +1,84 @@
+"""Token-budget context assembly."""
+
+from core.context_window import ATTACHMENT_MARKER, count_tokens, fit_messages, message_tokens
+
+
+def _turns(n: int, size: int = 400) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i}:" + "x" * size}
+        for i in range(n)
+    ]
+
+
+def test_fit_messages_keeps_newest_turns_within_budget():
+    history = _turns(40)
+    out = fit_messages("system", history, budget=1000)
+    assert out[0] == {"role": "system", "content": "system"}
+    assert out[-1]["content"] == history[-1]["content"]
+    assert sum(message_tokens(m) for m in out) <= 1000
+    assert len(out) < len(history)
+
+
+def test_fit_messages_keeps_everything_when_it_fits():
+    history = _turns(4, size=20)
+    out = fit_messages("system", history, summary="earlier", budget=10_000)
+    assert [m["content"] for m in out[2:]] == [h["content"] for h in history]
+    assert "earlier" in out[1]["content"]
+
+
+def test_fit_messages_truncates_attachments_before_dropping_turns():
+    doc = "resume line\n" * 5000
+    history = _turns(2, size=20) + [{"role": "user", "content": f"Review this\n\n{ATTACHMENT_MARKER}\n{doc}"}]
+    out = fit_messages("system", history, budget=4000)
+    last = out[-1]["content"]
+    assert last.startswith("Review this")
+    assert "truncated" in last
+    assert count_tokens(last) < count_tokens(history[-1]["content"])
+    assert len(out) == 4
+
+
+def test_fit_messages_keeps_prefix_stable_across_turns():
+    history = _turns(6, size=20)
+    before = fit_messages("system", history, summary="earlier", session_context="Role: SRE", budget=10_000)
+    after = fit_messages("system", history + _turns(2, size=30), summary="earlier", session_context="Role: SWE", budget=10_000)
+    assert before[-2] == {"role": "system", "content": "Role: SRE"}
+    assert after[-2] == {"role": "system", "content": "Role: SWE"}
+    # Everything up to the previous turn's session context is byte-identical
+    assert after[: len(before) - 2] == before[:-2]
+
+
+def test_count_tokens_cache_is_cleared_with_the_tokenizer():
+    from core import context_window
+    text = "cached " * 50
+    before = count_tokens(text)
+    context_window.set_tokenizer(lambda s: 7)
+    try:
+        assert count_tokens(text) == 7
+    finally:
+        context_window.set_tokenizer(context_window.estimate_tokens)
+    assert count_tokens(text) == before
+
+
+def test_tool_schemas_count_against_the_budget_and_num_ctx_stays_fixed():
+    from config import CONTEXT_TOKEN_BUDGET
+    from core import ollama
+    from core.context_window import prompt_budget, tools_tokens
+    from services import tools
+
+    history = _turns(200)
+    overhead = tools_tokens(tools.TOOLS_SETUP)
+    out = fit_messages("system", history, overhead=overhead)
+    assert sum(message_tokens(m) for m in out) + overhead <= prompt_budget()
+    assert len(fit_messages("system", history)) > len(out)
+
+    short = ollama._chat_payload([{"role": "user", "content": "hi"}], {"tools": tools.TOOLS})
+    full = ollama._chat_payload(out, {"tools": tools.TOOLS_SETUP})
+    assert short["options"]["num_ctx"] == full["options"]["num_ctx"] == CONTEXT_TOKEN_BUDGET
+
+
+def test_truncate_to_tokens_can_keep_the_end():
+    from core.context_window import truncate_to_tokens
+    text = "old " * 1000 + "newest"
+    cut = truncate_to_tokens(text, 100, keep_end=True)
+    assert cut.endswith("newest") and cut.startswith("[... truncated")
+    assert count_tokens(cut) < 120
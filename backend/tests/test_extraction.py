@@ -0,0 +1,68 @@
+"""Upload text extraction: worker processes, timeouts, page limits, corrupt-file fallbacks, text cache."""
+
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core import cache
+from fakes import cache_table
+from services import extraction
+
+
+@pytest.fixture(autouse=True)
+def _text_cache(monkeypatch):
+    """A fresh extracted-text cache over an in-memory table instead of the DB."""
+    cache_table(monkeypatch)
+    monkeypatch.setattr(extraction, "TEXT_CACHE", cache.ResultCache("extracted_text", ttl=60, max_bytes=1 << 20))
+
+
+def test_files_are_extracted_in_order_and_corrupt_ones_come_back_empty():
+    texts = extraction.extract([
+        ("notes.txt", b"Python, Go, Kubernetes"),
+        ("broken.pdf", b"%PDF-1.4 not really a pdf"),
+        ("cv.txt", "René — backend engineer".encode("utf-8")),
+    ])
+    assert texts == ["Python, Go, Kubernetes", "", "René — backend engineer"]
+
+
+def test_a_timed_out_parse_is_killed_without_affecting_other_files():
+    with ThreadPoolExecutor(1) as threads:
+        slow = threads.submit(extraction._parse_in_process, "big.txt", b"x" * 20_000_000, 0)
+        assert extraction.extract([("ok.txt", b"parsed meanwhile")]) == ["parsed meanwhile"]
+        with pytest.raises(TimeoutError):
+            slow.result()
+    assert not extraction._live
+
+
+def test_pdf_is_read_up_to_the_page_limit():
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=200, height=200)
+    buf = io.BytesIO()
+    writer.write(buf)
+    assert extraction.extract_text_from_pdf(buf.getvalue(), max_pages=1).endswith("[... 2 more pages not read]")
+
+
+def test_docx_python_docx_cannot_open_falls_back_to_document_xml():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("word/document.xml", "<w:document><w:p><w:t>Staff engineer &amp; lead</w:t></w:p></w:document>")
+    assert extraction.extract_text_from_docx(buf.getvalue()) == "Staff engineer & lead"
+
+
+def test_identical_content_is_served_from_the_cache_without_parsing(monkeypatch):
+    data = b"Staff engineer, distributed systems"
+    assert extraction.extract([("cv.txt", data)]) == [data.decode()]
+    parsed = []
+    monkeypatch.setattr(extraction, "_parse_in_process", lambda filename, data, timeout: parsed.append(filename) or "")
+    assert extraction.extract([("renamed.txt", data)]) == [data.decode()]
+    assert parsed == []
+    extraction.extract([("cv.pdf", data)])  # same bytes, different type: not the same text
+    assert parsed == ["cv.pdf"]
+    # After a restart (empty memory front) the text comes from the DB table
+    monkeypatch.setattr(extraction, "TEXT_CACHE", cache.ResultCache("extracted_text", ttl=60, max_bytes=1 << 20))
+    assert extraction.extract([("cv.txt", data)]) == [data.decode()]
+    assert parsed == ["cv.pdf"]
@@ -0,0 +1,55 @@
+"""In-process cache of hot rows (curriculum, profiles, default profile id): warmed, invalidated by writes, TTL."""
+
+from contextlib import contextmanager
+
+import pytest
+
+from db import postgres_backend as pg
+
+
+@pytest.fixture(autouse=True)
+def _empty_cache(monkeypatch):
+    monkeypatch.setattr(pg, "_hot", {})
+
+
+@pytest.fixture
+def loads(monkeypatch) -> list:
+    """Loaders count their calls; writes go to a no-op cursor."""
+    calls = []
+
+    class Cursor:
+        def execute(self, *args):
+            pass
+
+    @contextmanager
+    def cursor():
+        yield Cursor()
+
+    monkeypatch.setattr(pg, "_cursor", cursor)
+    monkeypatch.setattr(pg, "_get_pool", lambda: None)
+    monkeypatch.setattr(pg, "_load_curriculum", lambda: calls.append("curriculum") or [{"id": "dsa"}])
+    monkeypatch.setattr(pg, "_load_default_profile_id", lambda: calls.append("default") or "p1")
+    monkeypatch.setattr(pg, "_load_profile", lambda pid: calls.append(pid) or {"id": pid, "data": {}})
+    return calls
+
+
+def test_warm_caches_loads_rows_later_reads_are_served_from_memory(loads):
+    pg.warm_caches()
+    assert loads == ["curriculum", "default", "p1"]
+    pg.list_curriculum()[0]["id"] = "mutated"
+    assert pg.list_curriculum() == [{"id": "dsa"}]
+    assert pg.get_profile("p1")["id"] == "p1" and pg.get_default_profile_id() == "p1"
+    assert loads == ["curriculum", "default", "p1"]
+
+
+def test_writes_invalidate_and_entries_expire(loads, monkeypatch):
+    pg.warm_caches()
+    pg.save_profile("p1", "Profile", {"name": "Ada"})
+    pg.upsert_topic("go", "Go")
+    pg.set_default_profile_id("p2")
+    pg.get_profile("p1"), pg.list_curriculum(), pg.get_default_profile_id()
+    assert loads[3:] == ["p1", "curriculum", "default"]
+
+    monkeypatch.setattr(pg, "DB_CACHE_TTL", 0)
+    pg.list_curriculum()
+    assert loads[-1] == "curriculum" and len(loads) == 7
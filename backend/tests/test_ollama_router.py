@@ -0,0 +1,113 @@
+"""Ollama routing against local stub servers: least-loaded dispatch, session affinity, failover."""
+
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core import metrics, ollama
+from core.router import Router
+
+
+def _stub_server(name: str):
+    """Minimal Ollama stand-in: /api/tags for probes, /api/generate answers with its own name."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send({"models": []})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._send({"response": name, "done": True, "prompt_eval_count": 3, "eval_count": 1})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def _dead_url() -> str:
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def stubs():
+    servers = [_stub_server(n) for n in ("a", "b")]
+    yield [url for _, url in servers]
+    for server, _ in servers:
+        server.shutdown()
+
+
+def _use_router(monkeypatch, urls: list[str]) -> Router:
+    router = Router(urls, probe_interval=3600)
+    monkeypatch.setattr(ollama, "ROUTER", router)
+    return router
+
+
+def test_least_outstanding_dispatch(monkeypatch, stubs):
+    router = _use_router(monkeypatch, stubs)
+    busy = router.backends[0]
+    router.begin(busy)
+    try:
+        assert ollama.generate("hi") == "b"
+    finally:
+        router.end(busy)
+
+
+def test_session_affinity_sticks_to_backend(monkeypatch, stubs):
+    router = _use_router(monkeypatch, stubs)
+    first = ollama.generate("hi", affinity="session-1")
+    affine = router.backends[0] if first == "a" else router.backends[1]
+    # Make the affine backend look busier; affinity still wins while it is healthy
+    router.begin(affine)
+    try:
+        assert ollama.generate("again", affinity="session-1") == first
+        assert ollama.generate("other") != first
+    finally:
+        router.end(affine)
+
+
+def test_failover_on_connect_error(monkeypatch, stubs):
+    router = _use_router(monkeypatch, [_dead_url(), stubs[1]])
+    assert ollama.generate("hi") == "b"
+    assert router.backends[0].healthy is False
+    assert router.backends[0].failures == 1
+    router.stop_probing()
+
+
+def test_health_probe_marks_backends(stubs):
+    router = Router([stubs[0], _dead_url()], probe_interval=3600)
+    router.probe_all()
+    assert [b.healthy for b in router.backends] == [True, False]
+
+
+def test_warmup_loads_every_reachable_backend(monkeypatch, stubs):
+    router = _use_router(monkeypatch, [*stubs, _dead_url()])
+    assert ollama.warmup([{"role": "user", "content": "Hi"}]) == 2
+    assert router.backends[2].healthy is False
+    router.stop_probing()
+
+
+def test_prompt_eval_counts_are_recorded(monkeypatch, stubs):
+    _use_router(monkeypatch, stubs)
+    before = metrics.snapshot()["counters"].get("ollama/api/generate.prompt_eval_tokens", 0)
+    ollama.generate("x" * 40)
+    counters = metrics.snapshot()["counters"]
+    assert counters["ollama/api/generate.prompt_eval_tokens"] - before == 3
+    assert metrics.snapshot()["gauges"]["ollama/api/generate.prompt_reuse"] == 0.7
@@ -0,0 +1,58 @@
+"""Profile builds from uploads: a build is only reused by callers that waited on it, never on refresh."""
+
+import time
+
+from core import singleflight
+from services import profile_builder
+
+
+class _RecentBuilds:
+    """ResultCache stand-in: key -> (profile id, finished at)."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get_entry(self, key):
+        hit = self.rows.get(key)
+        return (hit[0], time.time() - hit[1]) if hit else None
+
+    def put(self, key, value):
+        self.rows[key] = (value, time.time())
+
+
+def _setup(monkeypatch) -> tuple[list, dict]:
+    saved = []
+    profiles = {}
+
+    def save_profile(profile_id, label, data):
+        saved.append(data)
+        profiles[f"p{len(saved)}"] = {"data": data}
+        return f"p{len(saved)}"
+
+    monkeypatch.setattr(singleflight, "acquire_lease", lambda name, holder, ttl: True)
+    monkeypatch.setattr(singleflight, "release_lease", lambda name, holder: None)
+    monkeypatch.setattr(profile_builder, "_RECENT_BUILDS", _RecentBuilds())
+    monkeypatch.setattr(profile_builder.extraction, "extract", lambda files: ["Senior engineer"] * len(files))
+    monkeypatch.setattr(profile_builder, "_call_ollama_for_profile", lambda text, refresh=False: {"name": "Ada"})
+    monkeypatch.setattr(profile_builder, "save_profile", save_profile)
+    monkeypatch.setattr(profile_builder, "get_profile", profiles.get)
+    monkeypatch.setattr(profile_builder, "ensure_curriculum_from_profile", lambda profile: None)
+    return saved, profiles
+
+
+def test_uploading_the_same_files_again_builds_a_new_profile(monkeypatch):
+    saved, _ = _setup(monkeypatch)
+    files = [("cv.txt", b"Senior engineer")]
+    _, first = profile_builder.build_profile_from_uploads(files, None)
+    _, second = profile_builder.build_profile_from_uploads(files, None)
+    _, refreshed = profile_builder.build_profile_from_uploads(files, None, refresh=True)
+    assert len(saved) == 3 and len({first, second, refreshed}) == 3
+
+
+def test_a_build_finished_while_waiting_is_reused(monkeypatch):
+    _, profiles = _setup(monkeypatch)
+    requested = time.time()
+    profile_builder._RECENT_BUILDS.put("k", "p1")
+    profiles["p1"] = {"data": {"name": "Ada"}}
+    assert profile_builder._existing_build("k", requested) == ({"name": "Ada"}, "p1")
+    assert profile_builder._existing_build("k", time.time() + 1) is None
@@ -0,0 +1,165 @@
+"""Research: DB-backed company cache with legacy JSON import, stale-while-revalidate, local index, concurrent source search."""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core import cache
+from fakes import cache_table
+from services import research, search_index
+
+
+def _setup(monkeypatch, tmp_path, legacy: dict | None):
+    table = cache_table(monkeypatch)
+    monkeypatch.setattr(research, "RESEARCH_CACHE", cache.ResultCache("research", ttl=7 * 86400, max_bytes=1 << 20))
+    path = tmp_path / "research_cache.json"
+    if legacy is not None:
+        path.write_text(json.dumps(legacy), encoding="utf-8")
+    monkeypatch.setattr(research, "LEGACY_CACHE_PATH", path)
+    monkeypatch.setattr(research, "_legacy_imported", False)
+    return table, path
+
+
+def test_legacy_json_is_imported_once_with_original_age(monkeypatch, tmp_path):
+    fresh = datetime.now().isoformat()
+    stale = (datetime.now() - timedelta(days=30)).isoformat()
+    table, path = _setup(monkeypatch, tmp_path, {
+        "acme": {"fetched_at": fresh, "summary": "Four rounds."},
+        "initech": {"fetched_at": stale, "summary": "Old."},
+    })
+    assert research._fresh_research("acme")["summary"] == "Four rounds."
+    assert research._fresh_research("initech") is None
+    assert not path.exists()
+    assert (tmp_path / "research_cache.json.imported").exists()
+
+
+def test_company_names_are_normalised(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path, None)
+    research.RESEARCH_CACHE.put(research._company_key("  Acme   Corp "), {"summary": "cached"})
+    assert research.research_company("acme corp")["summary"] == "cached"
+
+
+def test_stale_entry_is_served_and_refreshed_in_background(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path, None)
+    monkeypatch.setattr(research, "RESEARCH_CACHE", cache.ResultCache("research", ttl=30 * 86400, max_bytes=1 << 20))
+    key = research._company_key("Acme")
+    created = datetime.now(timezone.utc) - timedelta(days=10)
+    research.RESEARCH_CACHE.put(key, {"summary": "old"}, created_at=created)
+    queued = []
+    monkeypatch.setattr(research, "refresh_in_background", queued.append)
+    assert research.research_company("Acme")["summary"] == "old"
+    assert queued == ["Acme"]
+
+    research.RESEARCH_CACHE.put(key, {"summary": "new"})
+    assert research.research_company("Acme")["summary"] == "new"
+    assert queued == ["Acme"]
+
+
+def test_search_fans_out_and_returns_partial_results(monkeypatch):
+    import time
+
+    def fake_search(query, max_results=5, timeout=None):
+        if "teamblind" in query:
+            time.sleep(1)
+        if "github" in query:
+            raise RuntimeError("blocked")
+        return [query.split()[0]]
+
+    monkeypatch.setattr(research, "_search", fake_search)
+    monkeypatch.setattr(research, "RESEARCH_SEARCH_TIMEOUT", 0.3)
+    monkeypatch.setattr(research, "SOURCE_STATS", research._SourceStats())
+    start = time.monotonic()
+    results = research.search_sources("Acme")
+    assert time.monotonic() - start < 0.9
+    assert set(results) == {"leetcode", "glassdoor"}
+
+
+def _local_index(monkeypatch, snippets: list[str]):
+    indexed = []
+    monkeypatch.setattr(search_index, "search_snippets", lambda company, query, limit: [
+        {"source": "import", "text": t, "rank": 1.0} for t in snippets[:limit]
+    ])
+    monkeypatch.setattr(search_index, "index_snippets", lambda rows: indexed.extend(rows) or len(rows))
+    monkeypatch.setattr(research, "_summarise_with_ollama", lambda text, company: text)
+    return indexed
+
+
+def test_local_index_with_enough_coverage_skips_web_search(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path, None)
+    _local_index(monkeypatch, [f"Acme onsite round {i} was system design and coding." for i in range(8)])
+    monkeypatch.setattr(research, "search_sources", lambda *a, **k: pytest.fail("web search"))
+    assert "onsite round 0" in research.research_company("Acme")["summary"]
+
+
+def test_thin_local_coverage_searches_web_and_indexes_results(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path, None)
+    local = "Acme phone screen was a medium LeetCode problem on graphs."
+    indexed = _local_index(monkeypatch, [local])
+    web = "Acme has four rounds: coding, system design, behavioural, hiring manager."
+    monkeypatch.setattr(research, "search_sources", lambda company, max_results=3: {"blind": [web]})
+    summary = research.research_company("Acme")["summary"]
+    assert web in summary and local in summary
+    assert indexed == [("acme", "blind", web)]
+
+
+def test_research_with_no_data_is_not_cached(monkeypatch, tmp_path):
+    table, _ = _setup(monkeypatch, tmp_path, None)
+    _local_index(monkeypatch, [])
+    monkeypatch.setattr(research, "search_sources", lambda company, max_results=3: {})
+    assert research.research_company("Acme")["summary"] == "No data found."
+    assert table.rows == {}
+    assert research._fresh_research(research._company_key("Acme")) is None
+
+
+def test_corpus_import_skips_malformed_and_short_records(monkeypatch):
+    rows = []
+    monkeypatch.setattr(search_index, "index_snippets", lambda batch: rows.extend(batch) or len(batch))
+    lines = [
+        json.dumps({"company": " Acme  Corp", "text": "Two coding rounds, then a design round with the team lead."}),
+        b'{"text": "too short"}',
+        "not json",
+        "",
+    ]
+    assert search_index.import_corpus(lines) == {"indexed": 1, "skipped": 2, "failed": 0}
+    assert rows[0][:2] == ("acme corp", "import")
+
+
+def test_corpus_import_strips_nul_and_counts_failed_batches(monkeypatch):
+    calls = []
+
+    def index_snippets(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise RuntimeError("connection lost")
+        return len(batch)
+
+    monkeypatch.setattr(search_index, "index_snippets", index_snippets)
+    monkeypatch.setattr(search_index, "IMPORT_BATCH", 1)
+    text = "Two coding rounds, then a design round with the team lead."
+    lines = [json.dumps({"text": text}), json.dumps({"company": "Ac\x00me", "text": text + "\x00"})]
+    assert search_index.import_corpus(lines) == {"indexed": 1, "skipped": 0, "failed": 1}
+    assert calls[1] == [("acme", "import", text)]
+
+
+def test_parse_jd_caches_per_job_description(monkeypatch, tmp_path):
+    import db
+    from core import ollama
+
+    _setup(monkeypatch, tmp_path, None)
+    monkeypatch.setattr(cache, "LLM_CACHE", cache.ResultCache("llm", ttl=60, max_bytes=1 << 20))
+    monkeypatch.setattr(ollama, "LLM_CACHE", cache.LLM_CACHE)
+    monkeypatch.setattr(db, "get_profile", lambda pid: {"data": {"strong_areas": ["python"]}})
+    prompts = []
+
+    def fake_post(path, payload, *args):
+        prompts.append(payload["prompt"])
+        return {"response": f"analysis {len(prompts)}"}
+
+    monkeypatch.setattr(ollama, "post_json", fake_post)
+    go = research.parse_jd("Senior Go engineer, Kubernetes", "p1")["gap_analysis"]
+    ml = research.parse_jd("ML engineer, PyTorch and RAG", "p1")["gap_analysis"]
+    assert go != ml and len(prompts) == 2
+    assert "Kubernetes" in prompts[0] and "PyTorch" in prompts[1]
+    assert research.parse_jd("Senior Go engineer, Kubernetes", "p1")["gap_analysis"] == go
+    assert len(prompts) == 2
@@ -0,0 +1,88 @@
+"""LLM scheduler: priority order, bounded queues, async slots."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.scheduler import JobClass, Scheduler, SchedulerBusy
+
+
+def _scheduler(capacity=1, queue_limit=4, max_wait=5.0) -> Scheduler:
+    return Scheduler(capacity, [
+        JobClass("interactive", 0, capacity, queue_limit, max_wait),
+        JobClass("background", 1, capacity, queue_limit, max_wait),
+    ])
+
+
+def _run_in_thread(s: Scheduler, job: str, order: list):
+    def run():
+        with s.slot(job):
+            order.append(job)
+    t = threading.Thread(target=run)
+    t.start()
+    return t
+
+
+def _wait_queued(s: Scheduler, job: str, n: int):
+    deadline = time.monotonic() + 2
+    while s.snapshot()[job]["queued"] < n:
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_interactive_jobs_run_before_queued_background_jobs():
+    s = _scheduler()
+    order: list[str] = []
+    with s.slot("background"):
+        bg = _run_in_thread(s, "background", order)
+        _wait_queued(s, "background", 1)
+        fg = _run_in_thread(s, "interactive", order)
+        _wait_queued(s, "interactive", 1)
+    bg.join(2)
+    fg.join(2)
+    assert order == ["interactive", "background"]
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    s = _scheduler(queue_limit=1)
+    order: list[str] = []
+    with s.slot("interactive"):
+        waiting = _run_in_thread(s, "interactive", order)
+        _wait_queued(s, "interactive", 1)
+        with pytest.raises(SchedulerBusy) as exc:
+            s.admit("interactive")
+        assert exc.value.retry_after >= 1
+        with pytest.raises(SchedulerBusy):
+            with s.slot("interactive"):
+                pass
+    waiting.join(2)
+    assert order == ["interactive"]
+
+
+def test_wait_past_max_wait_times_out():
+    s = _scheduler(max_wait=0.05)
+    with s.slot("interactive"):
+        with pytest.raises(SchedulerBusy):
+            with s.slot("interactive"):
+                pass
+    assert s.snapshot()["interactive"] == {"running": 0, "queued": 0, "limit": 1}
+
+
+def test_async_slots_queue_without_blocking_the_loop():
+    s = _scheduler()
+
+    async def main():
+        order = []
+
+        async def job(name, hold):
+            async with s.aslot("interactive"):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        await asyncio.gather(job("a", 0.02), job("b", 0), job("c", 0))
+        return order
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert s.snapshot()["interactive"]["running"] == 0
@@ -0,0 +1,109 @@
+"""Single-flight: concurrent identical calls share one execution, result and exception; cross-worker leases."""
+
+import threading
+import time
+
+import pytest
+
+from core import singleflight
+from core.singleflight import Group
+
+
+def _concurrently(n: int, target) -> list:
+    results = [None] * n
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(2)
+    return results
+
+
+def test_concurrent_callers_share_one_execution():
+    group = Group("test", across_workers=False)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"summary": "shared"}
+
+    results = _concurrently(5, lambda: group.do("acme", slow))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+
+
+def test_exception_is_shared_and_key_is_released():
+    group = Group("test", across_workers=False)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError("boom")
+
+    results = _concurrently(3, lambda: group.do("acme", failing))
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert group.do("acme", lambda: "again") == "again"
+
+
+def test_different_keys_run_independently():
+    group = Group("test", across_workers=False)
+    assert group.do("a", lambda: 1) == 1
+    assert group.do("b", lambda: 2) == 2
+    with pytest.raises(ValueError):
+        group.do("c", lambda: (_ for _ in ()).throw(ValueError("x")))
+
+
+class _FakeLeases:
+    """leases table stand-in: one holder per name, no expiry."""
+
+    def __init__(self):
+        self.holders = {}
+        self.attempts = 0
+
+    def acquire(self, name, holder, ttl):
+        self.attempts += 1
+        return self.holders.setdefault(name, holder) == holder
+
+    def release(self, name, holder):
+        if self.holders.get(name) == holder:
+            del self.holders[name]
+
+
+def _leases(monkeypatch) -> _FakeLeases:
+    leases = _FakeLeases()
+    monkeypatch.setattr(singleflight, "acquire_lease", leases.acquire)
+    monkeypatch.setattr(singleflight, "release_lease", leases.release)
+    monkeypatch.setattr(singleflight, "LEASE_POLL_MIN", 0.01)
+    return leases
+
+
+def test_leader_waits_for_another_workers_lease_then_uses_its_result(monkeypatch):
+    leases = _leases(monkeypatch)
+    leases.holders["singleflight:test:acme"] = "other-worker"
+    group = Group("test", lock_timeout=2)
+    store = {}
+    threading.Timer(0.1, lambda: (store.update(acme="from other"), leases.release("singleflight:test:acme", "other-worker"))).start()
+    result = group.do("acme", lambda: pytest.fail("computed twice"), recheck=lambda: store.get("acme"))
+    assert result == "from other"
+    assert leases.attempts > 1 and leases.holders == {}
+
+
+def test_lease_is_released_after_computing_and_on_timeout_the_leader_computes(monkeypatch):
+    leases = _leases(monkeypatch)
+    group = Group("test", lock_timeout=2)
+    assert group.do("a", lambda: 1, recheck=lambda: None) == 1
+    assert leases.holders == {}
+
+    leases.holders["singleflight:test:b"] = "stuck-worker"
+    assert Group("test", lock_timeout=0.05).do("b", lambda: 2, recheck=lambda: None) == 2
+    assert leases.holders == {"singleflight:test:b": "stuck-worker"}
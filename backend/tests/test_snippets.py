@@ -0,0 +1,32 @@
+"""Research snippet selection: near-duplicate removal, relevance ranking, token-budget packing."""
+
+from core.context_window import count_tokens
+from services import snippets
+
+POST = "Acme onsite had four rounds: two coding rounds on graphs, one system design round and a behavioural chat."
+
+
+def test_near_duplicates_and_truncated_copies_are_dropped():
+    syndicated = POST.replace("behavioural chat", "behavioural chat with the hiring manager")
+    truncated = POST[:70]
+    other = "Acme recruiter screen asked about Python internals and the GIL."
+    assert snippets.dedupe([truncated, POST, syndicated, other]) == [syndicated, other]
+
+
+def test_ranking_prefers_company_interview_content_and_drops_offtopic():
+    boilerplate = "Sign in to view more. Cookie settings. Privacy policy."
+    unrelated = "Initech phone screen was an easy array question."
+    ranked = [text for _, text in snippets.rank([boilerplate, unrelated, POST], "Acme", "backend engineering")]
+    assert ranked == [POST, unrelated]
+
+
+def test_packing_respects_the_token_budget():
+    texts = [f"Acme interview round {i}: " + " ".join(f"topic{i}x{j}" for j in range(40)) for i in range(10)]
+    selected = snippets.select(texts, "Acme", token_budget=200)
+    assert 0 < len(selected) < len(texts)
+    assert sum(count_tokens(s) + 1 for s in selected) <= 200
+
+
+def test_oversized_first_snippet_is_truncated_to_fit():
+    selected = snippets.pack(["Acme interview " * 500], 100)
+    assert len(selected) == 1 and count_tokens(selected[0]) <= 120
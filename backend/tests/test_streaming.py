@@ -0,0 +1,126 @@
+"""Streaming helpers: incremental think-tag filter, stream line parsing, agent turns that come back empty,
+session writes from timed-out tools."""
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+from core import agent
+from core.llm import ThinkFilter, strip_think_tags
+from core.ollama import parse_stream_line
+from services.session import ChatSession
+
+
+def _run(chunks: list[str]) -> tuple[str, ThinkFilter]:
+    f = ThinkFilter()
+    out = "".join(f.feed(c) for c in chunks) + f.flush()
+    return out, f
+
+
+def test_think_filter_suppresses_block():
+    out, f = _run(["<think>", "plan the", " answer", "</think>", "\n\nHello", " there"])
+    assert out == "Hello there"
+    assert f.think_tokens >= 2
+    assert f.visible_tokens >= 1
+
+
+def test_think_filter_handles_tags_split_across_chunks():
+    out, _ = _run(["<thi", "nk>secret</th", "ink>vis", "ible <", "b>"])
+    assert out == "visible <b>"
+
+
+def test_think_filter_drops_unclosed_block():
+    out, _ = _run(["Answer. ", "<think>still going"])
+    assert out == "Answer. "
+
+
+def test_think_filter_matches_strip_think_tags():
+    text = "<think>a</think>  First <think>b</think>second"
+    for size in (1, 2, 3, 5, 8):
+        chunks = [text[i : i + size] for i in range(0, len(text), size)]
+        out, _ = _run(chunks)
+        assert out == strip_think_tags(text)
+
+
+def test_parse_stream_line_accepts_ndjson_and_sse():
+    assert parse_stream_line('{"message": {"content": "hi"}}') == {"message": {"content": "hi"}}
+    assert parse_stream_line('data: {"done": true}') == {"done": True}
+    assert parse_stream_line("data: [DONE]") == {"done": True}
+    assert parse_stream_line("") is None
+    assert parse_stream_line(": keep-alive") is None
+    assert parse_stream_line("not json") is None
+
+
+class _Session:
+    id = "s1"
+
+
+def _scripted_turns(monkeypatch, turns: list[list[dict]]) -> list:
+    """Make each agent turn stream the next scripted list of chunk objects; returns the calls made."""
+    calls = []
+
+    @asynccontextmanager
+    async def fake_stream(messages, setup_mode=False, affinity=None):
+        calls.append(list(messages))
+        chunks = turns[len(calls) - 1]
+
+        async def gen():
+            for obj in chunks:
+                yield obj
+
+        yield gen()
+
+    monkeypatch.setattr(agent, "_stream_ollama", fake_stream)
+    return calls
+
+
+def _agent_reply(messages: list[dict]) -> str:
+    async def collect():
+        return [item async for item in agent.agent_stream(messages, _Session())]
+
+    items = asyncio.run(collect())
+    assert items[-1] == ("", True, None)
+    return "".join(token or "" for token, _, _ in items)
+
+
+def test_empty_agent_turn_is_retried(monkeypatch):
+    calls = _scripted_turns(monkeypatch, [
+        [{"message": {"content": "<think>hmm</think>"}}, {"done": True}],
+        [{"message": {"content": "Hello"}}, {"done": True}],
+    ])
+    assert _agent_reply([{"role": "user", "content": "hi"}]) == "Hello"
+    assert len(calls) == 2
+
+
+def test_agent_sends_a_fallback_when_every_turn_is_empty(monkeypatch):
+    monkeypatch.setattr(agent, "MAX_AGENT_TURNS", 2)
+    calls = _scripted_turns(monkeypatch, [[{"message": {"content": ""}}, {"done": True}]] * 2)
+    assert _agent_reply([{"role": "user", "content": "hi"}]) == agent.EMPTY_REPLY
+    assert len(calls) == 2
+
+
+def test_timed_out_tool_cannot_change_the_session(monkeypatch):
+    release, finished = threading.Event(), threading.Event()
+
+    def slow_tool(name, args, sess):
+        sess.set(target_role="Engineer")
+        release.wait(5)
+        sess.set(company="Acme", research_context="late")
+        finished.set()
+        return "done"
+
+    monkeypatch.setattr(agent.tools, "execute_tool", slow_tool)
+    monkeypatch.setattr(agent, "TOOL_TIMEOUT", 0.05)
+    sess = ChatSession("s1", None, [])
+
+
+    async def run():
+        outcome = await agent._run_tool("slow", {}, sess)
+        release.set()  # the tool resumes only after its call has timed out
+        return outcome
+
+    result, ok = asyncio.run(run())
+    assert finished.wait(5)
+    assert not ok and "timed out" in result
+    assert sess.target_role == "Engineer"
+    assert (sess.company, sess.research_context) == ("", "")
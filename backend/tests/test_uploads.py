@@ -0,0 +1,98 @@
+"""Upload ingestion: chunked reading with size limits and hashing, bounded ZIP decompression."""
+
+import hashlib
+import io
+import os
+import zipfile
+
+import pytest
+
+from services import extraction, uploads
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_uploads_are_measured_and_hashed_without_a_copy():
+    data = os.urandom(500)
+    fileobj = io.BytesIO(data)
+    upload = uploads.spool(fileobj, "cv.pdf", 1000)
+    assert upload.sha256 == hashlib.sha256(data).hexdigest() and len(upload) == 500
+    assert upload.getvalue() == data and upload.getvalue() == data
+    upload.close()
+    assert fileobj.closed
+
+
+def test_oversized_upload_is_rejected_without_reading_it_all(monkeypatch):
+    monkeypatch.setattr(uploads, "CHUNK_BYTES", 10)
+    reader = _CountingReader(b"x" * 10_000)
+    with pytest.raises(uploads.UploadTooLarge, match="File too large"):
+        uploads.spool(reader, "huge.pdf", 50)
+    assert reader.bytes_read <= 60
+
+
+def test_total_limit_applies_across_files():
+    files = [(io.BytesIO(b"x" * 40), "a.txt"), (io.BytesIO(b"y" * 40), "b.txt")]
+    with pytest.raises(uploads.UploadTooLarge, match="Total upload size"):
+        uploads.spool_all(files, max_file_bytes=50, max_total_bytes=60)
+
+
+def test_zip_members_over_the_decompressed_limit_are_skipped(monkeypatch):
+    monkeypatch.setattr(extraction, "ZIP_MEMBER_MAX_BYTES", 1000)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("Profile.csv", "First Name,Last Name\nAda,Lovelace\n")
+        zf.writestr("Bomb.csv", "0" * 1_000_000)
+    text = extraction.extract_text_from_linkedin_zip(buf.getvalue())
+    assert "Ada | Lovelace" in text
+    assert "--- Bomb.csv ---\n[skipped: too large]" in text
+
+
+def test_uploads_are_extracted_from_their_own_file(monkeypatch):
+    monkeypatch.setattr(uploads, "CHUNK_BYTES", 8)
+    upload = uploads.spool(io.BytesIO(b"Senior engineer, 8 years of Python"), "cv.txt", 1000)
+    try:
+        assert extraction.extract([("cv.txt", upload)]) == ["Senior engineer, 8 years of Python"]
+    finally:
+        upload.close()
+
+
+def _limited_app(max_bytes: int):
+    from fastapi import FastAPI, File, UploadFile
+    from fastapi.testclient import TestClient
+
+    from main import UploadLimitMiddleware
+
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(files: list[UploadFile] = File(...)):
+        return {"sizes": [len(await f.read()) for f in files]}
+
+    return TestClient(app)
+
+
+def test_request_bodies_are_bounded_while_they_arrive():
+    client = _limited_app(max_bytes=10_000)
+    assert client.post("/upload", files=[("files", ("a.txt", b"x" * 1000))]).json() == {"sizes": [1000]}
+
+    declared = client.post("/upload", files=[("files", ("a.txt", b"x" * 20_000))])
+    assert declared.status_code == 413
+
+    def body():  # streamed without a Content-Length: cut off once past the limit
+        yield b"--b\r\nContent-Disposition: form-data; name=\"files\"; filename=\"a.txt\"\r\n\r\n"
+        for _ in range(100):
+            yield b"x" * 1000
+        yield b"\r\n--b--\r\n"
+
+    streamed = client.post("/upload", content=body(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert streamed.status_code == 413
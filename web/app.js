@@ -481,6 +481,7 @@
     let assistantBubble = null;
     let assistantRow = null;
     let typingRemoved = false;
+    let runningTools = 0;
 
     try {
       let r;
@@ -540,7 +541,14 @@
             const label = args.company
               ? "Researching " + args.company + "…"
               : toolName.replace(/_/g, " ") + "…";
-            showToolStatus(label);
+            // Tools in one turn run concurrently: "started"/"finished" events bracket each call
+            if (obj.status === "finished") {
+              runningTools = Math.max(0, runningTools - 1);
+              if (runningTools === 0) hideToolStatus();
+            } else {
+              if (obj.status === "started") runningTools += 1;
+              showToolStatus(label);
+            }
           }
 
           if (obj.token) {